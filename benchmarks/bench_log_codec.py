@@ -0,0 +1,110 @@
+"""
+Benchmark della codifica dei log: record JSON (formato precedente) contro record binari compatti.
+
+Misura i byte per evento e il tempo medio di codifica e decodifica.
+Da eseguire sul dispositivo, ad esempio con: mpremote run benchmarks/bench_log_codec.py
+"""
+import ujson
+import time
+from log_codec import (
+    LITERAL_TEMPLATE_ID,
+    level_to_code,
+    code_to_level,
+    split_template,
+    join_template,
+    encode_record,
+    decode_header,
+    decode_args
+)
+
+ITERATIONS = 200
+
+# Messaggi tipici registrati durante il funzionamento del sistema
+SAMPLE_EVENTS = [
+    ("Zona 3 avviata per 10 minuti", "INFO"),
+    ("Zona 3 arrestata", "INFO"),
+    ("Relè di sicurezza attivato", "INFO"),
+    ("Attivazione della zona 5 per 15 minuti.", "INFO"),
+    ("Attesa di 5 minuti prima della prossima zona.", "INFO"),
+    ("Memoria: 84512 bytes liberi (61.3%)", "INFO"),
+    ("Connessione WiFi client persa, tentativo di riconnessione...", "WARNING"),
+    ("Tentativo 2 fallito, riprovo...", "WARNING"),
+    ("Impossibile avviare la zona 2: Numero massimo di zone attive raggiunto (3)", "WARNING"),
+    ("Errore durante l'attivazione della zona 7: [Errno 5] EIO", "ERROR"),
+]
+
+def encode_json(seq, timestamp, level, message):
+    """Codifica nel formato JSON-lines usato in precedenza"""
+    t = time.localtime(timestamp)
+    return ujson.dumps({
+        "seq": seq,
+        "time": f"{t[3]:02d}:{t[4]:02d}:{t[5]:02d}",
+        "level": level,
+        "message": message
+    }) + '\n'
+
+def decode_json(line):
+    return ujson.loads(line)
+
+def encode_binary(templates, seq, timestamp, level, message):
+    """Codifica nel formato binario, con i modelli registrati nel dizionario templates"""
+    template, args = split_template(message)
+    template_id = templates.get(template)
+    if template_id is None:
+        template_id = len(templates)
+        templates[template] = template_id
+    return encode_record(seq, timestamp, level_to_code(level), template_id, args)
+
+def decode_binary(template_list, record):
+    payload = record[2:-2]
+    seq, timestamp, level_code, template_id, argc = decode_header(payload)
+    args = decode_args(payload, argc)
+    if template_id == LITERAL_TEMPLATE_ID:
+        message = ''.join(args)
+    else:
+        message = join_template(template_list[template_id], args)
+    return seq, timestamp, code_to_level(level_code), message
+
+def measure(label, func, items):
+    start = time.ticks_us()
+    for _ in range(ITERATIONS):
+        for item in items:
+            func(item)
+    elapsed = time.ticks_diff(time.ticks_us(), start)
+    per_event = elapsed / (ITERATIONS * len(items))
+    print(f"{label:<28} {per_event:8.1f} us/evento")
+
+def run():
+    timestamp = time.time()
+    events = [(i + 1, timestamp, level, message) for i, (message, level) in enumerate(SAMPLE_EVENTS)]
+
+    templates = {}
+    json_records = [encode_json(*event) for event in events]
+    binary_records = [encode_binary(templates, *event) for event in events]
+    template_list = [None] * len(templates)
+    for template, template_id in templates.items():
+        template_list[template_id] = template
+
+    # Verifica che la codifica binaria non perda informazioni
+    for event, record in zip(events, binary_records):
+        seq, _, level, message = decode_binary(template_list, record)
+        assert (seq, level, message) == (event[0], event[2], event[3]), message
+
+    json_bytes = sum(len(record.encode()) for record in json_records)
+    binary_bytes = sum(len(record) for record in binary_records)
+    template_bytes = sum(len(ujson.dumps(template)) + 1 for template in template_list)
+    count = len(events)
+
+    print("Byte per evento")
+    print(f"  JSON-lines                 {json_bytes / count:8.1f}")
+    print(f"  Binario                    {binary_bytes / count:8.1f}")
+    print(f"  Modelli (una sola volta)   {template_bytes:8d} byte totali")
+    print(f"  Riduzione                  {100 - binary_bytes * 100 / json_bytes:8.1f} %")
+
+    print("Tempo medio")
+    measure("  Codifica JSON", lambda e: encode_json(*e), events)
+    measure("  Codifica binaria", lambda e: encode_binary(templates, *e), events)
+    measure("  Decodifica JSON", decode_json, json_records)
+    measure("  Decodifica binaria", lambda r: decode_binary(template_list, r), binary_records)
+
+run()
@@ -0,0 +1,82 @@
+"""
+Benchmark dell'indice compilato dei programmi: verifica "il programma è previsto oggi?"
+sui dizionari dei programmi (mappa dei mesi ricostruita e data dell'ultima esecuzione
+convertita con time.mktime ad ogni verifica, come faceva check_programs) contro le
+operazioni tra interi sui record compilati.
+
+Da eseguire sul dispositivo, ad esempio con: mpremote run benchmarks/bench_program_index.py
+"""
+import time
+from date_utils import days_from_civil
+from program_index import MONTH_NUMBERS, compile_programs, next_fire_time
+
+PROGRAM_COUNT = 300
+RECURRENCES = ('giornaliero', 'giorni_alterni', 'personalizzata')
+MONTH_NAMES = list(MONTH_NUMBERS.keys())
+
+def synthetic_programs(count):
+    programs = {}
+    for i in range(count):
+        programs[str(i)] = {
+            'id': str(i),
+            'name': f"Programma {i}",
+            'activation_time': f"{i % 24:02d}:{(i * 7) % 60:02d}",
+            'months': MONTH_NAMES[i % 6:i % 6 + 4 + i % 5],
+            'recurrence': RECURRENCES[i % 3],
+            'interval_days': 2 + i % 5,
+            'last_run_date': f"2025-{1 + i % 12:02d}-{1 + i % 28:02d}",
+            'steps': [{'zone_id': i % 8, 'duration': 10}]
+        }
+    return programs
+
+def due_today_dict(program):
+    # Verifica precedente: is_program_active_in_current_month + is_program_due_today
+    now = time.localtime()
+    months_map = {
+        "Gennaio": 1, "Febbraio": 2, "Marzo": 3, "Aprile": 4,
+        "Maggio": 5, "Giugno": 6, "Luglio": 7, "Agosto": 8,
+        "Settembre": 9, "Ottobre": 10, "Novembre": 11, "Dicembre": 12
+    }
+    program_months = [months_map[month] for month in program.get('months', []) if month in months_map]
+    if now[1] not in program_months:
+        return False
+    last_run_day = -1
+    if 'last_run_date' in program:
+        year, month, day = map(int, program['last_run_date'].split('-'))
+        last_run_day = time.localtime(time.mktime((year, month, day, 0, 0, 0, 0, 0)))[7]
+    recurrence = program.get('recurrence', 'giornaliero')
+    if recurrence == 'giornaliero':
+        return last_run_day != now[7]
+    if recurrence == 'giorni_alterni':
+        return now[7] - last_run_day >= 2
+    return now[7] - last_run_day >= program.get('interval_days', 1)
+
+def measure(func, items):
+    start = time.ticks_us()
+    for item in items:
+        func(item)
+    return time.ticks_diff(time.ticks_us(), start)
+
+def run():
+    programs = synthetic_programs(PROGRAM_COUNT)
+
+    start = time.ticks_us()
+    index = compile_programs(programs)
+    compile_us = time.ticks_diff(time.ticks_us(), start)
+
+    t = time.localtime()
+    today = days_from_civil(t[0], t[1], t[2])
+    month = t[1]
+    now = time.time()
+
+    dict_us = measure(due_today_dict, programs.values())
+    compiled_us = measure(lambda compiled: compiled.is_due(today, month), index.values())
+    fire_us = measure(lambda compiled: next_fire_time(compiled, now), index.values())
+
+    print(f"Programmi: {PROGRAM_COUNT}, compilati in {compile_us} us ({compile_us / PROGRAM_COUNT:.1f} us/programma)")
+    print(f"{'Verifica':<34} {'us totali':>10} {'us/programma':>13}")
+    print(f"{'previsto oggi (dizionari)':<34} {dict_us:>10d} {dict_us / PROGRAM_COUNT:>13.1f}")
+    print(f"{'previsto oggi (indice compilato)':<34} {compiled_us:>10d} {compiled_us / len(index):>13.1f}")
+    print(f"{'prossima attivazione (indice)':<34} {fire_us:>10d} {fire_us / len(index):>13.1f}")
+
+run()
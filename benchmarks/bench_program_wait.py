@@ -0,0 +1,74 @@
+"""
+Benchmark dell'attesa dei passi di un programma: risvegli del task e latenza
+dell'interruzione, prima (asyncio.sleep(1) in un ciclo che controlla lo stato ad ogni
+secondo) e dopo (un'unica attesa sull'evento di interruzione con asyncio.wait_for).
+
+Le durate sono ridotte (STEP_SECONDS) per un'esecuzione breve: i risvegli del ciclo a
+polling crescono linearmente con la durata del passo, quelli dell'attesa sull'evento no.
+Da eseguire sul dispositivo, ad esempio con: mpremote run benchmarks/bench_program_wait.py
+"""
+import time
+import uasyncio as asyncio
+from program_state import runtime_state
+from program_manager import _wait_unless_cancelled
+
+STEP_SECONDS = 5     # Durata del passo simulato
+CANCEL_AFTER_MS = (700, 1300, 2450)  # Istanti di interruzione, non allineati al secondo
+PROGRAM_ID = 'bench'
+
+_wakeups = 0
+
+async def polling_wait(program_id, seconds):
+    # Attesa precedente: un risveglio al secondo per controllare lo stato
+    global _wakeups
+    for _ in range(seconds):
+        _wakeups += 1
+        if not runtime_state.is_running(program_id):
+            return False
+        await asyncio.sleep(1)
+    _wakeups += 1
+    return runtime_state.is_running(program_id)
+
+async def event_wait(program_id, seconds):
+    global _wakeups
+    _wakeups += 1
+    completed = await _wait_unless_cancelled(runtime_state.cancel_event, seconds)
+    _wakeups += 1
+    return completed
+
+async def measure(waiter, cancel_after_ms):
+    """Restituisce (risvegli, millisecondi tra l'interruzione e la fine dell'attesa)"""
+    global _wakeups
+    _wakeups = 0
+    runtime_state.start(PROGRAM_ID)
+    cancelled_at = None
+
+    async def cancel():
+        nonlocal cancelled_at
+        if cancel_after_ms is None:
+            return
+        await asyncio.sleep_ms(cancel_after_ms)
+        cancelled_at = time.ticks_ms()
+        runtime_state.finish()
+
+    task = asyncio.create_task(cancel())
+    await waiter(PROGRAM_ID, STEP_SECONDS)
+    ended_at = time.ticks_ms()
+    await task
+    if runtime_state.running:
+        runtime_state.finish()
+    latency = time.ticks_diff(ended_at, cancelled_at) if cancelled_at is not None else None
+    return _wakeups, latency
+
+async def run():
+    print(f"Passo di {STEP_SECONDS} s (in un programma reale fino a {3 * 3600} s per zona)")
+    print(f"{'Caso':<28} {'risvegli prima':>15} {'risvegli dopo':>14} {'latenza prima':>14} {'latenza dopo':>13}")
+    cases = [("passo completo", None)] + [(f"interruzione a {ms} ms", ms) for ms in CANCEL_AFTER_MS]
+    for label, cancel_after_ms in cases:
+        wakeups_before, latency_before = await measure(polling_wait, cancel_after_ms)
+        wakeups_after, latency_after = await measure(event_wait, cancel_after_ms)
+        before = '-' if latency_before is None else f"{latency_before} ms"
+        after = '-' if latency_after is None else f"{latency_after} ms"
+        print(f"{label:<28} {wakeups_before:>15d} {wakeups_after:>14d} {before:>14} {after:>13}")
+
+asyncio.run(run())
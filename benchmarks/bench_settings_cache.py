@@ -0,0 +1,63 @@
+"""
+Benchmark della cache delle impostazioni: letture da flash e tempo per richiesta,
+prima (lettura e parsing dall'archivio dati ad ogni chiamata) e dopo (cache in memoria).
+
+Simula un'ora di funzionamento con la pagina di controllo manuale aperta.
+Da eseguire sul dispositivo, ad esempio con: mpremote run benchmarks/bench_settings_cache.py
+"""
+import time
+import kv_store
+import settings_manager
+
+# Chiamate a load_user_settings in un'ora, per percorso
+HOURLY_CALLS = [
+    ("get_zones_status (manual.js ogni 3 s)", 1200),
+    ("check_programs (ogni 30 s)", 120),
+    ("retry_client_connection (ogni 30 s)", 120),
+    ("start_zone (route + zona, 10 avvii)", 20),
+]
+
+_opens = 0
+_builtin_open = open
+
+def _counting_open(*args, **kwargs):
+    global _opens
+    _opens += 1
+    return _builtin_open(*args, **kwargs)
+
+# Le impostazioni vengono lette dall'archivio dati (KVStore.get): le funzioni del modulo
+# cercano open tra le globali del modulo prima che tra le builtin
+kv_store.open = _counting_open
+
+def measure(loader, calls):
+    """Restituisce (aperture di file, microsecondi per chiamata)"""
+    global _opens
+    _opens = 0
+    start = time.ticks_us()
+    for _ in range(calls):
+        loader()
+    elapsed = time.ticks_diff(time.ticks_us(), start)
+    return _opens, elapsed / calls
+
+def run():
+    # Prima chiamata: la cache viene popolata (una sola lettura dalla flash)
+    settings_manager.load_user_settings()
+
+    print(f"{'Percorso':<40} {'letture prima':>14} {'letture dopo':>13} {'us prima':>9} {'us dopo':>8}")
+    total_before = 0
+    total_after = 0
+    for label, calls in HOURLY_CALLS:
+        opens_before, us_before = measure(settings_manager._read_user_settings, calls)
+        opens_after, us_after = measure(settings_manager.load_user_settings, calls)
+        total_before += opens_before
+        total_after += opens_after
+        print(f"{label:<40} {opens_before:>14d} {opens_after:>13d} {us_before:>9.0f} {us_after:>8.1f}")
+    print(f"{'Totale in un ora':<40} {total_before:>14d} {total_after:>13d}")
+
+    # Un salvataggio aggiorna la cache e la generazione senza rileggere il file
+    generation = settings_manager.get_settings_generation()
+    settings_manager.save_user_settings(settings_manager.copy_user_settings())
+    opens, _ = measure(settings_manager.load_user_settings, 100)
+    print(f"Dopo un salvataggio: generazione {generation} -> {settings_manager.get_settings_generation()}, letture {opens}")
+
+run()
@@ -0,0 +1,63 @@
+"""
+Benchmark del modello compilato delle impostazioni: memoria heap occupata da una copia
+delle impostazioni (dizionari) e dal modello compilato (SettingsModel con record ZoneConfig),
+e tempo dei percorsi frequenti con letture .get() sul dizionario contro letture di attributi.
+
+Da eseguire sul dispositivo, ad esempio con: mpremote run benchmarks/bench_settings_model.py
+"""
+import gc
+import time
+import settings_manager
+
+ITERATIONS = 500
+
+def heap_used(factory):
+    """Restituisce i byte di heap allocati dall'oggetto creato da factory"""
+    gc.collect()
+    before = gc.mem_alloc()
+    obj = factory()
+    gc.collect()
+    used = gc.mem_alloc() - before
+    obj = None
+    return used
+
+def measure(func):
+    """Restituisce i microsecondi medi per chiamata"""
+    start = time.ticks_us()
+    for _ in range(ITERATIONS):
+        func()
+    return time.ticks_diff(time.ticks_us(), start) / ITERATIONS
+
+def visible_zones_dict():
+    # Percorso precedente di get_zones_status: lettura delle zone dal dizionario
+    return [
+        (zone.get('id'), zone.get('name', f"Zona {zone.get('id') + 1}"))
+        for zone in settings_manager.load_user_settings().get('zones', [])
+        if zone.get('status') == 'show'
+    ]
+
+def visible_zones_model():
+    return [(zone.id, zone.name) for zone in settings_manager.get_settings_model().visible_zones]
+
+def start_limits_dict():
+    # Percorso precedente di start_zone: limiti letti con default
+    settings = settings_manager.load_user_settings()
+    return settings.get('max_zone_duration', 180), settings.get('max_active_zones', 1)
+
+def start_limits_model():
+    model = settings_manager.get_settings_model()
+    return model.max_zone_duration, model.max_active_zones
+
+def run():
+    settings = settings_manager.load_user_settings()
+    settings_manager.get_settings_model()
+
+    print(f"Heap copia delle impostazioni (dict): {heap_used(settings_manager.copy_user_settings)} byte")
+    print(f"Heap modello compilato:               "
+          f"{heap_used(lambda: settings_manager.SettingsModel(settings, 0))} byte")
+
+    print(f"{'Percorso':<28} {'us dict':>9} {'us modello':>11}")
+    print(f"{'zone visibili':<28} {measure(visible_zones_dict):>9.1f} {measure(visible_zones_model):>11.1f}")
+    print(f"{'limiti avvio zona':<28} {measure(start_limits_dict):>9.1f} {measure(start_limits_model):>11.1f}")
+
+run()
@@ -0,0 +1,44 @@
+"""
+Modulo con le conversioni tra date del calendario e numero di giorni.
+I giorni sono contati dal 1970-01-01 indipendentemente dall'epoca usata da time.time()
+(su ESP32 è il 2000-01-01): i calcoli partono sempre dalla data e non dal timestamp.
+"""
+
+def days_from_civil(year, month, day):
+    """
+    Converte una data nel numero di giorni trascorsi dal 1970-01-01.
+    Funziona correttamente anche a cavallo del cambio d'anno e negli anni bisestili.
+    """
+    if month <= 2:
+        year -= 1
+    era = year // 400
+    yoe = year - era * 400
+    mp = (month + 9) % 12
+    doy = (153 * mp + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+def civil_from_days(days):
+    """
+    Converte un numero di giorni dal 1970-01-01 nella data corrispondente.
+
+    Returns:
+        tuple: (anno, mese, giorno)
+    """
+    days += 719468
+    era = days // 146097
+    doe = days - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    day = doy - (153 * mp + 2) // 5 + 1
+    month = mp + 3 if mp < 10 else mp - 9
+    return yoe + era * 400 + (1 if month <= 2 else 0), month, day
+
+def date_to_days(date):
+    """Converte una data YYYY-MM-DD in giorni dal 1970-01-01, None se non valida"""
+    try:
+        year, month, day = [int(x) for x in date.split('-')]
+        return days_from_civil(year, month, day)
+    except (ValueError, AttributeError):
+        return None
@@ -0,0 +1,179 @@
+"""
+Modulo per le scritture sulla flash.
+Tutte le funzioni che salvano dati aprono i file in scrittura, li rinominano o li eliminano
+passando da qui: ogni operazione viene conteggiata per file e per chiamante (scritture, byte
+e tempo impiegato) e i byte scritti vengono registrati in flash_stats per il conteggio dei
+blocchi di cancellazione.
+"""
+import time
+import uos
+from flash_stats import record_write, get_flash_stats, reset_flash_stats
+
+MAX_TRACKED_FILES = 32  # Oltre questo numero i file vengono conteggiati insieme
+OTHER_FILES = '(altri)'
+
+# Contatori per file e per chiamante: [scritture, byte, microsecondi totali, massimo per scrittura, operazioni sui metadati]
+_files = {}
+_callers = {}
+
+def _counters(table, key):
+    counters = table.get(key)
+    if counters is None:
+        if table is _files and len(table) >= MAX_TRACKED_FILES:
+            return _counters(table, OTHER_FILES)
+        counters = [0, 0, 0, 0, 0]
+        table[key] = counters
+    return counters
+
+def _account(path, caller, size, elapsed_us, metadata=False):
+    for counters in (_counters(_files, path), _counters(_callers, caller)):
+        if metadata:
+            counters[4] += 1
+        else:
+            counters[0] += 1
+            counters[1] += size
+            if elapsed_us > counters[3]:
+                counters[3] = elapsed_us
+        counters[2] += elapsed_us
+
+class FlashFile:
+    """File aperto in scrittura tramite open_write"""
+    def __init__(self, path, mode, caller, offset):
+        self.path = path
+        self.caller = caller
+        self.offset = offset
+        # Per ogni chiamante: [posizione della prima scrittura, byte scritti]
+        self.spans = {}
+        start = time.ticks_us()
+        self.file = open(path, mode)
+        _account(path, caller, 0, time.ticks_diff(time.ticks_us(), start), True)
+
+    def write(self, data, caller=None):
+        """
+        Scrive data nel file.
+
+        Args:
+            data: Testo o byte da scrivere
+            caller: Chiamante a cui attribuire la scrittura (predefinito: quello dell'apertura)
+
+        Returns:
+            int: Numero di caratteri o byte scritti
+        """
+        caller = caller or self.caller
+        start = time.ticks_us()
+        written = self.file.write(data)
+        _account(self.path, caller, written, time.ticks_diff(time.ticks_us(), start))
+        span = self.spans.get(caller)
+        if span is None:
+            self.spans[caller] = [self.offset, written]
+        else:
+            span[1] += written
+        self.offset += written
+        return written
+
+    def close(self):
+        if self.file is None:
+            return
+        # La chiusura svuota i buffer: il tempo è attribuito al file come operazione sui metadati
+        start = time.ticks_us()
+        self.file.close()
+        self.file = None
+        _account(self.path, self.caller, 0, time.ticks_diff(time.ticks_us(), start), True)
+        # I blocchi di cancellazione vengono conteggiati una volta per apertura
+        for caller, (offset, size) in self.spans.items():
+            record_write(caller, size, offset)
+        self.spans = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+def open_write(path, mode='w', caller='other', offset=None):
+    """
+    Apre un file in scrittura conteggiando le operazioni.
+
+    Args:
+        path: Percorso del file
+        mode: "w", "wb", "a" o "ab"
+        caller: Nome del sottosistema che scrive (es. "settings", "log")
+        offset: Dimensione del file se già nota, per i file aperti in aggiunta
+
+    Returns:
+        FlashFile: File da usare con with
+
+    Raises:
+        OSError: Se il file non può essere aperto
+    """
+    if offset is None:
+        offset = 0
+        if 'a' in mode:
+            try:
+                offset = uos.stat(path)[6]
+            except OSError:
+                pass
+    return FlashFile(path, mode, caller, offset)
+
+def remove(path, caller='other'):
+    """
+    Elimina un file conteggiando l'operazione.
+
+    Raises:
+        OSError: Se il file non può essere eliminato
+    """
+    start = time.ticks_us()
+    uos.remove(path)
+    _account(path, caller, 0, time.ticks_diff(time.ticks_us(), start), True)
+
+def rename(source, destination, caller='other'):
+    """
+    Rinomina un file conteggiando l'operazione (attribuita al file di destinazione).
+
+    Raises:
+        OSError: Se il file non può essere rinominato
+    """
+    start = time.ticks_us()
+    uos.rename(source, destination)
+    _account(destination, caller, 0, time.ticks_diff(time.ticks_us(), start), True)
+
+def _format_counters(counters):
+    return {
+        'writes': counters[0],
+        'bytes': counters[1],
+        'time_us': counters[2],
+        'max_write_us': counters[3],
+        'metadata_ops': counters[4]
+    }
+
+def get_storage_metrics():
+    """
+    Restituisce le metriche di scrittura dall'avvio, per file e per chiamante.
+    Per ogni chiamante sono indicati anche i blocchi di cancellazione e la stima dei
+    byte scritti al giorno, per riconoscere i consumi anomali della flash.
+
+    Returns:
+        dict: {'uptime', 'erase_block_size', 'files': {...}, 'callers': {...}}
+    """
+    wear = get_flash_stats()
+    uptime = wear['uptime']
+    callers = {}
+    for caller, counters in _callers.items():
+        entry = _format_counters(counters)
+        entry['erase_blocks'] = wear['subsystems'].get(caller, {}).get('erase_blocks', 0)
+        # Stima calcolata solo dopo un'ora, prima è dominata dalle scritture di avvio
+        entry['bytes_per_day'] = int(counters[1] * 86400 // uptime) if uptime >= 3600 else None
+        callers[caller] = entry
+    return {
+        'uptime': uptime,
+        'erase_block_size': wear['erase_block_size'],
+        'files': {path: _format_counters(counters) for path, counters in _files.items()},
+        'callers': callers
+    }
+
+def reset_storage_metrics():
+    """Azzera le metriche di scrittura e i contatori dei blocchi di cancellazione"""
+    _files.clear()
+    _callers.clear()
+    reset_flash_stats()
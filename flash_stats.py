@@ -0,0 +1,60 @@
+"""
+Modulo per il conteggio delle scritture su flash.
+Tiene traccia, per ogni sottosistema, del numero di scritture, dei byte scritti e
+dei blocchi di cancellazione (erase block) interessati, per capire quali parti del
+codice consumano la flash.
+"""
+import time
+
+ERASE_BLOCK_SIZE = 4096  # Dimensione del blocco di cancellazione della flash (ESP32)
+
+# Contatori per sottosistema: [scritture, byte, blocchi di cancellazione]
+_stats = {}
+_started_at = time.time()
+
+def record_write(subsystem, size, offset=0):
+    """
+    Registra una scrittura su flash.
+
+    Args:
+        subsystem: Nome del sottosistema che ha scritto (es. "log", "settings")
+        size: Numero di byte scritti
+        offset: Posizione nel file da cui inizia la scrittura (0 se il file viene riscritto)
+    """
+    if size <= 0:
+        return
+    # Blocchi attraversati dall'intervallo [offset, offset + size)
+    blocks = (offset + size - 1) // ERASE_BLOCK_SIZE - offset // ERASE_BLOCK_SIZE + 1
+    counters = _stats.get(subsystem)
+    if counters is None:
+        counters = [0, 0, 0]
+        _stats[subsystem] = counters
+    counters[0] += 1
+    counters[1] += size
+    counters[2] += blocks
+
+def get_flash_stats():
+    """
+    Restituisce i contatori di scrittura dall'avvio del sistema.
+
+    Returns:
+        dict: {'uptime', 'erase_block_size', 'subsystems': {nome: {'writes', 'bytes', 'erase_blocks'}}}
+    """
+    subsystems = {}
+    for subsystem, counters in _stats.items():
+        subsystems[subsystem] = {
+            'writes': counters[0],
+            'bytes': counters[1],
+            'erase_blocks': counters[2]
+        }
+    return {
+        'uptime': time.time() - _started_at,
+        'erase_block_size': ERASE_BLOCK_SIZE,
+        'subsystems': subsystems
+    }
+
+def reset_flash_stats():
+    """Azzera tutti i contatori"""
+    global _started_at
+    _stats.clear()
+    _started_at = time.time()
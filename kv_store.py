@@ -0,0 +1,324 @@
+"""
+Modulo con l'archivio chiave-valore persistente usato per i dati in /data.
+
+I dati sono salvati in un unico file a registro (journal): ogni modifica aggiunge in fondo
+al file un record con la chiave, il valore JSON e il CRC32 del record. L'ultimo record di
+una transazione porta il flag di commit: all'avvio vengono applicate solo le transazioni
+complete, quindi una scrittura interrotta da una mancanza di corrente non lascia mai lo
+stato a metà, nemmeno quando una transazione modifica più chiavi.
+
+In memoria viene tenuto solo l'indice (posizione e lunghezza del valore di ogni chiave).
+Quando i record superati occupano più della metà del file, l'archivio viene compattato
+riscrivendo i soli valori correnti in un file temporaneo che sostituisce quello esistente.
+"""
+import ujson
+import uos
+import ustruct
+import ubinascii
+from log_manager import log_event
+import flash_io
+
+STORE_FILE = '/data/store.db'
+STORE_TEMP_FILE = '/data/store.db.tmp'
+
+# Record: operazione (u8), lunghezza chiave (u16), lunghezza valore (u32), CRC32 (u32)
+RECORD_HEADER = '<BHII'
+RECORD_HEADER_SIZE = ustruct.calcsize(RECORD_HEADER)
+OP_PUT = 1
+OP_DELETE = 2
+COMMIT_FLAG = 0x80  # Ultimo record della transazione
+
+COMPACT_MIN_BYTES = 16384  # Sotto questa dimensione il file non viene mai compattato
+
+def _record_crc(op, key, value):
+    crc = ubinascii.crc32(ustruct.pack('<BHI', op, len(key), len(value)))
+    crc = ubinascii.crc32(key, crc)
+    return ubinascii.crc32(value, crc) & 0xFFFFFFFF
+
+def _pack_record(op, key, value):
+    return ustruct.pack(RECORD_HEADER, op, len(key), len(value), _record_crc(op, key, value)) + key + value
+
+def _namespace(key):
+    """Sottosistema a cui attribuire le scritture di una chiave ("programs:3" -> "programs")"""
+    return key.split(':', 1)[0]
+
+class Transaction:
+    """
+    Insieme di modifiche scritte in modo atomico.
+    Da usare come context manager: le modifiche vengono scritte all'uscita dal blocco,
+    oppure scartate se il blocco termina con un'eccezione.
+    """
+    def __init__(self, store):
+        self.store = store
+        self.ops = []
+
+    def put(self, key, value):
+        """Imposta il valore di una chiave (qualsiasi valore serializzabile in JSON)"""
+        self.ops.append((OP_PUT, key, ujson.dumps(value).encode()))
+
+    def delete(self, key):
+        """Elimina una chiave"""
+        self.ops.append((OP_DELETE, key, b''))
+
+    def commit(self):
+        ops = self.ops
+        self.ops = []
+        self.store._commit(ops)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.ops = []
+        return False
+
+class KVStore:
+    """Archivio chiave-valore su file a registro, con transazioni e compattazione"""
+    def __init__(self, path=STORE_FILE, temp_path=STORE_TEMP_FILE):
+        self.path = path
+        self.temp_path = temp_path
+        # Chiave -> (posizione del valore nel file, lunghezza del valore)
+        self.index = {}
+        self.size = 0
+        self.live_bytes = 0
+        # True se nel file ci sono dati oltre self.size (coda incompleta non ancora eliminata
+        # dalla compattazione): le scritture sono sospese finché la compattazione non riesce
+        self.tail_dirty = False
+        self._load()
+
+    def _load(self):
+        """Ricostruisce l'indice rileggendo il registro e scarta le transazioni incomplete"""
+        self._recover_temp_file()
+        try:
+            f = open(self.path, 'rb')
+        except OSError:
+            return
+        index = {}
+        pending = []
+        offset = 0
+        valid_end = 0
+        with f:
+            while True:
+                header = f.read(RECORD_HEADER_SIZE)
+                if len(header) < RECORD_HEADER_SIZE:
+                    break
+                op, key_len, value_len, crc = ustruct.unpack(RECORD_HEADER, header)
+                key = f.read(key_len)
+                value = f.read(value_len)
+                if len(key) < key_len or len(value) < value_len or _record_crc(op, key, value) != crc:
+                    break
+                pending.append((op & ~COMMIT_FLAG, key.decode(), offset + RECORD_HEADER_SIZE + key_len, value_len))
+                offset += RECORD_HEADER_SIZE + key_len + value_len
+                if op & COMMIT_FLAG:
+                    for record_op, record_key, value_offset, length in pending:
+                        if record_op == OP_PUT:
+                            index[record_key] = (value_offset, length)
+                        else:
+                            index.pop(record_key, None)
+                    pending = []
+                    valid_end = offset
+        self.index = index
+        self.size = valid_end
+        self._update_live_bytes()
+        # Dati oltre l'ultimo commit: scrittura interrotta o record danneggiato
+        if uos.stat(self.path)[6] > valid_end:
+            log_event("Archivio dati: scartata una scrittura incompleta", "WARNING")
+            # Non è possibile troncare il file: la compattazione lo riscrive senza la coda
+            self.tail_dirty = True
+            self.compact()
+
+    def _recover_temp_file(self):
+        """
+        Completa una compattazione interrotta tra l'eliminazione del registro e la rinomina
+        del file temporaneo: se il registro manca, il file temporaneo (già completo) lo
+        sostituisce. I suoi record vengono poi verificati da _load come quelli del registro.
+        """
+        try:
+            uos.stat(self.path)
+            return
+        except OSError:
+            pass
+        try:
+            uos.stat(self.temp_path)
+        except OSError:
+            return
+        try:
+            flash_io.rename(self.temp_path, self.path, 'store_compaction')
+            log_event("Archivio dati recuperato dal file temporaneo della compattazione", "WARNING")
+        except OSError as e:
+            log_event(f"Errore durante il recupero dell'archivio dati: {e}", "ERROR")
+
+    def _update_live_bytes(self):
+        self.live_bytes = sum(RECORD_HEADER_SIZE + len(key) + length for key, (_, length) in self.index.items())
+
+    def get(self, key, default=None):
+        """
+        Restituisce il valore di una chiave.
+
+        Args:
+            key: Chiave da leggere
+            default: Valore restituito se la chiave non esiste
+
+        Returns:
+            Valore decodificato dal JSON
+        """
+        entry = self.index.get(key)
+        if entry is None:
+            return default
+        with open(self.path, 'rb') as f:
+            f.seek(entry[0])
+            data = f.read(entry[1])
+        return ujson.loads(data)
+
+    def contains(self, key):
+        return key in self.index
+
+    def keys(self, prefix=''):
+        """Restituisce le chiavi che iniziano con prefix"""
+        return [key for key in self.index if key.startswith(prefix)]
+
+    def put(self, key, value):
+        """Imposta il valore di una chiave con una transazione di una sola modifica"""
+        with self.transaction() as txn:
+            txn.put(key, value)
+
+    def delete(self, key):
+        """Elimina una chiave (nessuna scrittura se la chiave non esiste)"""
+        if key in self.index:
+            with self.transaction() as txn:
+                txn.delete(key)
+
+    def transaction(self):
+        """
+        Crea una transazione su più chiavi.
+
+        Returns:
+            Transaction: Da usare con with: le modifiche sono scritte tutte o nessuna
+        """
+        return Transaction(self)
+
+    def _commit(self, ops):
+        """
+        Aggiunge i record di una transazione in fondo al registro e aggiorna l'indice.
+
+        Raises:
+            OSError: Se la scrittura non riesce (l'indice resta invariato)
+        """
+        if not ops:
+            return
+        # Un record accodato dopo una coda incompleta non verrebbe più letto da _load
+        if self.tail_dirty and not self.compact():
+            raise OSError("Archivio dati da compattare: scritture sospese")
+        offset = self.size
+        updates = []
+        try:
+            with flash_io.open_write(self.path, 'ab', 'store', offset) as f:
+                last = len(ops) - 1
+                for i, (op, key, value) in enumerate(ops):
+                    key_bytes = key.encode()
+                    record = _pack_record(op | (COMMIT_FLAG if i == last else 0), key_bytes, value)
+                    f.write(record, _namespace(key))
+                    updates.append((op, key, offset + RECORD_HEADER_SIZE + len(key_bytes), len(value)))
+                    offset += len(record)
+        except OSError:
+            # I record già scritti non hanno il commit: la compattazione li elimina, così
+            # le transazioni successive non vengono accodate dopo dati incompleti
+            self.tail_dirty = True
+            self.compact()
+            raise
+        for op, key, value_offset, length in updates:
+            if op == OP_PUT:
+                self.index[key] = (value_offset, length)
+            else:
+                self.index.pop(key, None)
+        self.size = offset
+        self._update_live_bytes()
+        if self.size > COMPACT_MIN_BYTES and self.size > 2 * self.live_bytes:
+            self.compact()
+
+    def compact(self):
+        """
+        Riscrive il registro con i soli valori correnti.
+
+        Returns:
+            boolean: True se la compattazione è riuscita
+        """
+        index = {}
+        offset = 0
+        try:
+            with flash_io.open_write(self.temp_path, 'wb', 'store_compaction') as out:
+                keys = list(self.index.keys())
+                last = len(keys) - 1
+                source = open(self.path, 'rb') if keys else None
+                for i, key in enumerate(keys):
+                    value_offset, length = self.index[key]
+                    source.seek(value_offset)
+                    value = source.read(length)
+                    key_bytes = key.encode()
+                    record = _pack_record(OP_PUT | (COMMIT_FLAG if i == last else 0), key_bytes, value)
+                    out.write(record)
+                    index[key] = (offset + RECORD_HEADER_SIZE + len(key_bytes), length)
+                    offset += len(record)
+                if source:
+                    source.close()
+            try:
+                flash_io.rename(self.temp_path, self.path, 'store_compaction')
+            except OSError:
+                flash_io.remove(self.path, 'store_compaction')
+                flash_io.rename(self.temp_path, self.path, 'store_compaction')
+        except OSError as e:
+            log_event(f"Errore durante la compattazione dell'archivio dati: {e}", "ERROR")
+            return False
+        self.index = index
+        self.size = offset
+        self.live_bytes = offset
+        self.tail_dirty = False
+        log_event(f"Archivio dati compattato: {offset} byte", "DEBUG")
+        return True
+
+    def stats(self):
+        """
+        Returns:
+            dict: {'keys', 'size', 'live_bytes'}
+        """
+        return {'keys': len(self.index), 'size': self.size, 'live_bytes': self.live_bytes}
+
+_store = None
+
+def get_store():
+    """Restituisce l'archivio dei dati di sistema, aprendolo al primo utilizzo"""
+    global _store
+    if _store is None:
+        try:
+            uos.stat('/data')
+        except OSError:
+            uos.mkdir('/data')
+        _store = KVStore()
+    return _store
+
+def import_json_file(key, path):
+    """
+    Importa nell'archivio un file JSON del formato precedente e lo elimina.
+    Non fa nulla se la chiave esiste già o se il file non c'è.
+
+    Returns:
+        Valore importato, None se non è stato importato nulla
+    """
+    store = get_store()
+    if store.contains(key):
+        return None
+    try:
+        with open(path, 'r') as f:
+            value = ujson.load(f)
+    except OSError:
+        return None
+    except ValueError as e:
+        log_event(f"File {path} non valido, non importato: {e}", "WARNING")
+        return None
+    store.put(key, value)
+    flash_io.remove(path, key)
+    log_event(f"File {path} importato nell'archivio dati", "INFO")
+    return value
@@ -0,0 +1,162 @@
+"""
+Modulo per la codifica binaria compatta dei log di sistema.
+
+Ogni messaggio viene separato in un modello (template) e nei suoi argomenti numerici:
+"Zona 3 avviata per 10 minuti" diventa il modello "Zona \\x00 avviata per \\x00 minuti"
+con argomenti ["3", "10"]. Il modello viene registrato una sola volta e nel record
+viene salvato solo il suo identificativo.
+
+Formato del record (little endian):
+    u16 lunghezza del contenuto
+    u32 sequenza
+    u32 timestamp
+    u8  livello
+    u16 identificativo del modello
+    u8  numero di argomenti, seguito da ogni argomento come u8 lunghezza + byte UTF-8
+    u16 lunghezza del contenuto (ripetuta in coda per poter leggere i record a ritroso)
+
+Un record di riepilogo di messaggi ripetuti ha il bit REPEAT_FLAG impostato nel livello
+e, subito dopo l'intestazione, u16 numero di ripetizioni e u32 timestamp dell'ultima;
+il timestamp dell'intestazione è quello della prima ripetizione.
+"""
+import ustruct
+
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+DEFAULT_LEVEL = 1  # INFO
+
+ARG_PLACEHOLDER = '\x00'
+LITERAL_TEMPLATE_ID = 0xFFFF  # Il messaggio è salvato per intero, diviso in argomenti
+MAX_ARG_LENGTH = 255
+LITERAL_CHUNK_CHARS = 63      # 63 caratteri UTF-8 occupano al massimo 252 byte
+
+HEADER_FORMAT = '<IIBHB'  # sequenza, timestamp, livello, modello, numero di argomenti
+HEADER_SIZE = ustruct.calcsize(HEADER_FORMAT)
+LENGTH_SIZE = 2
+LEVEL_OFFSET = 8          # Posizione del livello nell'intestazione
+
+REPEAT_FLAG = 0x80        # Bit del livello che indica un record di riepilogo delle ripetizioni
+LEVEL_MASK = 0x7F
+REPEAT_FORMAT = '<HI'     # numero di ripetizioni, timestamp dell'ultima ripetizione
+REPEAT_SIZE = ustruct.calcsize(REPEAT_FORMAT)
+MAX_REPEAT_COUNT = 0xFFFF
+
+def level_to_code(level):
+    """Converte il nome del livello nel codice numerico (INFO se sconosciuto)"""
+    try:
+        return LOG_LEVELS.index(level)
+    except ValueError:
+        return DEFAULT_LEVEL
+
+def code_to_level(code):
+    """Converte il codice numerico nel nome del livello"""
+    code &= LEVEL_MASK
+    if 0 <= code < len(LOG_LEVELS):
+        return LOG_LEVELS[code]
+    return LOG_LEVELS[DEFAULT_LEVEL]
+
+def split_template(message):
+    """
+    Separa un messaggio nel modello e nei suoi argomenti numerici.
+
+    Returns:
+        tuple: (modello, lista di argomenti)
+    """
+    template = []
+    args = []
+    start = -1
+    for i, char in enumerate(message):
+        if '0' <= char <= '9':
+            if start < 0:
+                start = i
+        else:
+            if start >= 0:
+                args.append(message[start:i])
+                template.append(ARG_PLACEHOLDER)
+                start = -1
+            template.append(char)
+    if start >= 0:
+        args.append(message[start:])
+        template.append(ARG_PLACEHOLDER)
+    return ''.join(template), args
+
+def split_literal(message):
+    """Divide un messaggio da salvare per intero in argomenti che rientrano in MAX_ARG_LENGTH"""
+    return [message[i:i + LITERAL_CHUNK_CHARS] for i in range(0, len(message), LITERAL_CHUNK_CHARS)]
+
+def join_template(template, args):
+    """Ricostruisce il messaggio originale a partire dal modello e dagli argomenti"""
+    if not args:
+        return template
+    parts = template.split(ARG_PLACEHOLDER)
+    message = [parts[0]]
+    for i in range(1, len(parts)):
+        message.append(args[i - 1] if i - 1 < len(args) else '')
+        message.append(parts[i])
+    return ''.join(message)
+
+def encode_record(seq, timestamp, level_code, template_id, args, repeat_count=1, last_timestamp=0):
+    """
+    Codifica un record di log.
+    Con repeat_count maggiore di 1 viene codificato un record di riepilogo delle ripetizioni.
+
+    Returns:
+        bytes: Record completo di lunghezza iniziale e finale
+    """
+    encoded_args = []
+    args_size = 0
+    for arg in args:
+        data = arg.encode()[:MAX_ARG_LENGTH]
+        encoded_args.append(data)
+        args_size += 1 + len(data)
+
+    repeat_size = REPEAT_SIZE if repeat_count > 1 else 0
+    if repeat_size:
+        level_code |= REPEAT_FLAG
+    length = HEADER_SIZE + repeat_size + args_size
+    record = bytearray(LENGTH_SIZE + length + LENGTH_SIZE)
+    ustruct.pack_into('<H', record, 0, length)
+    ustruct.pack_into(HEADER_FORMAT, record, LENGTH_SIZE, seq, int(timestamp), level_code, template_id, len(encoded_args))
+    offset = LENGTH_SIZE + HEADER_SIZE
+    if repeat_size:
+        ustruct.pack_into(REPEAT_FORMAT, record, offset, min(repeat_count, MAX_REPEAT_COUNT), int(last_timestamp))
+        offset += repeat_size
+    for data in encoded_args:
+        record[offset] = len(data)
+        record[offset + 1:offset + 1 + len(data)] = data
+        offset += 1 + len(data)
+    ustruct.pack_into('<H', record, offset, length)
+    return record
+
+def decode_header(payload):
+    """
+    Decodifica l'intestazione del contenuto di un record (senza le lunghezze).
+
+    Il codice del livello può contenere REPEAT_FLAG: va confrontato con LEVEL_MASK applicata.
+
+    Returns:
+        tuple: (sequenza, timestamp, codice livello, identificativo modello, numero di argomenti)
+    """
+    return ustruct.unpack_from(HEADER_FORMAT, payload, 0)
+
+def decode_repeat(payload):
+    """
+    Decodifica le informazioni di ripetizione di un record.
+
+    Returns:
+        tuple: (numero di ripetizioni, timestamp dell'ultima), None se il record non è un riepilogo
+    """
+    if payload[LEVEL_OFFSET] & REPEAT_FLAG:
+        return ustruct.unpack_from(REPEAT_FORMAT, payload, HEADER_SIZE)
+    return None
+
+def decode_args(payload, count):
+    """Decodifica gli argomenti dal contenuto di un record"""
+    args = []
+    offset = HEADER_SIZE
+    if payload[LEVEL_OFFSET] & REPEAT_FLAG:
+        offset += REPEAT_SIZE
+    for _ in range(count):
+        size = payload[offset]
+        args.append(bytes(payload[offset + 1:offset + 1 + size]).decode())
+        offset += 1 + size
+    return args
@@ -0,0 +1,143 @@
+"""
+Modulo per l'esportazione dei log di sistema in streaming.
+Produce i log di un intervallo di date in formato NDJSON o CSV, un blocco alla volta,
+con compressione opzionale al volo (gzip o deflate): la memoria usata non dipende dal
+numero di log esportati.
+"""
+import io
+import ujson
+from log_manager import iter_logs_range
+
+try:
+    import deflate
+except ImportError:
+    deflate = None
+
+EXPORT_CHUNK_SIZE = 1024  # Byte (non compressi) accumulati prima di inviare un blocco
+EXPORT_WBITS = 10         # Finestra di compressione di 1KB, per limitare la memoria usata
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+}
+CSV_COLUMNS = ('seq', 'date', 'time', 'level', 'message', 'repeat', 'last_date', 'last_time')
+
+def _valid_date(date):
+    """Verifica che una data sia nel formato YYYY-MM-DD"""
+    try:
+        year, month, day = [int(x) for x in date.split('-')]
+        return len(date) == 10 and 1 <= month <= 12 and 1 <= day <= 31
+    except (ValueError, AttributeError):
+        return False
+
+def _csv_field(value):
+    """Formatta un campo CSV, racchiudendo tra virgolette i testi"""
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return '"' + value.replace('"', '""') + '"'
+    return str(value)
+
+def _format_ndjson(entry):
+    return ujson.dumps(entry) + '\n'
+
+def _format_csv(entry):
+    return ','.join(_csv_field(entry.get(column)) for column in CSV_COLUMNS) + '\n'
+
+class _ChunkWriter(io.IOBase):
+    """Stream che raccoglie i byte prodotti dal compressore fino al prossimo blocco"""
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def _create_compressor(encoding):
+    """
+    Crea il compressore per la codifica richiesta.
+
+    Returns:
+        tuple: (writer, stream di compressione), (None, None) se non disponibile
+    """
+    if deflate is None or encoding not in ('gzip', 'deflate'):
+        return None, None
+    try:
+        writer = _ChunkWriter()
+        stream = deflate.DeflateIO(writer, deflate.GZIP if encoding == 'gzip' else deflate.ZLIB, EXPORT_WBITS)
+        if not hasattr(stream, 'write'):
+            # Firmware compilato senza supporto alla compressione
+            return None, None
+        return writer, stream
+    except Exception as e:
+        print(f"Compressione {encoding} non disponibile: {e}")
+        return None, None
+
+class LogExportStream:
+    """
+    Iteratore asincrono da usare come corpo di una risposta Microdot.
+    MicroPython non supporta i generatori asincroni: ogni blocco viene prodotto da __anext__.
+    """
+    def __init__(self, date_from=None, date_to=None, level=None, export_format='ndjson', encoding=None):
+        """
+        Args:
+            date_from: Prima data inclusa (YYYY-MM-DD)
+            date_to: Ultima data inclusa (YYYY-MM-DD)
+            level: Livello o elenco di livelli separati da virgola
+            export_format: "ndjson" o "csv"
+            encoding: "gzip", "deflate" o None
+
+        Raises:
+            ValueError: Se il formato o le date non sono validi
+        """
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Formato non supportato: {export_format}")
+        for date in (date_from, date_to):
+            if date is not None and not _valid_date(date):
+                raise ValueError(f"Data non valida: {date}")
+        self.content_type, self.extension = EXPORT_FORMATS[export_format]
+        self.format_entry = _format_csv if export_format == 'csv' else _format_ndjson
+        self.header = ','.join(CSV_COLUMNS) + '\n' if export_format == 'csv' else ''
+        self.entries = iter_logs_range(date_from, date_to, level)
+        self.writer, self.compressor = _create_compressor(encoding)
+        # Codifica effettivamente usata (None se la compressione non è disponibile)
+        self.encoding = encoding if self.compressor else None
+        self.done = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self.done:
+            parts = [self.header] if self.header else []
+            size = len(self.header)
+            self.header = ''
+            for entry in self.entries:
+                line = self.format_entry(entry)
+                parts.append(line)
+                size += len(line)
+                if size >= EXPORT_CHUNK_SIZE:
+                    break
+            else:
+                self.done = True
+            data = ''.join(parts).encode()
+            parts = None
+            if self.compressor:
+                if data:
+                    self.compressor.write(data)
+                if self.done:
+                    self.compressor.close()
+                data = self.writer.take()
+            if data:
+                return data
+        raise StopAsyncIteration
+
+    async def aclose(self):
+        # Chiude il generatore anche se il client interrompe il download
+        self.entries.close()
+        self.done = True
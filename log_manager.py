@@ -1,121 +1,1166 @@
 """
 Modulo per la gestione dei log di sistema.
 Gestisce la registrazione, rotazione e recupero dei log di sistema.
+
+I log sono divisi in un file (segmento) per ogni giorno di calendario, ad esempio
+/data/logs/2026-10-18.bin. Ogni segmento contiene record binari compatti (vedi
+log_codec): un nuovo evento è un'aggiunta in coda al segmento del giorno, la lettura
+avviene un record alla volta e la rotazione elimina interi segmenti. I messaggi sono
+salvati come modello + argomenti: i modelli sono registrati una sola volta in
+TEMPLATE_FILE e i record vengono ricostruiti nel formato {date, time, level, message}
+solo quando vengono letti.
+
+log_event non scrive direttamente su flash: inserisce l'evento in un buffer circolare
+in RAM, preallocato e di dimensione fissa, che viene salvato a blocchi dal task
+log_flush_loop (ogni LOG_FLUSH_INTERVAL secondi o al raggiungimento della soglia
+LOG_BUFFER_HIGH_WATER). Gli errori vengono salvati immediatamente.
+
+Oltre al limite di MAX_LOG_DAYS giorni, l'archivio ha un limite in byte (LOG_MAX_BYTES):
+un giorno con molti eventi viene diviso in parti di al massimo LOG_SEGMENT_MAX_BYTES
+(2026-10-18.bin, 2026-10-18.1.bin, ...) e, superato il limite, vengono eliminate le
+parti più vecchie. Il limite comprende il file dei modelli, che dopo ogni eliminazione
+viene ricostruito con i soli modelli ancora usati dai segmenti rimasti: gli id liberati
+vengono riassegnati ai nuovi messaggi. Le scritture sono conteggiate in flash_stats.
+
+Gli eventi identici consecutivi (stesso livello e messaggio, a meno di LOG_COALESCE_WINDOW
+secondi l'uno dall'altro) non vengono salvati singolarmente: dopo il primo, le ripetizioni
+vengono contate in RAM e salvate come un unico record di riepilogo con il numero di
+ripetizioni e i timestamp della prima e dell'ultima, al più ogni LOG_COALESCE_WINDOW secondi.
+
+Oltre alla flash, gli eventi vengono inviati ad altre destinazioni (sink, vedi log_sinks):
+console seriale, buffer in memoria degli ultimi eventi e syslog UDP. Ogni sink ha il
+proprio livello minimo (configure_sinks). L'invio avviene nel task log_flush_loop,
+che legge lo stesso buffer circolare: log_event non stampa e non scrive mai direttamente,
+tranne per gli errori e quando il buffer è pieno.
 """
 import ujson
+import ustruct
 import time
 import uos
 import gc
+import uasyncio as asyncio
+import flash_io
+from date_utils import date_to_days
+from log_sinks import ConsoleSink, MemorySink, SyslogSink, SYSLOG_DEFAULT_PORT
+from log_codec import (
+    LENGTH_SIZE,
+    HEADER_SIZE,
+    LEVEL_OFFSET,
+    LITERAL_TEMPLATE_ID,
+    LEVEL_MASK,
+    LOG_LEVELS,
+    level_to_code,
+    code_to_level,
+    split_template,
+    split_literal,
+    join_template,
+    encode_record,
+    decode_header,
+    decode_repeat,
+    decode_args
+)
 
-LOG_FILE = '/data/system_log.json'
+LOG_DIR = '/data/logs'
+SEGMENT_EXT = '.bin'
+LOG_SEQ_FILE = '/data/logs/last_seq'    # Limite superiore dei numeri di sequenza già assegnati (vedi LOG_SEQ_RESERVE)
+TEMPLATE_FILE = '/data/logs/templates'  # Modelli dei messaggi, uno per riga (stringa JSON); l'id è il numero di riga
+TEMPLATE_TEMP_FILE = '/data/logs/templates.tmp'  # File temporaneo usato durante la compattazione dei modelli
+LEGACY_SEGMENT_EXT = '.jsonl'           # Vecchi segmenti giornalieri in formato JSON-lines
+LEGACY_LOG_FILES = (
+    '/data/system_log.json',   # Vecchio formato: un unico array JSON
+    '/data/system_log.jsonl',  # Vecchio formato: un unico file JSON-lines
+)
 MAX_LOG_DAYS = 10  # Mantiene log per 10 giorni come richiesto nel prompt
+MAX_TEMPLATES = 256  # Oltre questo numero i nuovi messaggi vengono salvati per intero
+LOG_SEQ_RESERVE = 256  # Numeri di sequenza riservati ad ogni salvataggio di LOG_SEQ_FILE
+LOG_MAX_BYTES = 128 * 1024         # Spazio massimo occupato dai segmenti di log e dai modelli
+LOG_SEGMENT_MAX_BYTES = 16 * 1024  # Dimensione massima di una parte di segmento
+
+LOG_BUFFER_SIZE = 32        # Numero di eventi contenuti nel buffer in RAM
+LOG_BUFFER_HIGH_WATER = 24  # Oltre questa soglia il task di salvataggio viene risvegliato
+LOG_FLUSH_INTERVAL = 10     # Secondi tra un salvataggio periodico e l'altro
+LOG_COALESCE_WINDOW = 600   # Secondi entro cui un evento identico al precedente viene accorpato
+LOG_MEMORY_SIZE = 50        # Numero di eventi recenti mantenuti dal sink in memoria
+
+# Livello minimo di ogni sink ("OFF" o None per disattivarlo)
+DEFAULT_LOG_SINKS = {
+    'flash': {'level': 'INFO'},
+    'console': {'level': 'DEBUG'},
+    'memory': {'level': 'DEBUG'},
+    'syslog': {'level': 'OFF', 'host': '', 'port': SYSLOG_DEFAULT_PORT, 'hostname': 'IrrigationSystem'}
+}
+LEVEL_OFF = len(LOG_LEVELS)  # Livello superiore a tutti: il sink non riceve eventi
+
+LOG_READ_BLOCK_SIZE = 512   # Byte letti per volta quando un segmento viene letto a ritroso
+DEFAULT_LOG_PAGE_SIZE = 50  # Numero di log restituiti per pagina se non specificato
+MAX_LOG_PAGE_SIZE = 200     # Numero massimo di log restituiti per pagina
+
+# Stato interno del modulo
+_initialized = False
+_last_prune_date = None
+
+_last_seq = 0  # Numero di sequenza dell'ultimo evento registrato (crescente, anche tra un riavvio e l'altro)
+_seq_reserved = 0  # Numeri di sequenza fino a questo sono già riservati in LOG_SEQ_FILE
+
+_store_bytes = 0      # Byte occupati dai segmenti di log
+_head_segment = None  # [data, parte, dimensione] del segmento più recente, evita di rileggere la directory
+
+# Modelli dei messaggi registrati: modello -> id e id -> modello (None se l'id è libero)
+_template_ids = {}
+_templates = []
+_templates_bytes = 0      # Byte occupati da TEMPLATE_FILE
+_templates_stale = False  # Segmenti eliminati dopo l'ultima compattazione dei modelli
+
+# Buffer circolare preallocato: ogni slot è
+# [sequenza, timestamp, livello, messaggio, ripetizioni, timestamp dell'ultima ripetizione]
+_ring = [[0, 0, None, None, 1, 0] for _ in range(LOG_BUFFER_SIZE)]
+_ring_head = 0   # Indice del prossimo slot da scrivere
+_ring_count = 0  # Numero di eventi in attesa di salvataggio su flash
+_dispatch_count = 0  # Numero di eventi in attesa di invio agli altri sink
+_last_flush = time.ticks_ms()
+_flush_event = asyncio.Event()
+
+# Sink configurati
+_flash_level = level_to_code(DEFAULT_LOG_SINKS['flash']['level'])
+_sinks = [  # Coppie [livello minimo, sink]
+    [level_to_code(DEFAULT_LOG_SINKS['console']['level']), ConsoleSink()],
+    [level_to_code(DEFAULT_LOG_SINKS['memory']['level']), MemorySink(LOG_MEMORY_SIZE)],
+]
+_memory_sink = _sinks[1][1]
+_min_level = 0  # Gli eventi sotto questo livello non interessano a nessun sink
+
+# Ultimo evento registrato e ripetizioni non ancora salvate
+_last_level = None
+_last_message = None
+_last_timestamp = 0
+_repeat_count = 0  # Ripetizioni accumulate dopo l'ultimo evento salvato
+_repeat_first = 0  # Timestamp della prima ripetizione accumulata
 
-def _ensure_log_file_exists():
-    """Crea il file di log se non esiste"""
+def _file_exists(path):
+    """Verifica se un file esiste"""
     try:
-        uos.stat(LOG_FILE)
+        uos.stat(path)
+        return True
     except OSError:
-        # File non esiste, crealo
-        try:
-            with open(LOG_FILE, 'w') as f:
-                ujson.dump([], f)
-        except OSError:
-            # Assicurati che la directory data esista
+        return False
+
+def _ensure_log_dir_exists():
+    """Crea la directory dei log se non esiste"""
+    for path in ('/data', LOG_DIR):
+        if not _file_exists(path):
             try:
-                uos.mkdir('/data')
-                with open(LOG_FILE, 'w') as f:
-                    ujson.dump([], f)
+                uos.mkdir(path)
             except OSError:
                 pass
 
-def _get_current_date():
-    """Ottiene la data corrente nel formato YYYY-MM-DD"""
-    t = time.localtime()
+def _segment_path(date, part=0, ext=SEGMENT_EXT):
+    """Restituisce il percorso di una parte del segmento di log per una data (YYYY-MM-DD)"""
+    if part:
+        return f"{LOG_DIR}/{date}.{part}{ext}"
+    return f"{LOG_DIR}/{date}{ext}"
+
+def _list_segments(ext=SEGMENT_EXT):
+    """
+    Restituisce i segmenti di log presenti, in ordine cronologico.
+
+    Returns:
+        list: Coppie (data YYYY-MM-DD, numero della parte)
+    """
+    try:
+        names = uos.listdir(LOG_DIR)
+    except OSError:
+        return []
+    segments = []
+    for name in names:
+        if not name.endswith(ext):
+            continue
+        date, _, part = name[:-len(ext)].partition('.')
+        try:
+            segments.append((date, int(part) if part else 0))
+        except ValueError:
+            continue
+    segments.sort()
+    return segments
+
+def _segment_size(date, part=0):
+    """Restituisce la dimensione in byte di una parte del segmento, 0 se non esiste"""
+    try:
+        return uos.stat(_segment_path(date, part))[6]
+    except OSError:
+        return 0
+
+def _cursor_to_timestamp(cursor):
+    """
+    Converte un cursore ("YYYY-MM-DD HH:MM:SS" o "YYYY-MM-DD") nel timestamp locale corrispondente.
+
+    Returns:
+        int: Timestamp, None se il cursore non è valido
+    """
+    try:
+        date, _, clock = cursor.strip().partition(' ')
+        year, month, day = [int(x) for x in date.split('-')]
+        hour, minute, second = 0, 0, 0
+        if clock:
+            parts = [int(x) for x in clock.split(':')]
+            hour, minute = parts[0], parts[1]
+            second = parts[2] if len(parts) > 2 else 0
+        return int(time.mktime((year, month, day, hour, minute, second, 0, 0)))
+    except (ValueError, IndexError, AttributeError, OverflowError):
+        return None
+
+def _format_date(t):
+    """Formatta una struct time nel formato YYYY-MM-DD"""
     return f"{t[0]}-{t[1]:02d}-{t[2]:02d}"
 
-def _get_current_time():
-    """Ottiene l'ora corrente nel formato HH:MM:SS"""
-    t = time.localtime()
+def _format_time(t):
+    """Formatta una struct time nel formato HH:MM:SS"""
     return f"{t[3]:02d}:{t[4]:02d}:{t[5]:02d}"
 
+# -------- Modelli dei messaggi --------
+
+def _load_templates():
+    """Carica in memoria i modelli dei messaggi registrati"""
+    global _template_ids, _templates, _templates_bytes
+    _template_ids = {}
+    _templates = []
+    if not _file_exists(TEMPLATE_FILE) and _file_exists(TEMPLATE_TEMP_FILE):
+        # Compattazione interrotta tra l'eliminazione del file e la rinomina di quello nuovo
+        try:
+            flash_io.rename(TEMPLATE_TEMP_FILE, TEMPLATE_FILE, 'log')
+        except OSError as e:
+            print(f"Errore durante il recupero dei modelli di log: {e}")
+    try:
+        with open(TEMPLATE_FILE, 'r') as f:
+            for line in f:
+                try:
+                    template = ujson.loads(line)
+                except ValueError:
+                    # Riga corrotta: l'id va comunque occupato per non spostare i successivi
+                    template = ''
+                if template is not None:
+                    _template_ids[template] = len(_templates)
+                _templates.append(template)
+    except OSError:
+        pass
+    try:
+        _templates_bytes = uos.stat(TEMPLATE_FILE)[6]
+    except OSError:
+        _templates_bytes = 0
+
+def _write_templates():
+    """
+    Riscrive TEMPLATE_FILE con i modelli in memoria (null per gli id liberi), passando
+    da un file temporaneo per non perdere i modelli in caso di mancanza di corrente.
+
+    Returns:
+        boolean: True se il file è stato riscritto
+    """
+    global _templates_bytes
+    try:
+        size = 0
+        with flash_io.open_write(TEMPLATE_TEMP_FILE, 'w', 'log') as f:
+            for template in _templates:
+                line = ujson.dumps(template) + '\n'
+                f.write(line)
+                size += len(line.encode())
+        try:
+            flash_io.rename(TEMPLATE_TEMP_FILE, TEMPLATE_FILE, 'log')
+        except OSError:
+            # Alcuni filesystem non sostituiscono un file esistente con la rinomina
+            flash_io.remove(TEMPLATE_FILE, 'log')
+            flash_io.rename(TEMPLATE_TEMP_FILE, TEMPLATE_FILE, 'log')
+    except OSError as e:
+        print(f"Errore durante la scrittura dei modelli di log: {e}")
+        return False
+    _templates_bytes = size
+    return True
+
+def _compact_templates():
+    """
+    Libera gli id dei modelli non più usati dai segmenti rimasti e riscrive TEMPLATE_FILE.
+    Va chiamata solo con i segmenti chiusi, dopo l'eliminazione di segmenti.
+    """
+    global _templates_stale
+    _templates_stale = False
+    if not _templates:
+        return
+    used = bytearray(len(_templates))
+    for date, part in _list_segments():
+        for payload in _iter_segment_records(date, part):
+            template_id = decode_header(payload)[3]
+            if template_id < len(used):
+                used[template_id] = 1
+    freed = 0
+    for template_id, template in enumerate(_templates):
+        if template is not None and not used[template_id]:
+            if _template_ids.get(template) == template_id:
+                del _template_ids[template]
+            _templates[template_id] = None
+            freed += 1
+    if not freed:
+        return
+    # Gli id liberi in fondo vengono eliminati: i nuovi modelli tornano ad essere aggiunti in coda
+    while _templates and _templates[-1] is None:
+        _templates.pop()
+    if _write_templates():
+        print(f"Modelli di log compattati: {freed} liberati, {len(_templates)} righe")
+
+def _intern_template(template):
+    """
+    Restituisce l'id del modello, registrandolo se è nuovo.
+
+    Returns:
+        int: Id del modello, None se non è stato possibile registrarlo
+    """
+    global _templates_bytes
+    template_id = _template_ids.get(template)
+    if template_id is not None:
+        return template_id
+    if len(_templates) >= MAX_TEMPLATES:
+        # Riusa un id liberato dalla compattazione: il file viene riscritto
+        try:
+            template_id = _templates.index(None)
+        except ValueError:
+            return None
+        _templates[template_id] = template
+        if not _write_templates():
+            _templates[template_id] = None
+            return None
+        _template_ids[template] = template_id
+        return template_id
+    line = ujson.dumps(template) + '\n'
+    try:
+        with flash_io.open_write(TEMPLATE_FILE, 'a', 'log', _templates_bytes) as f:
+            f.write(line)
+    except OSError as e:
+        print(f"Errore durante la registrazione del modello di log: {e}")
+        return None
+    _templates_bytes += len(line.encode())
+    template_id = len(_templates)
+    _template_ids[template] = template_id
+    _templates.append(template)
+    return template_id
+
+def _reset_templates():
+    """Elimina tutti i modelli registrati (da usare solo quando non restano segmenti)"""
+    global _template_ids, _templates, _templates_bytes, _templates_stale
+    _template_ids = {}
+    _templates = []
+    _templates_bytes = 0
+    _templates_stale = False
+    try:
+        flash_io.remove(TEMPLATE_FILE, 'log')
+    except OSError:
+        pass
+
+def _encode_message(seq, timestamp, level, message, repeat_count=1, last_timestamp=0):
+    """Codifica un evento nel record binario, registrando il modello del messaggio se necessario"""
+    template, args = split_template(message)
+    template_id = None
+    if len(args) <= 255:
+        template_id = _intern_template(template)
+    if template_id is None:
+        template_id = LITERAL_TEMPLATE_ID
+        args = split_literal(message)
+    return encode_record(seq, timestamp, level_to_code(level), template_id, args, repeat_count, last_timestamp)
+
+def _decode_record(payload):
+    """
+    Ricostruisce un log nel formato {seq, date, time, level, message} dal contenuto di un record.
+    I record di riepilogo contengono anche repeat (numero di ripetizioni), last_date e last_time.
+    """
+    seq, timestamp, level_code, template_id, argc = decode_header(payload)
+    args = decode_args(payload, argc)
+    if template_id == LITERAL_TEMPLATE_ID:
+        message = ''.join(args)
+    elif template_id < len(_templates):
+        message = join_template(_templates[template_id], args)
+    else:
+        message = f"[modello {template_id} non disponibile] " + ' '.join(args)
+    repeat = decode_repeat(payload) or (1, 0)
+    return _format_entry(seq, timestamp, code_to_level(level_code), message, repeat[0], repeat[1])
+
+def _format_entry(seq, timestamp, level, message, repeat_count=1, last_timestamp=0):
+    """
+    Restituisce un log nel formato {seq, date, time, level, message}.
+    I riepiloghi delle ripetizioni contengono anche repeat (numero di ripetizioni), last_date e last_time.
+    """
+    t = time.localtime(timestamp)
+    entry = {
+        "seq": seq,
+        "date": _format_date(t),
+        "time": _format_time(t),
+        "level": level,
+        "message": message
+    }
+    if repeat_count > 1:
+        last = time.localtime(last_timestamp)
+        entry["repeat"] = repeat_count
+        entry["last_date"] = _format_date(last)
+        entry["last_time"] = _format_time(last)
+    return entry
+
+# -------- Scrittura dei segmenti --------
+
+def _last_part(date):
+    """
+    Restituisce l'ultima parte del segmento di una data e la sua dimensione.
+
+    Returns:
+        tuple: (numero della parte, dimensione in byte)
+    """
+    if _head_segment and _head_segment[0] == date:
+        return _head_segment[1], _head_segment[2]
+    parts = [part for segment_date, part in _list_segments() if segment_date == date]
+    part = parts[-1] if parts else 0
+    return part, _segment_size(date, part)
+
+class _SegmentWriter:
+    """
+    Scrive record in coda ai segmenti giornalieri.
+    Il segmento resta aperto finché la data degli eventi non cambia; quando la parte
+    corrente supera LOG_SEGMENT_MAX_BYTES si passa alla parte successiva.
+    """
+    def __init__(self, prune=False):
+        self.prune = prune
+        self.date = None
+        self.part = 0
+        self.size = 0
+        self.file = None
+
+    def _open(self, date, part, size):
+        self.close()
+        self.file = flash_io.open_write(_segment_path(date, part), 'ab', 'log', size)
+        self.date = date
+        self.part = part
+        self.size = size
+
+    def write(self, seq, timestamp, level, message, repeat_count=1, last_timestamp=0):
+        global _last_prune_date, _store_bytes
+        date = _format_date(time.localtime(timestamp))
+        if date != self.date:
+            # La rotazione avviene una sola volta al giorno, al primo salvataggio della giornata
+            if self.prune and _last_prune_date != date:
+                _prune_old_segments(date)
+                _last_prune_date = date
+            part, size = _last_part(date)
+            self._open(date, part, size)
+        record = _encode_message(seq, timestamp, level, message, repeat_count, last_timestamp)
+        if self.size > 0 and self.size + len(record) > LOG_SEGMENT_MAX_BYTES:
+            self._open(date, self.part + 1, 0)
+        self.file.write(record)
+        self.size += len(record)
+        _store_bytes += len(record)
+
+    def close(self):
+        global _head_segment
+        if self.file:
+            self.file.close()
+            self.file = None
+            if _head_segment is None or (self.date, self.part) >= (_head_segment[0], _head_segment[1]):
+                _head_segment = [self.date, self.part, self.size]
+
+# -------- Migrazione dai vecchi formati --------
+
+def _iter_file_entries(path):
+    """
+    Generatore che restituisce i log di un file JSON-lines, uno alla volta, in ordine cronologico.
+
+    Args:
+        path: Percorso del file JSON-lines
+    """
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = ujson.loads(line)
+                except ValueError:
+                    # Riga corrotta (es. interruzione di corrente durante la scrittura)
+                    continue
+                yield entry
+    except OSError:
+        return
+
+def _migrate_entries(entries, date=None):
+    """
+    Scrive nei segmenti binari una sequenza di log nel vecchio formato JSON (in ordine cronologico).
+    I log che non hanno già un numero di sequenza ne ricevono uno nuovo.
+
+    Args:
+        entries: Iterabile di dizionari {date, time, level, message[, seq]}
+        date: Data da usare per le voci che non la contengono (vecchi segmenti giornalieri)
+
+    Returns:
+        int: Numero di log scritti
+    """
+    global _last_seq
+    count = 0
+    writer = _SegmentWriter()
+    try:
+        for entry in entries:
+            timestamp = _cursor_to_timestamp(f"{entry.get('date', date)} {entry.get('time', '00:00:00')}")
+            if timestamp is None:
+                continue
+            seq = entry.get('seq')
+            if seq is None:
+                _last_seq += 1
+                seq = _last_seq
+            else:
+                _last_seq = max(_last_seq, seq)
+            writer.write(seq, timestamp, entry.get('level', 'INFO'), entry.get('message', ''))
+            count += 1
+    finally:
+        writer.close()
+    return count
+
+def _migrate_legacy_logs():
+    """
+    Converte nel formato binario i log dei vecchi formati: i segmenti giornalieri JSON-lines
+    e i vecchi file unici (array JSON o JSON-lines).
+    Viene eseguita una sola volta: al termine i vecchi file vengono rimossi.
+    """
+    legacy_files = [(_segment_path(date, part, LEGACY_SEGMENT_EXT), date) for date, part in _list_segments(LEGACY_SEGMENT_EXT)]
+    legacy_files += [(path, None) for path in LEGACY_LOG_FILES if _file_exists(path)]
+    for legacy_file, date in legacy_files:
+        try:
+            if legacy_file.endswith(LEGACY_SEGMENT_EXT):
+                entries = _iter_file_entries(legacy_file)
+            else:
+                with open(legacy_file, 'r') as f:
+                    entries = ujson.load(f)
+            migrated = _migrate_entries(entries, date)
+            entries = None
+            print(f"Migrati {migrated} log da {legacy_file}")
+            _enforce_byte_budget()
+        except (OSError, ValueError, MemoryError) as e:
+            print(f"Impossibile migrare i log da {legacy_file}, verranno scartati: {e}")
+        try:
+            flash_io.remove(legacy_file, 'log')
+        except OSError:
+            pass
+        gc.collect()
+
+# -------- Inizializzazione e sequenza --------
+
+def _init_log_store():
+    """Prepara la directory dei log alla prima scrittura o lettura"""
+    global _initialized
+    if _initialized:
+        return
+    _ensure_log_dir_exists()
+    _load_templates()
+    _load_store_size()
+    _isolate_torn_tail()
+    _load_last_seq()
+    _migrate_legacy_logs()
+    _initialized = True
+
+def _load_last_seq():
+    """
+    Recupera l'ultimo numero di sequenza dopo un riavvio: è il maggiore tra quello
+    dell'ultimo record valido dei segmenti e il limite salvato in LOG_SEQ_FILE.
+    Ripartendo dal limite salvato non vengono riusati i numeri degli eventi mai salvati
+    su flash (es. DEBUG o record incompleti), che i client potrebbero già avere ricevuto.
+    """
+    global _last_seq, _seq_reserved
+    last_seq = 0
+    try:
+        with open(LOG_SEQ_FILE, 'r') as f:
+            last_seq = int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        pass
+    # Basta leggere l'ultimo record valido: la parte più recente può essere vuota (vedi _isolate_torn_tail)
+    for date, part in reversed(_list_segments()):
+        payload = None
+        for payload in _iter_segment_records_reverse(date, part):
+            last_seq = max(last_seq, decode_header(payload)[0])
+            break
+        if payload is not None:
+            break
+    _last_seq = last_seq
+    _seq_reserved = last_seq
+
+def _save_last_seq():
+    """Salva il limite dei numeri di sequenza assegnati, per non ripartire da zero se non restano segmenti"""
+    try:
+        with flash_io.open_write(LOG_SEQ_FILE, 'w', 'log') as f:
+            f.write(str(max(_last_seq, _seq_reserved)))
+    except OSError as e:
+        print(f"Errore durante il salvataggio della sequenza dei log: {e}")
+
+def _isolate_torn_tail():
+    """
+    Verifica che il segmento più recente termini con un record completo. Una mancanza di
+    corrente durante il salvataggio può lasciare in coda un record incompleto: le nuove
+    scritture proseguono in una nuova parte del segmento, così non seguono mai dati non validi.
+    """
+    global _head_segment
+    if _head_segment is None:
+        return
+    date, part, size = _head_segment
+    valid_end = 0
+    for offset, payload in _iter_segment_frames(date, part):
+        valid_end = offset + len(payload) + 2 * LENGTH_SIZE
+    if valid_end >= size:
+        return
+    print(f"Segmento di log {date}.{part}: scartato un record incompleto, nuova parte {part + 1}")
+    try:
+        # La parte vuota viene creata subito perché _last_part la trovi anche dopo una rotazione
+        flash_io.open_write(_segment_path(date, part + 1), 'wb', 'log', 0).close()
+        _head_segment = [date, part + 1, 0]
+    except OSError as e:
+        print(f"Errore durante la creazione della nuova parte del segmento di log: {e}")
+
+def _load_store_size():
+    """Calcola lo spazio occupato dai segmenti e individua il segmento più recente"""
+    global _store_bytes, _head_segment
+    _store_bytes = 0
+    _head_segment = None
+    for date, part in _list_segments():
+        size = _segment_size(date, part)
+        _store_bytes += size
+        _head_segment = [date, part, size]
+
+# -------- Lettura --------
+
+def _valid_frame(buffer, start, length):
+    """
+    Verifica che in buffer[start:] ci sia un record completo con il contenuto lungo length:
+    lunghezza iniziale e finale uguali e livello valido. Serve a riallinearsi dopo un record
+    corrotto o incompleto senza scambiare per un record i byte di un altro.
+    """
+    if length < HEADER_SIZE or length > LOG_SEGMENT_MAX_BYTES:
+        return False
+    if ustruct.unpack_from('<H', buffer, start)[0] != length:
+        return False
+    if ustruct.unpack_from('<H', buffer, start + LENGTH_SIZE + length)[0] != length:
+        return False
+    return (buffer[start + LENGTH_SIZE + LEVEL_OFFSET] & LEVEL_MASK) < len(LOG_LEVELS)
+
+def _iter_segment_records_reverse(date, part=0):
+    """
+    Generatore che restituisce il contenuto dei record di una parte di segmento dall'ultimo al primo.
+    Il file viene letto a blocchi di LOG_READ_BLOCK_SIZE byte partendo dalla fine,
+    usando la lunghezza ripetuta in coda ad ogni record: la memoria usata non dipende
+    dalla dimensione del file. I byte che non formano un record valido vengono saltati.
+    """
+    try:
+        with open(_segment_path(date, part), 'rb') as f:
+            f.seek(0, 2)
+            position = f.tell()
+            buffer = b''
+            end = 0
+            while True:
+                if end >= LENGTH_SIZE:
+                    length = ustruct.unpack_from('<H', buffer, end - LENGTH_SIZE)[0]
+                    start = end - length - 2 * LENGTH_SIZE
+                    if length < HEADER_SIZE or length > LOG_SEGMENT_MAX_BYTES or (start < 0 and position == 0):
+                        # Non è la fine di un record (es. record incompleto): si riallinea di un byte
+                        end -= 1
+                        continue
+                    if start >= 0:
+                        if not _valid_frame(buffer, start, length):
+                            end -= 1
+                            continue
+                        yield buffer[start + LENGTH_SIZE:end - LENGTH_SIZE]
+                        end = start
+                        continue
+                if position == 0:
+                    return
+                # Il record successivo non è completo nel buffer: legge il blocco precedente
+                size = min(LOG_READ_BLOCK_SIZE, position)
+                position -= size
+                f.seek(position)
+                buffer = f.read(size) + buffer[:end]
+                end = len(buffer)
+    except OSError:
+        return
+
+def _iter_segment_frames(date, part=0):
+    """
+    Generatore che restituisce (posizione nel file, contenuto) dei record di una parte di
+    segmento dal primo all'ultimo. Il file viene letto a blocchi di LOG_READ_BLOCK_SIZE byte
+    usando la lunghezza all'inizio di ogni record: la memoria usata non dipende dalla
+    dimensione del file. I byte che non formano un record valido vengono saltati.
+    """
+    try:
+        with open(_segment_path(date, part), 'rb') as f:
+            buffer = b''
+            offset = 0  # Posizione nel file di buffer[0]
+            start = 0
+            eof = False
+            while True:
+                if len(buffer) - start >= LENGTH_SIZE:
+                    length = ustruct.unpack_from('<H', buffer, start)[0]
+                    end = start + length + 2 * LENGTH_SIZE
+                    if length < HEADER_SIZE or length > LOG_SEGMENT_MAX_BYTES or (eof and end > len(buffer)):
+                        # Non è l'inizio di un record (es. scrittura interrotta): si riallinea di un byte
+                        start += 1
+                        continue
+                    if end <= len(buffer):
+                        if not _valid_frame(buffer, start, length):
+                            start += 1
+                            continue
+                        yield offset + start, buffer[start + LENGTH_SIZE:end - LENGTH_SIZE]
+                        start = end
+                        continue
+                if eof:
+                    return
+                block = f.read(LOG_READ_BLOCK_SIZE)
+                if not block:
+                    eof = True
+                    continue
+                offset += start
+                buffer = buffer[start:] + block
+                start = 0
+    except OSError:
+        return
+
+def _iter_segment_records(date, part=0):
+    """Generatore che restituisce il contenuto dei record di una parte di segmento dal primo all'ultimo"""
+    for _, payload in _iter_segment_frames(date, part):
+        yield payload
+
+def _parse_levels(level):
+    """Converte il filtro dei livelli ("ERROR" o "WARNING,ERROR") in un insieme di codici, None se assente"""
+    if not level:
+        return None
+    return set(level_to_code(part.strip().upper()) for part in level.split(',') if part.strip())
+
+def _iter_records(date=None, level=None, since=None, after_seq=None):
+    """
+    Generatore che restituisce il contenuto dei record dal più recente al più vecchio, applicando i filtri.
+    I filtri usano solo l'intestazione del record: il messaggio non viene ricostruito.
+    """
+    flush_logs()
+    _init_log_store()
+    segments = _list_segments()
+    if date is not None:
+        segments = [segment for segment in segments if segment[0] == date]
+    levels = _parse_levels(level)
+    since_timestamp = None
+    since = since.strip() if since else None
+    if since and since.isdigit():
+        # Cursore restituito da query_logs: il numero di sequenza dell'ultimo log ricevuto
+        since_seq = int(since)
+        after_seq = since_seq if after_seq is None else max(after_seq, since_seq)
+    elif since:
+        since_timestamp = _cursor_to_timestamp(since)
+    since_date = since[:10] if since_timestamp is not None else None
+
+    for segment_date, part in reversed(segments):
+        # I segmenti sono in ordine: quelli precedenti al cursore non contengono log utili
+        if since_date and segment_date < since_date:
+            return
+        for payload in _iter_segment_records_reverse(segment_date, part):
+            seq, timestamp, level_code, _, _ = decode_header(payload)
+            # Un cursore a data ha la risoluzione del secondo: i log dello stesso secondo vengono
+            # restituiti di nuovo, altrimenti quelli registrati dopo la lettura andrebbero persi
+            if since_timestamp is not None and timestamp < since_timestamp:
+                return
+            if after_seq is not None and seq <= after_seq:
+                return
+            if levels and (level_code & LEVEL_MASK) not in levels:
+                continue
+            yield payload
+
+def get_last_seq():
+    """Restituisce il numero di sequenza dell'ultimo evento registrato (0 se nessuno)"""
+    _init_log_store()
+    return _last_seq
+
+def iter_logs(date=None, level=None, since=None, after_seq=None):
+    """
+    Generatore che restituisce i log dal più recente al più vecchio, applicando i filtri.
+    Legge i segmenti a ritroso un blocco alla volta: non carica mai l'intero log in memoria.
+
+    Args:
+        date: Se specificata (YYYY-MM-DD), legge solo il segmento di quel giorno
+        level: Livello o elenco di livelli separati da virgola (es. "WARNING,ERROR")
+        since: Cursore restituito da query_logs (numero di sequenza) per i soli log successivi,
+            oppure data ("YYYY-MM-DD HH:MM:SS" o "YYYY-MM-DD") per i log da quell'istante
+        after_seq: Restituisce solo i log con numero di sequenza maggiore di questo
+    """
+    for payload in _iter_records(date, level, since, after_seq):
+        yield _decode_record(payload)
+
+def iter_logs_range(date_from=None, date_to=None, level=None):
+    """
+    Generatore che restituisce i log in ordine cronologico, dal più vecchio al più recente.
+    Legge i segmenti in avanti un blocco alla volta: la memoria usata non dipende
+    dal numero di log restituiti.
+
+    Args:
+        date_from: Prima data inclusa (YYYY-MM-DD), None per partire dal log più vecchio
+        date_to: Ultima data inclusa (YYYY-MM-DD), None per arrivare al log più recente
+        level: Livello o elenco di livelli separati da virgola (es. "WARNING,ERROR")
+    """
+    flush_logs()
+    _init_log_store()
+    levels = _parse_levels(level)
+    for date, part in _list_segments():
+        if date_from and date < date_from:
+            continue
+        if date_to and date > date_to:
+            return
+        for payload in _iter_segment_records(date, part):
+            if levels and (decode_header(payload)[2] & LEVEL_MASK) not in levels:
+                continue
+            yield _decode_record(payload)
+
+def query_logs(date=None, level=None, since=None, offset=0, limit=DEFAULT_LOG_PAGE_SIZE, after_seq=None):
+    """
+    Restituisce una pagina di log filtrati, dal più recente al più vecchio.
+    In memoria viene mantenuta solo la pagina richiesta e vengono ricostruiti
+    solo i messaggi dei log restituiti.
+
+    Args:
+        date: Se specificata (YYYY-MM-DD), legge solo il segmento di quel giorno
+        level: Livello o elenco di livelli separati da virgola
+        since: Cursore (vedi iter_logs): restituisce solo i log successivi a questo
+        offset: Numero di log da saltare
+        limit: Numero massimo di log da restituire (al massimo MAX_LOG_PAGE_SIZE)
+        after_seq: Restituisce solo i log con numero di sequenza maggiore di questo
+
+    Returns:
+        dict: {'logs', 'offset', 'limit', 'has_more', 'cursor', 'last_seq'}
+    """
+    offset = max(0, offset)
+    limit = max(1, min(limit, MAX_LOG_PAGE_SIZE))
+    page = []
+    has_more = False
+    skipped = 0
+    for payload in _iter_records(date, level, since, after_seq):
+        if skipped < offset:
+            skipped += 1
+            continue
+        if len(page) >= limit:
+            has_more = True
+            break
+        page.append(_decode_record(payload))
+
+    # Il cursore permette al client di chiedere in seguito solo i log più recenti: è il numero
+    # di sequenza, perché più log possono avere lo stesso orario al secondo
+    cursor = str(page[0]['seq']) if page and offset == 0 else since
+    return {
+        'logs': page,
+        'offset': offset,
+        'limit': limit,
+        'has_more': has_more,
+        'cursor': cursor,
+        'last_seq': _last_seq
+    }
+
+# -------- Rotazione --------
+
+def _remove_segment(date, part):
+    """
+    Elimina una parte di segmento aggiornando lo spazio occupato.
+
+    Returns:
+        boolean: True se la parte è stata eliminata
+    """
+    global _store_bytes, _head_segment, _templates_stale
+    size = _segment_size(date, part)
+    try:
+        flash_io.remove(_segment_path(date, part), 'log')
+    except OSError as e:
+        print(f"Errore durante l'eliminazione del segmento di log {date}.{part}: {e}")
+        return False
+    _store_bytes = max(0, _store_bytes - size)
+    _templates_stale = True
+    if _head_segment and _head_segment[0] == date and _head_segment[1] == part:
+        _head_segment = None
+    return True
+
+def _prune_old_segments(current_date):
+    """
+    Elimina i segmenti più vecchi di MAX_LOG_DAYS rispetto alla data corrente.
+    Non è necessario leggere il contenuto dei file: la data è nel nome del segmento.
+    """
+    today = date_to_days(current_date)
+    if today is None:
+        return
+    removed = False
+    for date, part in _list_segments():
+        segment_day = date_to_days(date)
+        if segment_day is None or today - segment_day > MAX_LOG_DAYS:
+            if _remove_segment(date, part):
+                removed = True
+                print(f"Segmento di log {date} eliminato")
+    if removed:
+        _save_last_seq()
+
+def _enforce_byte_budget():
+    """
+    Elimina le parti di segmento più vecchie finché lo spazio occupato (segmenti e modelli)
+    non rientra in LOG_MAX_BYTES. La parte più recente non viene mai eliminata.
+    Dopo ogni eliminazione, anche per età, il file dei modelli viene compattato: va quindi
+    chiamata con i segmenti chiusi.
+    """
+    if _store_bytes + _templates_bytes > LOG_MAX_BYTES:
+        segments = _list_segments()
+        removed = False
+        for date, part in segments[:-1]:
+            if _store_bytes + _templates_bytes <= LOG_MAX_BYTES:
+                break
+            if _remove_segment(date, part):
+                removed = True
+                print(f"Segmento di log {date}.{part} eliminato: superato il limite di {LOG_MAX_BYTES} byte")
+        if removed:
+            _save_last_seq()
+    if _templates_stale:
+        _compact_templates()
+
+# -------- API pubblica --------
+
+def _buffer_event(timestamp, level, message, repeat_count=1, last_timestamp=0):
+    """Inserisce un evento nel buffer in RAM assegnandogli il numero di sequenza"""
+    global _ring_head, _ring_count, _dispatch_count, _last_seq, _seq_reserved
+    _last_seq += 1
+    if _last_seq > _seq_reserved:
+        # Una scrittura ogni LOG_SEQ_RESERVE eventi: dopo un riavvio la sequenza riparte oltre il limite
+        _seq_reserved = _last_seq + LOG_SEQ_RESERVE
+        _save_last_seq()
+    slot = _ring[_ring_head]
+    slot[0] = _last_seq
+    slot[1] = timestamp
+    slot[2] = level
+    slot[3] = message
+    slot[4] = repeat_count
+    slot[5] = last_timestamp
+    _ring_head = (_ring_head + 1) % LOG_BUFFER_SIZE
+    _ring_count += 1
+    _dispatch_count += 1
+
+    if level == "ERROR" or max(_ring_count, _dispatch_count) >= LOG_BUFFER_SIZE:
+        # Gli errori non devono andare persi e il buffer pieno non può accettare altri eventi
+        flush_logs()
+    elif _sinks:
+        # Il task di invio viene risvegliato subito per consegnare l'evento agli altri sink
+        _flush_event.set()
+    elif _ring_count >= LOG_BUFFER_HIGH_WATER:
+        _flush_event.set()
+
+def _flush_repeats():
+    """Inserisce nel buffer le ripetizioni accumulate: un riepilogo, o un evento normale se è una sola"""
+    global _repeat_count
+    count = _repeat_count
+    if count == 0:
+        return
+    _repeat_count = 0
+    if count == 1:
+        _buffer_event(_repeat_first, _last_level, _last_message)
+    else:
+        _buffer_event(_repeat_first, _last_level, _last_message, count, _last_timestamp)
+
+def _dispatch_events():
+    """Consegna ai sink diversi dalla flash gli eventi del buffer non ancora inviati"""
+    global _dispatch_count
+    index = (_ring_head - _dispatch_count) % LOG_BUFFER_SIZE
+    while _dispatch_count > 0:
+        slot = _ring[index]
+        level_code = level_to_code(slot[2])
+        for sink_level, sink in _sinks:
+            if level_code >= sink_level:
+                try:
+                    sink.write(slot[0], slot[1], slot[2], slot[3], slot[4], slot[5])
+                except Exception as e:
+                    print(f"Errore durante l'invio del log: {e}")
+        index = (index + 1) % LOG_BUFFER_SIZE
+        _dispatch_count -= 1
+
+def _parse_sink_level(config):
+    """Restituisce il livello minimo di un sink dalla sua configurazione (LEVEL_OFF se disattivato)"""
+    level = config.get('level') if isinstance(config, dict) else config
+    if not level or str(level).upper() == 'OFF':
+        return LEVEL_OFF
+    return level_to_code(str(level).upper())
+
+def configure_sinks(config=None):
+    """
+    Configura le destinazioni dei log e il loro livello minimo.
+    Le voci mancanti mantengono i valori di DEFAULT_LOG_SINKS.
+
+    Args:
+        config: Dizionario {'flash': {'level'}, 'console': {'level'}, 'memory': {'level'},
+                'syslog': {'level', 'host', 'port', 'hostname'}}
+
+    Returns:
+        boolean: True se la configurazione è stata applicata, False altrimenti
+    """
+    global _flash_level, _sinks, _min_level
+    try:
+        config = config if isinstance(config, dict) else {}
+        settings = {}
+        for name, defaults in DEFAULT_LOG_SINKS.items():
+            settings[name] = dict(defaults)
+            if isinstance(config.get(name), dict):
+                settings[name].update(config[name])
+
+        # Gli eventi in attesa vengono consegnati ai sink attuali prima di sostituirli
+        _dispatch_events()
+        for _, sink in _sinks:
+            if isinstance(sink, SyslogSink):
+                sink.close()
+
+        sinks = []
+        console_level = _parse_sink_level(settings['console'])
+        if console_level < LEVEL_OFF:
+            sinks.append([console_level, ConsoleSink()])
+        memory_level = _parse_sink_level(settings['memory'])
+        if memory_level < LEVEL_OFF:
+            sinks.append([memory_level, _memory_sink])
+        syslog = settings['syslog']
+        syslog_level = _parse_sink_level(syslog)
+        if syslog_level < LEVEL_OFF and syslog.get('host'):
+            try:
+                sinks.append([syslog_level, SyslogSink(syslog['host'], int(syslog.get('port') or SYSLOG_DEFAULT_PORT), syslog.get('hostname'))])
+            except (OSError, ValueError, IndexError) as e:
+                print(f"Impossibile configurare il syslog verso {syslog['host']}: {e}")
+
+        _flash_level = _parse_sink_level(settings['flash'])
+        _sinks = sinks
+        _min_level = min([_flash_level] + [sink_level for sink_level, _ in sinks])
+        return True
+    except Exception as e:
+        print(f"Errore durante la configurazione dei sink di log: {e}")
+        return False
+
 def log_event(message, level="INFO"):
     """
     Registra un evento nel log di sistema.
-    
+    L'evento viene inserito nel buffer in RAM in tempo costante e consegnato ai sink
+    dal task log_flush_loop; il salvataggio su flash avviene a blocchi, tranne per gli
+    errori che vengono salvati subito.
+    Le ripetizioni consecutive dello stesso evento vengono accorpate in un riepilogo.
+
     Args:
         message: Messaggio da registrare
-        level: Livello di log (INFO, WARNING, ERROR)
+        level: Livello di log (DEBUG, INFO, WARNING, ERROR)
     """
+    global _last_level, _last_message, _last_timestamp, _repeat_count, _repeat_first
     try:
-        _ensure_log_file_exists()
-        
-        # Leggi i log esistenti
-        try:
-            with open(LOG_FILE, 'r') as f:
-                logs = ujson.load(f)
-        except (OSError, ValueError):
-            logs = []
-        
-        # Aggiungi nuovo log
-        current_date = _get_current_date()
-        current_time = _get_current_time()
-        
-        new_log = {
-            "date": current_date,
-            "time": current_time,
-            "level": level,
-            "message": message
-        }
-        
-        logs.append(new_log)
-        
-        # Rimuovi i log più vecchi di MAX_LOG_DAYS
-        now = time.time()
-        current_day = time.localtime(now)[7]  # Giorno dell'anno
-        
-        filtered_logs = []
-        for log in logs:
-            try:
-                log_date = log.get("date", "")
-                if log_date:
-                    log_year, log_month, log_day = [int(x) for x in log_date.split('-')]
-                    log_day_of_year = time.localtime(time.mktime((log_year, log_month, int(log_day), 0, 0, 0, 0, 0)))[7]
-                    
-                    # Gestione del cambio anno 
-                    if current_day - log_day_of_year <= MAX_LOG_DAYS or (log_day_of_year > current_day and current_day + 365 - log_day_of_year <= MAX_LOG_DAYS):
-                        filtered_logs.append(log)
-            except Exception:
-                # Se c'è un errore nella data, mantieni il log (meglio sicuri)
-                filtered_logs.append(log)
-        
-        # Salva i log filtrati
-        with open(LOG_FILE, 'w') as f:
-            ujson.dump(filtered_logs, f)
-            
-        # Stampa anche a console per debug
-        print(f"[{level}] {current_time}: {message}")
-        
-        # Forza garbage collection dopo operazioni su file
-        gc.collect()
-        
+        if level_to_code(level) < _min_level:
+            return
+        # Al primo evento recupera l'ultima sequenza salvata, così la numerazione resta crescente
+        _init_log_store()
+        timestamp = time.time()
+
+        if level == _last_level and message == _last_message and timestamp - _last_timestamp <= LOG_COALESCE_WINDOW:
+            if _repeat_count == 0:
+                _repeat_first = timestamp
+            _repeat_count += 1
+            _last_timestamp = timestamp
+            if timestamp - _repeat_first >= LOG_COALESCE_WINDOW:
+                _flush_repeats()
+            return
+
+        # Un evento diverso chiude la serie di ripetizioni del precedente
+        _flush_repeats()
+        _last_level = level
+        _last_message = message
+        _last_timestamp = timestamp
+        _buffer_event(timestamp, level, message)
+
     except Exception as e:
         print(f"Errore durante la registrazione nel log: {e}")
 
-def get_logs():
+def flush_logs(force=False):
     """
-    Restituisce tutti i log salvati.
-    
+    Consegna ai sink gli eventi presenti nel buffer in RAM e salva su flash quelli
+    con livello almeno pari a quello del sink flash.
+    Gli eventi consecutivi dello stesso giorno vengono scritti con un'unica apertura del segmento.
+    Le ripetizioni accumulate vengono salvate solo quando la finestra LOG_COALESCE_WINDOW è scaduta.
+    Deve essere chiamata con force=True prima di un riavvio (machine.reset()) per non perdere eventi.
+
+    Args:
+        force: Se True salva anche le ripetizioni accumulate nella finestra corrente
+    """
+    global _ring_count, _last_flush
+    if _repeat_count and (force or time.time() - _repeat_first >= LOG_COALESCE_WINDOW):
+        _flush_repeats()
+    # Gli slot vengono liberati dal salvataggio: prima vanno consegnati agli altri sink
+    _dispatch_events()
+    _last_flush = time.ticks_ms()
+    if _ring_count == 0:
+        return
+    writer = _SegmentWriter(prune=True)
+    try:
+        _init_log_store()
+        index = (_ring_head - _ring_count) % LOG_BUFFER_SIZE
+        while _ring_count > 0:
+            slot = _ring[index]
+            if level_to_code(slot[2]) >= _flash_level:
+                writer.write(slot[0], slot[1], slot[2], slot[3], slot[4], slot[5])
+            # Libera il riferimento al messaggio senza riallocare lo slot
+            slot[2] = None
+            slot[3] = None
+            index = (index + 1) % LOG_BUFFER_SIZE
+            _ring_count -= 1
+    except Exception as e:
+        # In caso di errore sulla flash gli eventi rimasti vengono scartati per non bloccare il buffer
+        print(f"Errore durante il salvataggio dei log: {e}")
+        _ring_count = 0
+    finally:
+        writer.close()
+    _enforce_byte_budget()
+
+async def log_flush_loop():
+    """
+    Task asincrono che consegna gli eventi del buffer in RAM ai sink e li salva
+    periodicamente su flash (ogni LOG_FLUSH_INTERVAL secondi, o in anticipo quando
+    il buffer supera LOG_BUFFER_HIGH_WATER).
+    """
+    while True:
+        try:
+            await asyncio.wait_for(_flush_event.wait(), LOG_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _flush_event.clear()
+        try:
+            if _ring_count >= LOG_BUFFER_HIGH_WATER or time.ticks_diff(time.ticks_ms(), _last_flush) >= LOG_FLUSH_INTERVAL * 1000:
+                flush_logs()
+            else:
+                _dispatch_events()
+        except Exception as e:
+            print(f"Errore nel task dei log: {e}")
+
+def get_recent_logs(level=None):
+    """
+    Restituisce gli ultimi eventi mantenuti dal sink in memoria, compresi quelli
+    con livello inferiore a quello salvato su flash.
+
+    Args:
+        level: Livello o elenco di livelli separati da virgola (es. "DEBUG,ERROR")
+
+    Returns:
+        Lista di log ordinati dal più recente al più vecchio
+    """
+    _dispatch_events()
+    levels = _parse_levels(level)
+    logs = []
+    for slot in _memory_sink.entries():
+        if levels and level_to_code(slot[2]) not in levels:
+            continue
+        logs.append(_format_entry(slot[0], slot[1], slot[2], slot[3], slot[4], slot[5]))
+    return logs
+
+def get_logs(date=None):
+    """
+    Restituisce i log salvati.
+
+    Args:
+        date: Se specificata (YYYY-MM-DD), legge solo il segmento di quel giorno
+
     Returns:
         Lista di log ordinati dal più recente al più vecchio
     """
     try:
-        _ensure_log_file_exists()
-        with open(LOG_FILE, 'r') as f:
-            logs = ujson.load(f)
-            
-        # Ordina i log per data e ora (più recenti prima)
-        logs.sort(key=lambda x: (x.get('date', ''), x.get('time', '')), reverse=True)
-        return logs
+        return list(iter_logs(date))
     except Exception as e:
         print(f"Errore durante la lettura dei log: {e}")
         return []
@@ -123,15 +1168,42 @@ def get_logs():
 def clear_logs():
     """
     Cancella tutti i log.
-    
+
     Returns:
         boolean: True se l'operazione è riuscita, False altrimenti
     """
+    global _ring_count, _repeat_count, _last_level, _last_message
     try:
-        _ensure_log_file_exists()
-        with open(LOG_FILE, 'w') as f:
-            ujson.dump([], f)
+        _init_log_store()
+        _ring_count = 0
+        _repeat_count = 0
+        _last_level = None
+        _last_message = None
+        for date, part in _list_segments():
+            _remove_segment(date, part)
+        # Nessun segmento fa più riferimento ai modelli registrati
+        _reset_templates()
+        # La sequenza non riparte da zero, così i client che seguono i log non perdono eventi
+        _save_last_seq()
         return True
     except Exception as e:
         print(f"Errore durante la cancellazione dei log: {e}")
-        return False
\ No newline at end of file
+        return False
+
+def get_log_store_stats():
+    """
+    Restituisce lo spazio occupato dall'archivio dei log.
+
+    Returns:
+        dict: {'bytes' (segmenti e modelli), 'template_bytes', 'max_bytes', 'segments',
+        'templates', 'buffered'}
+    """
+    _init_log_store()
+    return {
+        'bytes': _store_bytes + _templates_bytes,
+        'template_bytes': _templates_bytes,
+        'max_bytes': LOG_MAX_BYTES,
+        'segments': len(_list_segments()),
+        'templates': len(_templates) - _templates.count(None),
+        'buffered': _ring_count
+    }
@@ -0,0 +1,92 @@
+"""
+Modulo con le destinazioni (sink) dei log di sistema diverse dalla flash.
+Ogni sink espone write(seq, timestamp, level, message, repeat_count, last_timestamp) e
+viene chiamato dal task di invio dei log (vedi log_manager), mai da chi registra l'evento.
+"""
+import time
+import usocket as socket
+from log_codec import level_to_code
+
+# Severità syslog (RFC 5424) corrispondenti a DEBUG, INFO, WARNING, ERROR
+SYSLOG_SEVERITIES = (7, 6, 4, 3)
+SYSLOG_FACILITY = 1  # user-level messages
+SYSLOG_DEFAULT_PORT = 514
+SYSLOG_APP_NAME = 'irrigazione'
+
+def _format_clock(timestamp):
+    """Formatta un timestamp nel formato HH:MM:SS"""
+    t = time.localtime(timestamp)
+    return f"{t[3]:02d}:{t[4]:02d}:{t[5]:02d}"
+
+def _repeat_suffix(repeat_count, last_timestamp):
+    """Testo aggiunto ai messaggi di riepilogo delle ripetizioni"""
+    if repeat_count > 1:
+        return f" (ripetuto {repeat_count} volte fino alle {_format_clock(last_timestamp)})"
+    return ''
+
+class ConsoleSink:
+    """Stampa i log sulla console seriale"""
+    def write(self, seq, timestamp, level, message, repeat_count, last_timestamp):
+        print(f"[{level}] {_format_clock(timestamp)}: {message}{_repeat_suffix(repeat_count, last_timestamp)}")
+
+class MemorySink:
+    """
+    Mantiene in RAM gli ultimi eventi, compresi quelli che non vengono salvati su flash.
+    Gli slot sono preallocati e vengono riutilizzati in modo circolare.
+    """
+    def __init__(self, size):
+        self.slots = [[0, 0, None, None, 1, 0] for _ in range(size)]
+        self.head = 0
+        self.count = 0
+
+    def write(self, seq, timestamp, level, message, repeat_count, last_timestamp):
+        slot = self.slots[self.head]
+        slot[0] = seq
+        slot[1] = timestamp
+        slot[2] = level
+        slot[3] = message
+        slot[4] = repeat_count
+        slot[5] = last_timestamp
+        self.head = (self.head + 1) % len(self.slots)
+        if self.count < len(self.slots):
+            self.count += 1
+
+    def entries(self):
+        """Generatore che restituisce gli slot dal più recente al più vecchio"""
+        index = self.head
+        for _ in range(self.count):
+            index = (index - 1) % len(self.slots)
+            yield self.slots[index]
+
+class SyslogSink:
+    """
+    Invia i log a un collettore syslog della rete locale via UDP (RFC 5424).
+    L'invio non è bloccante: se il pacchetto non può essere spedito l'evento viene scartato.
+    """
+    def __init__(self, host, port=SYSLOG_DEFAULT_PORT, hostname='IrrigationSystem'):
+        # L'indirizzo viene risolto una sola volta: è consigliato indicare un indirizzo IP
+        self.address = socket.getaddrinfo(host, port)[0][-1]
+        self.hostname = hostname or '-'
+        self.socket = None
+        self.dropped = 0
+
+    def write(self, seq, timestamp, level, message, repeat_count, last_timestamp):
+        t = time.localtime(timestamp)
+        priority = SYSLOG_FACILITY * 8 + SYSLOG_SEVERITIES[level_to_code(level)]
+        packet = (
+            f"<{priority}>1 {t[0]}-{t[1]:02d}-{t[2]:02d}T{t[3]:02d}:{t[4]:02d}:{t[5]:02d} "
+            f"{self.hostname} {SYSLOG_APP_NAME} - {seq} - {message}{_repeat_suffix(repeat_count, last_timestamp)}"
+        )
+        try:
+            if self.socket is None:
+                self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.socket.setblocking(False)
+            self.socket.sendto(packet.encode(), self.address)
+        except OSError:
+            # Rete non disponibile o buffer di invio pieno
+            self.dropped += 1
+
+    def close(self):
+        if self.socket:
+            self.socket.close()
+            self.socket = None
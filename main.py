@@ -5,28 +5,19 @@ Inizializza il sistema e avvia i servizi necessari.
 from wifi_manager import initialize_network, reset_wifi_module, retry_client_connection
 from web_server import start_web_server
 from zone_manager import initialize_pins, stop_all_zones
-from program_manager import check_programs, reset_program_state
-from log_manager import log_event
+from program_manager import reset_program_state
+from program_scheduler import scheduler_loop
+from log_manager import log_event, log_flush_loop, flush_logs, configure_sinks
+from settings_manager import get_settings_model, subscribe_settings
 import uasyncio as asyncio
 import gc
 import machine
 import time
 
-# Intervallo di controllo dei programmi in secondi
-PROGRAM_CHECK_INTERVAL = 30
-
-async def program_check_loop():
-    """
-    Task asincrono che controlla periodicamente i programmi di irrigazione.
-    """
-    while True:
-        try:
-            # Controlla se ci sono programmi da avviare
-            await check_programs()
-            await asyncio.sleep(PROGRAM_CHECK_INTERVAL)
-        except Exception as e:
-            log_event(f"Errore durante il controllo dei programmi: {e}", "ERROR")
-            await asyncio.sleep(PROGRAM_CHECK_INTERVAL)  # Continua comunque
+def _on_log_settings_changed(previous, current):
+    """Riconfigura i sink dei log quando cambia la loro configurazione"""
+    if previous.log_sinks != current.log_sinks:
+        configure_sinks(current.log_sinks)
 
 async def watchdog_loop():
     """
@@ -55,6 +46,10 @@ async def main():
     Funzione principale che inizializza il sistema e avvia i task asincroni.
     """
     try:
+        # Avvia subito il salvataggio dei log, così anche quelli di avvio finiscono su flash
+        log_flush_task = asyncio.create_task(log_flush_loop())
+        configure_sinks(get_settings_model().log_sinks)
+        subscribe_settings(_on_log_settings_changed)
         log_event("Avvio del sistema di irrigazione", "INFO")
         
         # Disattiva Bluetooth se disponibile per risparmiare memoria
@@ -106,9 +101,9 @@ async def main():
         web_server_task = asyncio.create_task(start_web_server())
         log_event("Web server avviato", "INFO")
         
-        print("Avvio del controllo dei programmi...")
-        program_check_task = asyncio.create_task(program_check_loop())
-        log_event("Loop di controllo programmi avviato", "INFO")
+        print("Avvio del pianificatore dei programmi...")
+        scheduler_task = asyncio.create_task(scheduler_loop())
+        log_event("Pianificatore dei programmi avviato", "INFO")
         
         # Avvia il task per il retry della connessione WiFi
         retry_wifi_task = asyncio.create_task(retry_client_connection())
@@ -129,6 +124,7 @@ async def main():
     except Exception as e:
         log_event(f"Errore critico nel main: {e}", "ERROR")
         print(f"Errore critico: {e}")
+        flush_logs(force=True)
         # In caso di errore grave, attendere 10 secondi e riavviare il sistema
         time.sleep(10)
         machine.reset()
@@ -151,6 +147,7 @@ def start():
         asyncio.run(main())
     except Exception as e:
         print(f"Errore nell'avvio del main: {e}")
+        flush_logs(force=True)
         # Attendi 10 secondi e riavvia
         time.sleep(10)
         import machine
@@ -0,0 +1,145 @@
+"""
+Modulo con l'indice compilato dei programmi.
+Ogni programma viene compilato una sola volta, al caricamento o al salvataggio, in un record
+con la maschera dei mesi (12 bit), il minuto del giorno di attivazione, l'intervallo della
+cadenza e il giorno dell'ultima esecuzione: le verifiche di pianificazione diventano
+operazioni tra interi, senza dizionari né conversioni di stringhe.
+"""
+import time
+from date_utils import days_from_civil, civil_from_days, date_to_days
+
+MONTH_NUMBERS = {
+    "Gennaio": 1, "Febbraio": 2, "Marzo": 3, "Aprile": 4,
+    "Maggio": 5, "Giugno": 6, "Luglio": 7, "Agosto": 8,
+    "Settembre": 9, "Ottobre": 10, "Novembre": 11, "Dicembre": 12
+}
+
+SECONDS_PER_DAY = 86400
+MAX_LOOKAHEAD_DAYS = 400  # Giorni esaminati per trovare la prossima attivazione
+
+class CompiledProgram:
+    """Dati di pianificazione di un programma, in sola lettura"""
+    __slots__ = ('id', 'month_mask', 'minute', 'interval', 'last_run_day')
+
+    def __init__(self, program_id, month_mask, minute, interval, last_run_day):
+        self.id = program_id
+        self.month_mask = month_mask      # Bit (mese - 1) impostato se il programma è attivo nel mese
+        self.minute = minute              # Minuto del giorno dell'attivazione (0-1439)
+        self.interval = interval          # Giorni tra due esecuzioni
+        self.last_run_day = last_run_day  # Giorno dell'ultima esecuzione dal 1970-01-01, None se mai eseguito
+
+    def is_due(self, day, month):
+        """
+        Verifica se il programma è previsto nel giorno indicato.
+
+        Args:
+            day: Giorno dal 1970-01-01
+            month: Mese del giorno (1-12)
+        """
+        if not self.month_mask & (1 << (month - 1)):
+            return False
+        return self.last_run_day is None or day - self.last_run_day >= self.interval
+
+def _recurrence_interval(program):
+    """Restituisce i giorni tra due esecuzioni, None se la cadenza non è valida"""
+    recurrence = program.get('recurrence', 'giornaliero')
+    if recurrence == 'giornaliero':
+        return 1
+    if recurrence == 'giorni_alterni':
+        return 2
+    if recurrence == 'personalizzata':
+        try:
+            interval = int(program.get('interval_days', 1))
+        except (TypeError, ValueError):
+            interval = 1
+        return interval if interval > 0 else 1  # Fallback sicuro
+    return None
+
+def compile_program(program_id, program, last_run_day=None):
+    """
+    Compila un programma per la pianificazione.
+
+    Args:
+        program_id: ID del programma
+        program: Configurazione del programma
+        last_run_day: Giorno dell'ultima esecuzione (dallo storico); se None viene usato
+            il campo last_run_date dei programmi salvati nel formato precedente
+
+    Returns:
+        CompiledProgram: Record compilato, None se il programma non ha attivazioni automatiche
+        (orario, mesi o cadenza mancanti o non validi)
+    """
+    try:
+        hour, minute = [int(x) for x in program.get('activation_time', '').split(':')]
+    except (ValueError, AttributeError):
+        return None
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        return None
+    month_mask = 0
+    for month in program.get('months', []):
+        number = MONTH_NUMBERS.get(month)
+        if number:
+            month_mask |= 1 << (number - 1)
+    interval = _recurrence_interval(program)
+    if not month_mask or interval is None:
+        return None
+    if last_run_day is None:
+        last_run_date = program.get('last_run_date')
+        last_run_day = date_to_days(last_run_date) if last_run_date else None
+    return CompiledProgram(
+        str(program_id),
+        month_mask,
+        hour * 60 + minute,
+        interval,
+        last_run_day
+    )
+
+def compile_programs(programs, last_run_day=None):
+    """
+    Compila tutti i programmi.
+
+    Args:
+        programs: Dizionario dei programmi
+        last_run_day: Funzione id -> giorno dell'ultima esecuzione (None se mai eseguito)
+
+    Returns:
+        dict: Id del programma -> CompiledProgram (solo i programmi pianificabili)
+    """
+    index = {}
+    for program_id, program in programs.items():
+        compiled = compile_program(program_id, program, last_run_day(program_id) if last_run_day else None)
+        if compiled is not None:
+            index[compiled.id] = compiled
+    return index
+
+def next_fire_time(compiled, now, grace=0):
+    """
+    Calcola il prossimo orario di attivazione di un programma compilato.
+
+    Args:
+        compiled: CompiledProgram
+        now: Timestamp attuale (ora locale)
+        grace: Secondi per cui un'attivazione di oggi già passata è ancora valida
+
+    Returns:
+        int: Timestamp dell'attivazione, None se non ci sono attivazioni future
+    """
+    t = time.localtime(now)
+    today = days_from_civil(t[0], t[1], t[2])
+    midnight = now - (t[3] * 3600 + t[4] * 60 + t[5])
+    month = t[1]
+    day = today
+    while day - today < MAX_LOOKAHEAD_DAYS:
+        if not compiled.month_mask & (1 << (month - 1)):
+            # Salta direttamente al primo giorno del mese successivo
+            year, month, _ = civil_from_days(day)
+            next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+            day = days_from_civil(next_year, next_month, 1)
+            month = next_month
+            continue
+        fire = midnight + (day - today) * SECONDS_PER_DAY + compiled.minute * 60
+        if fire >= now - grace and compiled.is_due(day, month):
+            return fire
+        day += 1
+        month = civil_from_days(day)[1]
+    return None
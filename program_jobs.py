@@ -0,0 +1,123 @@
+"""
+Modulo per l'esecuzione dei programmi avviati manualmente come attività in background.
+
+L'avvio di un programma crea un'attività (job) con un id e ritorna subito: l'esecuzione
+prosegue in un task asincrono e lo stato di avanzamento (passo, zona, tempo trascorso e
+rimanente) si legge con get_job_status. Dopo la fine vengono conservate solo le ultime
+MAX_FINISHED_JOBS attività, senza il programma.
+"""
+import time
+import uasyncio as asyncio
+from program_manager import execute_program
+from program_state import runtime_state
+from settings_manager import get_settings_model
+from program_plan import plan_program, plan_duration
+from log_manager import log_event
+from run_history import OUTCOME_ERROR
+
+MAX_FINISHED_JOBS = 8  # Attività terminate conservate per la lettura dello stato
+
+# Stati di un'attività; al termine lo stato diventa l'esito dell'esecuzione (run_history.OUTCOME_*)
+JOB_PENDING = 'pending'    # In attesa dell'avvio del task
+JOB_RUNNING = 'running'    # Programma in esecuzione
+JOB_REJECTED = 'rejected'  # Non avviato: un altro programma era già in esecuzione
+
+class ProgramJob:
+    """Esecuzione in background di un programma"""
+    __slots__ = ('id', 'program_id', 'program_name', 'state', 'created_at', 'finished_at',
+                 'step_count', 'planned_seconds')
+
+    def __init__(self, job_id, program):
+        self.id = job_id
+        self.program_id = str(program.get('id', '0'))
+        self.program_name = program.get('name', 'Senza nome')
+        self.state = JOB_PENDING
+        self.created_at = time.time()
+        self.finished_at = None
+        self.step_count = len(program.get('steps', []))
+        # Durata prevista, per il tempo rimanente prima dell'avvio del task
+        model = get_settings_model()
+        self.planned_seconds = plan_duration(plan_program(program, model.max_active_zones, model.activation_delay * 60))
+
+    def is_active(self):
+        return self.state in (JOB_PENDING, JOB_RUNNING)
+
+    def to_dict(self):
+        now = time.time()
+        status = {
+            'job_id': self.id,
+            'program_id': self.program_id,
+            'program_name': self.program_name,
+            'state': self.state,
+            'step_count': self.step_count,
+            'current_step': None,
+            'zone_ids': [],
+            'elapsed': (self.finished_at or now) - self.created_at,
+            'remaining': 0
+        }
+        if self.state == JOB_RUNNING and runtime_state.is_running(self.program_id):
+            step_index = runtime_state.step_index
+            status['current_step'] = step_index + 1 if step_index is not None else None
+            status['zone_ids'] = list(runtime_state.zone_ids)
+            status['remaining'] = max(runtime_state.planned_end - now, 0)
+        elif self.state == JOB_PENDING:
+            status['remaining'] = self.planned_seconds
+        return status
+
+_jobs = {}
+_next_job_id = 1
+
+def _prune_finished_jobs():
+    finished = [job_id for job_id, job in _jobs.items() if not job.is_active()]
+    finished.sort()
+    for job_id in finished[:-MAX_FINISHED_JOBS]:
+        del _jobs[job_id]
+
+async def _run_job(job, program):
+    job.state = JOB_RUNNING
+    try:
+        outcome = await execute_program(program, manual=True)
+    except Exception as e:
+        log_event(f"Errore durante l'esecuzione dell'attività {job.id}: {e}", "ERROR")
+        outcome = OUTCOME_ERROR
+    job.state = outcome or JOB_REJECTED
+    job.finished_at = time.time()
+    _prune_finished_jobs()
+    log_event(f"Attività {job.id} (programma {job.program_id}) terminata: {job.state}", "DEBUG")
+
+def get_active_job():
+    """Restituisce l'attività in attesa o in esecuzione, None se non ce ne sono"""
+    for job in _jobs.values():
+        if job.is_active():
+            return job
+    return None
+
+def submit_program(program):
+    """
+    Avvia un programma manualmente in background.
+
+    Args:
+        program: Programma da eseguire
+
+    Returns:
+        tuple: (job_id, error_message); job_id è None se il programma non è stato avviato
+    """
+    global _next_job_id
+    if runtime_state.running or get_active_job() is not None:
+        return None, 'Un altro programma è già in esecuzione'
+    job = ProgramJob(_next_job_id, program)
+    _next_job_id += 1
+    _jobs[job.id] = job
+    asyncio.create_task(_run_job(job, program))
+    log_event(f"Programma {job.program_name} avviato manualmente (attività {job.id})", "INFO")
+    return job.id, ''
+
+def get_job_status(job_id):
+    """
+    Restituisce lo stato di avanzamento di un'attività.
+
+    Returns:
+        dict: Stato dell'attività, None se l'id non esiste (o l'attività è troppo vecchia)
+    """
+    job = _jobs.get(job_id)
+    return job.to_dict() if job is not None else None
@@ -2,44 +2,190 @@
 Modulo per la gestione dei programmi di irrigazione.
 Gestisce il caricamento, la creazione, l'aggiornamento e l'esecuzione dei programmi.
 """
-import ujson
 import time
 import uasyncio as asyncio
 from zone_manager import start_zone, stop_zone, stop_all_zones, get_active_zones_count
-from program_state import program_running, current_program_id, save_program_state, load_program_state
-from settings_manager import load_user_settings, save_user_settings
+from program_state import runtime_state, load_program_state
+from settings_manager import save_user_settings, get_settings_model, subscribe_factory_reset
 from log_manager import log_event
+from kv_store import get_store, import_json_file
+from program_index import compile_programs
+from program_plan import plan_program, plan_duration
+import run_history
 
-PROGRAM_STATE_FILE = '/data/program_state.json'
-PROGRAM_FILE = '/data/program.json'
+PROGRAM_KEY_PREFIX = 'programs:'  # Ogni programma è salvato nella chiave "programs:<id>"
+PROGRAMS_KEY = 'programs'          # Formato precedente (tutti i programmi in una chiave), importato
+PROGRAM_FILE = '/data/program.json'  # Formato precedente, importato nell'archivio dati
 
-def load_programs():
+# Programmi in memoria (id -> programma), caricati dall'archivio al primo utilizzo
+_programs = None
+# Incrementato ad ogni modifica dei programmi: permette di riconoscere i dati già elaborati
+_programs_generation = 0
+
+# Funzioni chiamate dopo ogni salvataggio dei programmi (es. il pianificatore)
+_program_subscribers = []
+
+# Indice compilato dei programmi (vedi program_index) e generazioni (programmi, storico)
+# da cui è stato calcolato
+_program_index = None
+_program_index_generation = None
+
+def subscribe_programs(callback):
     """
-    Carica i programmi dal file.
-    
+    Registra una funzione senza argomenti da chiamare dopo ogni modifica dei programmi.
+    La funzione deve terminare subito: le operazioni lunghe vanno delegate a un task.
+    """
+    if callback not in _program_subscribers:
+        _program_subscribers.append(callback)
+
+def get_programs_generation():
+    """
+    Restituisce il numero di generazione dei programmi, che cambia ad ogni modifica.
+    Chi ha già elaborato i programmi di una generazione può saltare il lavoro.
+    """
+    return _programs_generation
+
+def get_program_index():
+    """
+    Restituisce l'indice compilato dei programmi pianificabili, ricompilandolo solo
+    quando sono cambiati i programmi o lo storico delle esecuzioni. L'indice è
+    condiviso: non va modificato.
+
+    Returns:
+        dict: Id del programma -> CompiledProgram
+    """
+    global _program_index, _program_index_generation
+    programs = _get_programs()
+    generation = (_programs_generation, run_history.get_history_generation())
+    if _program_index_generation != generation:
+        _program_index = compile_programs(programs, run_history.get_last_run_day)
+        _program_index_generation = generation
+    return _program_index
+
+def _notify_programs_changed():
+    global _programs_generation
+    _programs_generation += 1
+    for callback in _program_subscribers:
+        try:
+            callback()
+        except Exception as e:
+            log_event(f"Errore durante la notifica della modifica dei programmi: {e}", "ERROR")
+
+def _import_legacy_programs(store):
+    """
+    Converte i programmi del formato precedente (chiave unica o file program.json)
+    in una chiave per programma, con un'unica transazione.
+
     Returns:
-        dict: Dizionario dei programmi
+        dict: Programmi importati, None se non c'era nulla da importare
     """
+    programs = store.get(PROGRAMS_KEY)
+    if programs is None:
+        programs = import_json_file(PROGRAMS_KEY, PROGRAM_FILE)
+    if programs is None:
+        return None
+    with store.transaction() as txn:
+        for prog_id, program in programs.items():
+            txn.put(PROGRAM_KEY_PREFIX + str(prog_id), program)
+        txn.delete(PROGRAMS_KEY)
+    log_event(f"Programmi convertiti in una chiave per programma ({len(programs)})", "INFO")
+    return programs
+
+def _reset_programs(store, txn):
+    """Elimina tutti i programmi nella transazione del ripristino dei dati di fabbrica"""
+    for key in store.keys(PROGRAM_KEY_PREFIX):
+        txn.delete(key)
+    if store.contains(PROGRAMS_KEY):
+        txn.delete(PROGRAMS_KEY)
+
+subscribe_factory_reset(_reset_programs)
+
+def _get_programs():
+    """Restituisce i programmi in memoria, caricandoli dall'archivio al primo utilizzo"""
+    global _programs
+    if _programs is not None:
+        return _programs
+    programs = {}
     try:
-        with open(PROGRAM_FILE, 'r') as f:
-            programs = ujson.load(f)
-            # Assicura che tutti gli ID siano stringhe
-            for prog_id in list(programs.keys()):
-                if programs[prog_id].get('id') is None:
-                    programs[prog_id]['id'] = str(prog_id)
-            return programs
-    except OSError:
-        log_event("File program.json non trovato, creazione file vuoto", "WARNING")
-        empty_programs = {}
-        save_programs(empty_programs)
-        return empty_programs
+        store = get_store()
+        keys = store.keys(PROGRAM_KEY_PREFIX)
+        if keys:
+            for key in keys:
+                programs[key[len(PROGRAM_KEY_PREFIX):]] = store.get(key)
+        else:
+            programs = _import_legacy_programs(store)
+            if programs is None:
+                log_event("Nessun programma salvato, elenco vuoto", "INFO")
+                programs = {}
+        # Assicura che tutti gli ID siano stringhe
+        for prog_id, program in programs.items():
+            if program.get('id') is None:
+                program['id'] = str(prog_id)
     except Exception as e:
         log_event(f"Errore durante il caricamento dei programmi: {e}", "ERROR")
-        return {}
+        # Non memorizzato: il caricamento sarà ritentato alla prossima richiesta
+        return programs
+    _programs = programs
+    return _programs
+
+def reload_programs():
+    """
+    Scarta i programmi in memoria, da chiamare quando l'archivio è stato modificato
+    senza passare da questo modulo (es. ripristino dei dati di fabbrica).
+    """
+    global _programs
+    _programs = None
+    _notify_programs_changed()
+
+def load_programs():
+    """
+    Restituisce tutti i programmi, senza accessi alla flash dopo il primo caricamento.
+    I programmi sono condivisi con la cache: vanno modificati solo tramite
+    save_program, delete_program o save_programs.
+    
+    Returns:
+        dict: Dizionario dei programmi (copia dell'elenco, modificabile)
+    """
+    return dict(_get_programs())
+
+def get_program(program_id):
+    """
+    Restituisce un programma dalla cache.
+
+    Args:
+        program_id: ID del programma
+
+    Returns:
+        dict: Programma (da non modificare), None se non esiste
+    """
+    return _get_programs().get(str(program_id))
+
+def save_program(program):
+    """
+    Salva un solo programma (nuovo o modificato) con una scrittura della sola sua chiave.
+
+    Args:
+        program: Programma da salvare, con il campo 'id'
+
+    Returns:
+        boolean: True se l'operazione è riuscita, False altrimenti
+    """
+    program_id = str(program['id'])
+    programs = _get_programs()
+    try:
+        get_store().put(PROGRAM_KEY_PREFIX + program_id, program)
+    except OSError as e:
+        log_event(f"Errore durante il salvataggio del programma {program_id}: {e}", "ERROR")
+        return False
+    programs[program_id] = program
+    log_event(f"Programma {program_id} salvato", "DEBUG")
+    _notify_programs_changed()
+    return True
 
 def save_programs(programs):
     """
-    Salva i programmi su file.
+    Sostituisce l'intero elenco dei programmi, scrivendo in un'unica transazione solo
+    i programmi aggiunti, modificati o eliminati rispetto a quelli in memoria.
     
     Args:
         programs: Dizionario dei programmi da salvare
@@ -47,15 +193,28 @@ def save_programs(programs):
     Returns:
         boolean: True se l'operazione è riuscita, False altrimenti
     """
+    global _programs
+    current = _get_programs()
+    programs = {str(prog_id): program for prog_id, program in programs.items()}
     try:
-        with open(PROGRAM_FILE, 'w') as f:
-            ujson.dump(programs, f)
-        log_event("Programmi salvati con successo", "INFO")
-        return True
+        changed = 0
+        with get_store().transaction() as txn:
+            for prog_id, program in programs.items():
+                if current.get(prog_id) != program:
+                    txn.put(PROGRAM_KEY_PREFIX + prog_id, program)
+                    changed += 1
+            for prog_id in current:
+                if prog_id not in programs:
+                    txn.delete(PROGRAM_KEY_PREFIX + prog_id)
+                    changed += 1
     except OSError as e:
         log_event(f"Errore durante il salvataggio dei programmi: {e}", "ERROR")
-        print(f"Errore durante il salvataggio dei programmi: {e}")
         return False
+    if changed:
+        _programs = programs
+        log_event(f"Programmi salvati con successo ({changed} modificati)", "DEBUG")
+        _notify_programs_changed()
+    return True
 
 def check_program_conflicts(program, programs, exclude_id=None):
     """
@@ -96,7 +255,7 @@ def update_program(program_id, updated_program):
         tuple: (success, error_message)
     """
     program_id = str(program_id)  # Assicura che l'ID sia una stringa
-    programs = load_programs()
+    programs = _get_programs()
     
     # Verifica conflitti (escludi il programma che stiamo aggiornando)
     has_conflict, conflict_message = check_program_conflicts(updated_program, programs, exclude_id=program_id)
@@ -106,11 +265,11 @@ def update_program(program_id, updated_program):
     
     if program_id in programs:
         # Se il programma è in esecuzione, fermalo prima di aggiornarlo
-        if program_running and current_program_id == program_id:
+        if runtime_state.is_running(program_id):
             stop_program()
             
-        programs[program_id] = updated_program
-        if save_programs(programs):
+        updated_program['id'] = program_id
+        if save_program(updated_program):
             log_event(f"Programma {program_id} aggiornato con successo", "INFO")
             return True, ""
         else:
@@ -120,7 +279,6 @@ def update_program(program_id, updated_program):
     else:
         error_msg = f"Errore: Programma con ID {program_id} non trovato."
         log_event(error_msg, "ERROR")
-        print(error_msg)
         return False, error_msg
 
 def delete_program(program_id):
@@ -134,80 +292,47 @@ def delete_program(program_id):
         boolean: True se l'operazione è riuscita, False altrimenti
     """
     program_id = str(program_id)  # Assicura che l'ID sia una stringa
-    programs = load_programs()
+    programs = _get_programs()
     
     if program_id in programs:
         # Se il programma è in esecuzione, fermalo prima di eliminarlo
-        if program_running and current_program_id == program_id:
+        if runtime_state.is_running(program_id):
             stop_program()
             
-        del programs[program_id]
-        if save_programs(programs):
-            log_event(f"Programma {program_id} eliminato con successo", "INFO")
-            return True
-        else:
-            log_event(f"Errore durante l'eliminazione del programma {program_id}", "ERROR")
+        try:
+            get_store().delete(PROGRAM_KEY_PREFIX + program_id)
+        except OSError as e:
+            log_event(f"Errore durante l'eliminazione del programma {program_id}: {e}", "ERROR")
             return False
+        del programs[program_id]
+        _notify_programs_changed()
+        log_event(f"Programma {program_id} eliminato con successo", "INFO")
+        return True
     else:
         error_msg = f"Errore: Programma con ID {program_id} non trovato."
         log_event(error_msg, "ERROR")
-        print(error_msg)
         return False
 
-def is_program_active_in_current_month(program):
+async def _wait_unless_cancelled(cancel_event, seconds):
     """
-    Controlla se il programma è attivo nel mese corrente.
-    
-    Args:
-        program: Programma da verificare
-        
-    Returns:
-        boolean: True se il programma è attivo nel mese corrente, False altrimenti
-    """
-    current_month = time.localtime()[1]
-    months_map = {
-        "Gennaio": 1, "Febbraio": 2, "Marzo": 3, "Aprile": 4,
-        "Maggio": 5, "Giugno": 6, "Luglio": 7, "Agosto": 8,
-        "Settembre": 9, "Ottobre": 10, "Novembre": 11, "Dicembre": 12
-    }
-    program_months = [months_map[month] for month in program.get('months', []) if month in months_map]
-    return current_month in program_months
+    Attende seconds secondi senza risvegli intermedi, terminando subito se il programma
+    viene interrotto.
 
-def is_program_due_today(program):
-    """
-    Verifica se il programma è previsto per oggi in base alla cadenza.
-    
     Args:
-        program: Programma da verificare
-        
+        cancel_event: Evento di interruzione del programma (runtime_state.cancel_event)
+        seconds: Secondi di attesa
+
     Returns:
-        boolean: True se il programma è previsto per oggi, False altrimenti
+        boolean: True se l'attesa è terminata, False se il programma è stato interrotto
     """
-    current_day_of_year = time.localtime()[7]
-    last_run_day = -1
-
-    if 'last_run_date' in program:
-        try:
-            last_run_date = program['last_run_date']
-            year, month, day = map(int, last_run_date.split('-'))
-            last_run_day = time.localtime(time.mktime((year, month, day, 0, 0, 0, 0, 0)))[7]
-        except Exception as e:
-            log_event(f"Errore nella conversione della data di esecuzione: {e}", "ERROR")
-            print(f"Errore nella conversione della data di esecuzione: {e}")
-
-    recurrence = program.get('recurrence', 'giornaliero')
-    
-    if recurrence == 'giornaliero':
-        return last_run_day != current_day_of_year
-    elif recurrence == 'giorni_alterni':
-        # Esegui ogni 2 giorni
-        return (current_day_of_year - last_run_day) >= 2
-    elif recurrence == 'personalizzata':
-        interval_days = program.get('interval_days', 1)
-        if interval_days <= 0:
-            interval_days = 1  # Fallback sicuro
-        return (current_day_of_year - last_run_day) >= interval_days
-    
+    if cancel_event.is_set():
+        return False
+    if seconds <= 0:
+        return True
+    try:
+        await asyncio.wait_for(cancel_event.wait(), seconds)
+    except asyncio.TimeoutError:
+        return True
     return False
 
 async def execute_program(program, manual=False):
@@ -219,17 +344,12 @@ async def execute_program(program, manual=False):
         manual: Flag che indica se l'esecuzione è manuale
         
     Returns:
-        boolean: True se l'esecuzione è completata con successo, False altrimenti
+        str: Esito dell'esecuzione (run_history.OUTCOME_*), None se il programma non è
+        stato avviato perché un altro programma è in esecuzione
     """
-    global program_running, current_program_id
-    
-    # Importazione locale per evitare importazioni circolari
-    from program_state import program_running, current_program_id, save_program_state
-    
-    if program_running:
-        log_event(f"Impossibile eseguire il programma: un altro programma è già in esecuzione ({current_program_id})", "WARNING")
-        print(f"Un altro programma è già in esecuzione: {current_program_id}.")
-        return False
+    if runtime_state.running:
+        log_event(f"Impossibile eseguire il programma: un altro programma è già in esecuzione ({runtime_state.program_id})", "WARNING")
+        return None
 
     # Se è un programma automatico, prima arresta tutte le zone manuali
     # I programmi automatici hanno priorità come richiesto nel prompt
@@ -244,74 +364,83 @@ async def execute_program(program, manual=False):
     stop_all_zones()
 
     program_id = str(program.get('id', '0'))  # Assicura che l'ID sia una stringa
-    
-    program_running = True
-    current_program_id = program_id
-    save_program_state()
-    
     program_name = program.get('name', 'Senza nome')
+    start_time = time.time()
+    # Passi eseguiti, per lo storico: [zone_id, secondi effettivi di irrigazione]
+    executed_steps = []
+    # Indice in plan -> (ticks dell'accensione, posizione in executed_steps)
+    active = {}
+    outcome = run_history.OUTCOME_ERROR
+    
+    runtime_state.start(program_id)
+    # Evento di questa esecuzione: un programma avviato dopo ne crea uno nuovo
+    cancel_event = runtime_state.cancel_event
     log_event(f"Avvio del programma: {program_name} (ID: {program_id})", "INFO")
-
-    settings = load_user_settings()
-    activation_delay = settings.get('activation_delay', 0)
     
+    # Da qui in poi ogni errore, anche nel calcolo della sequenza, passa dal blocco finally
+    # che riporta lo stato a "nessun programma in esecuzione"
     try:
-        for i, step in enumerate(program.get('steps', [])):
-            if not program_running:
+        model = get_settings_model()
+        activation_delay = model.activation_delay
+        # Orari di accensione e spegnimento delle zone (vedi program_plan)
+        plan = plan_program(program, model.max_active_zones, activation_delay * 60)
+        runtime_state.set_planned_end(plan_duration(plan))
+        events = []  # (secondi dall'avvio, 0 spegnimento / 1 accensione, indice in plan)
+        for n, entry in enumerate(plan):
+            events.append((entry[0], 1, n))
+            events.append((entry[1], 0, n))
+        # A parità di orario gli spegnimenti precedono le accensioni (limite di zone attive)
+        events.sort()
+        program_start = time.ticks_ms()
+
+        for offset, switch_on, n in events:
+            # Attende l'orario dell'evento, o fino all'interruzione del programma
+            elapsed = time.ticks_diff(time.ticks_ms(), program_start) / 1000
+            if not await _wait_unless_cancelled(cancel_event, offset - elapsed):
                 log_event("Programma interrotto dall'utente.", "INFO")
-                print("Programma interrotto dall'utente.")
                 break
 
-            zone_id = step.get('zone_id')
-            duration = step.get('duration', 1)
-            
-            if zone_id is None:
-                log_event(f"Errore nel passo {i+1}: zone_id mancante", "ERROR")
+            _, _, zone_id, i = plan[n]
+            duration = program['steps'][i].get('duration', 1)
+            if not switch_on:
+                if n in active:
+                    step_start, k = active.pop(n)
+                    stop_zone(zone_id)
+                    executed_steps[k][1] = time.ticks_diff(time.ticks_ms(), step_start) // 1000
+                    log_event(f"Zona {zone_id} completata.", "DEBUG")
+                    runtime_state.set_step(runtime_state.step_index, [plan[m][2] for m in active])
                 continue
-                
-            log_event(f"Attivazione della zona {zone_id} per {duration} minuti.", "INFO")
-            print(f"Attivazione della zona {zone_id} per {duration} minuti.")
+
+            log_event(f"Attivazione della zona {zone_id} per {duration} minuti.", "DEBUG")
             
-            # Avvia la zona
-            result = start_zone(zone_id, duration)
+            # Avvia la zona (consentito durante il programma in esecuzione)
+            result = start_zone(zone_id, duration, from_program=True)
             if not result:
                 log_event(f"Errore nell'attivazione della zona {zone_id}", "ERROR")
                 continue
-                
-            # Aspetta per la durata specificata
-            for _ in range(duration * 60):
-                if not program_running:
-                    break
-                await asyncio.sleep(1)
-            
-            if not program_running:
-                break
-                
-            # Ferma la zona
-            stop_zone(zone_id)
-            log_event(f"Zona {zone_id} completata.", "INFO")
-            print(f"Zona {zone_id} completata.")
-
-            # Applica il ritardo di attivazione tra le zone
-            if activation_delay > 0 and i < len(program.get('steps', [])) - 1:
-                log_event(f"Attesa di {activation_delay} minuti prima della prossima zona.", "INFO")
-                for _ in range(activation_delay * 60):
-                    if not program_running:
-                        break
-                    await asyncio.sleep(1)
+            active[n] = (time.ticks_ms(), len(executed_steps))
+            executed_steps.append([zone_id, 0])
+            runtime_state.set_step(i, [plan[m][2] for m in active])
+
+        # Durata delle zone ancora accese al momento dell'interruzione
+        for step_start, k in active.values():
+            executed_steps[k][1] = time.ticks_diff(time.ticks_ms(), step_start) // 1000
         
-        update_last_run_date(program_id)
-        log_event(f"Programma {program_name} completato", "INFO")
-        return True
+        if not cancel_event.is_set():
+            outcome = run_history.OUTCOME_COMPLETED
+            log_event(f"Programma {program_name} completato", "INFO")
+        else:
+            outcome = run_history.OUTCOME_STOPPED
+        return outcome
     except Exception as e:
         log_event(f"Errore durante l'esecuzione del programma {program_name}: {e}", "ERROR")
-        print(f"Errore durante l'esecuzione del programma: {e}")
-        return False
+        return outcome
     finally:
-        program_running = False
-        current_program_id = None
-        save_program_state()
-        stop_all_zones()  # Assicurati che tutte le zone siano disattivate
+        # Se il programma è stato interrotto lo stato è già stato aggiornato da stop_program
+        if not cancel_event.is_set():
+            runtime_state.finish()
+            stop_all_zones()  # Assicurati che tutte le zone siano disattivate
+        run_history.record_run(program_id, start_time, time.time(), executed_steps, outcome)
 
 def stop_program():
     """
@@ -320,20 +449,12 @@ def stop_program():
     Returns:
         boolean: True se l'operazione è riuscita, False altrimenti
     """
-    global program_running, current_program_id
-    
-    # Importazione locale per evitare importazioni circolari
-    from program_state import program_running, current_program_id, save_program_state
-    
-    if not program_running:
+    if not runtime_state.running:
         log_event("Nessun programma in esecuzione da interrompere", "INFO")
         return False
         
-    log_event(f"Interruzione del programma {current_program_id} in corso.", "INFO")
-    print("Interruzione del programma in corso.")
-    program_running = False
-    current_program_id = None
-    save_program_state()  # Assicurati che lo stato venga salvato correttamente
+    log_event(f"Interruzione del programma {runtime_state.program_id} in corso.", "INFO")
+    runtime_state.finish()
 
     # Aggiungi il codice per fermare tutte le zone attualmente attive
     stop_all_zones()
@@ -342,67 +463,11 @@ def stop_program():
 
 def reset_program_state():
     """
-    Resetta lo stato del programma.
+    Resetta lo stato del programma all'avvio, segnalando un programma rimasto
+    interrotto dal riavvio.
     """
-    global program_running, current_program_id
-    
-    # Importazione locale per evitare importazioni circolari
-    from program_state import program_running, current_program_id, save_program_state
-    
-    program_running = False
-    current_program_id = None
-    save_program_state()
+    saved_state = load_program_state()
+    if saved_state and saved_state.get('program_running'):
+        log_event(f"Il programma {saved_state.get('current_program_id')} è stato interrotto da un riavvio", "WARNING")
+    runtime_state.finish()
     log_event("Stato del programma resettato", "INFO")
-
-async def check_programs():
-    """
-    Controlla se ci sono programmi da eseguire automaticamente.
-    Deve essere chiamato periodicamente.
-    """
-    # Carica le impostazioni per verificare se i programmi automatici sono abilitati
-    settings = load_user_settings()
-    if not settings.get('automatic_programs_enabled', False):
-        return
-
-    programs = load_programs()
-    if not programs:
-        return
-        
-    current_time_str = time.strftime('%H:%M', time.localtime())
-
-    for program_id, program in programs.items():
-        activation_time = program.get('activation_time', '')
-        
-        # Verifica se il programma deve essere eseguito
-        if (current_time_str == activation_time and
-            is_program_active_in_current_month(program) and
-            is_program_due_today(program)):
-            
-            log_event(f"Avvio del programma pianificato: {program.get('name', 'Senza nome')}", "INFO")
-            print(f"Avvio del programma pianificato: {program.get('name', 'Senza nome')}")
-            
-            # Se c'è già un programma in esecuzione, non fare nulla
-            if program_running:
-                log_event("Impossibile avviare il programma: un altro programma è già in esecuzione", "WARNING")
-                continue
-                
-            # Avvia il programma
-            success = await execute_program(program)
-            if success:
-                update_last_run_date(program_id)
-
-def update_last_run_date(program_id):
-    """
-    Aggiorna la data dell'ultima esecuzione del programma.
-    
-    Args:
-        program_id: ID del programma
-    """
-    program_id = str(program_id)  # Assicura che l'ID sia una stringa
-    current_date = time.strftime('%Y-%m-%d', time.localtime())
-    programs = load_programs()
-    
-    if program_id in programs:
-        programs[program_id]['last_run_date'] = current_date
-        save_programs(programs)
-        log_event(f"Data ultima esecuzione aggiornata per il programma {program_id}: {current_date}", "INFO")
\ No newline at end of file
@@ -0,0 +1,109 @@
+"""
+Modulo per il calcolo della sequenza di accensioni di un programma.
+
+I passi di un programma sono divisi in fasi eseguite una dopo l'altra, con l'attesa di
+attivazione tra la fine di una fase e l'inizio della successiva. Dentro una fase le zone
+vengono accese insieme fino a max_active_zones, distanziando ogni accensione di almeno
+activation_delay dalla precedente; quando una zona termina parte la successiva in attesa.
+
+Il campo 'concurrency' del programma sceglie le fasi:
+- 'sequenziale' (predefinito): ogni passo è una fase, una zona alla volta
+- 'gruppi': i passi con lo stesso campo 'group' formano una fase, nell'ordine in cui
+  compare il primo passo del gruppo (i passi senza gruppo restano fasi singole)
+- 'automatica': tutti i passi in un'unica fase, impacchettati fino a max_active_zones
+"""
+
+CONCURRENCY_SEQUENTIAL = 'sequenziale'
+CONCURRENCY_GROUPS = 'gruppi'
+CONCURRENCY_AUTO = 'automatica'
+CONCURRENCY_MODES = (CONCURRENCY_SEQUENTIAL, CONCURRENCY_GROUPS, CONCURRENCY_AUTO)
+
+def validate_concurrency(program):
+    """
+    Verifica i campi 'concurrency' del programma e 'group' dei passi.
+
+    Returns:
+        str: Messaggio di errore, stringa vuota se i campi sono validi
+    """
+    concurrency = program.get('concurrency', CONCURRENCY_SEQUENTIAL)
+    if concurrency not in CONCURRENCY_MODES:
+        return f"Modalità di esecuzione non valida: {concurrency}"
+    for step in program.get('steps', []):
+        group = step.get('group')
+        if group is not None and (not isinstance(group, int) or group < 1):
+            return f"Gruppo non valido per la zona {step.get('zone_id')}"
+    return ''
+
+def _stages(steps, concurrency):
+    """Divide gli indici dei passi in fasi"""
+    indexes = range(len(steps))
+    if concurrency == CONCURRENCY_AUTO:
+        return [list(indexes)]
+    if concurrency != CONCURRENCY_GROUPS:
+        return [[i] for i in indexes]
+    stages = []
+    groups = {}
+    for i in indexes:
+        group = steps[i].get('group')
+        if group is None:
+            stages.append([i])
+        elif group in groups:
+            groups[group].append(i)
+        else:
+            groups[group] = [i]
+            stages.append(groups[group])
+    return stages
+
+def plan_program(program, max_active_zones, activation_delay):
+    """
+    Calcola gli orari di accensione e spegnimento delle zone di un programma.
+
+    Args:
+        program: Programma (campi 'steps' e 'concurrency')
+        max_active_zones: Numero massimo di zone accese insieme
+        activation_delay: Secondi di attesa tra due accensioni e tra due fasi
+
+    Returns:
+        list: Elenco di (inizio, fine, zone_id, indice del passo), in secondi dall'avvio
+        del programma e ordinato per inizio; i passi senza zone_id sono esclusi
+    """
+    steps = program.get('steps', [])
+    concurrency = program.get('concurrency', CONCURRENCY_SEQUENTIAL)
+    max_active_zones = max(1, max_active_zones)
+    plan = []
+    stage_start = 0
+    for stage in _stages(steps, concurrency):
+        stage_steps = [i for i in stage if steps[i].get('zone_id') is not None]
+        if not stage_steps:
+            continue
+        if plan:
+            stage_start += activation_delay
+        running = []  # (fine, zone_id) delle zone accese in questa fase
+        last_on = None
+        stage_end = stage_start
+        for i in stage_steps:
+            zone_id = steps[i]['zone_id']
+            start = stage_start if last_on is None else last_on + activation_delay
+            while True:
+                running = [entry for entry in running if entry[0] > start]
+                # La stessa zona non può essere accesa due volte insieme
+                busy = [end for end, running_zone in running if running_zone == zone_id]
+                if busy:
+                    start = max(busy)
+                elif len(running) >= max_active_zones:
+                    # Attende che si liberi la prima zona
+                    start = min([end for end, _ in running])
+                else:
+                    break
+            end = start + steps[i].get('duration', 1) * 60
+            running.append((end, zone_id))
+            last_on = start
+            stage_end = max(stage_end, end)
+            plan.append((start, end, zone_id, i))
+        stage_start = stage_end
+    plan.sort()
+    return plan
+
+def plan_duration(plan):
+    """Restituisce la durata totale in secondi di una sequenza calcolata con plan_program"""
+    return max([entry[1] for entry in plan]) if plan else 0
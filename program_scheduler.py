@@ -0,0 +1,133 @@
+"""
+Modulo per la pianificazione dei programmi automatici.
+
+Per ogni programma viene calcolato una sola volta il prossimo orario di attivazione; gli orari
+sono tenuti in una coda di priorità (heap) e il task del pianificatore dorme esattamente fino
+al primo. La coda viene ricalcolata solo quando cambiano i programmi, lo storico delle esecuzioni,
+le impostazioni o l'orologio di sistema.
+"""
+import time
+import uheapq as heapq
+import uasyncio as asyncio
+from program_manager import get_program, get_program_index, execute_program, subscribe_programs
+from program_index import next_fire_time
+from program_state import runtime_state
+from run_history import subscribe_runs
+from settings_manager import get_settings_model, subscribe_settings
+from log_manager import log_event
+
+MISSED_RUN_GRACE = 300         # Ritardo massimo (secondi) con cui un'attivazione viene ancora eseguita
+# Secondi massimi di attesa: un cambio d'orologio (es. NTP) viene notato prima che
+# un'attivazione diventata dovuta superi MISSED_RUN_GRACE e venga saltata
+SCHEDULER_MAX_SLEEP = MISSED_RUN_GRACE // 2
+CLOCK_JUMP_THRESHOLD = 60      # Differenza (secondi) oltre la quale l'orologio è considerato cambiato
+
+# Coda delle attivazioni: (orario, id del programma)
+_queue = []
+_dirty = True
+_wake = asyncio.Event()
+# Differenza tra orologio di sistema e contatore interno al momento del calcolo della coda
+_clock_offset = None
+# Id del programma -> ultima attivazione già gestita (eseguita o saltata): un ricalcolo della
+# coda non la ripropone, qualunque sia stato l'esito. Un programma terminato da un errore
+# viene ritentato alla prossima attivazione.
+_dispatched = {}
+
+def _rebuild_queue(now):
+    """Ricalcola la coda delle attivazioni di tutti i programmi"""
+    global _queue, _dirty, _clock_offset, _dispatched
+    _dirty = False
+    _clock_offset = now - time.ticks_ms() // 1000
+    queue = []
+    index = get_program_index()
+    _dispatched = {program_id: fire for program_id, fire in _dispatched.items() if program_id in index}
+    if get_settings_model().automatic_programs_enabled:
+        for program_id, compiled in index.items():
+            fire = next_fire_time(compiled, now, MISSED_RUN_GRACE)
+            dispatched = _dispatched.get(program_id)
+            if fire is not None and dispatched is not None and fire <= dispatched:
+                fire = next_fire_time(compiled, dispatched + 60)
+            if fire is not None:
+                heapq.heappush(queue, (fire, program_id))
+    _queue = queue
+    if queue:
+        t = time.localtime(queue[0][0])
+        log_event(f"Prossima attivazione pianificata: programma {queue[0][1]} il {t[0]}-{t[1]:02d}-{t[2]:02d} alle {t[3]:02d}:{t[4]:02d}", "DEBUG")
+
+def reschedule():
+    """
+    Richiede il ricalcolo della coda (programmi, impostazioni o orologio modificati).
+    Chi imposta l'orologio di sistema può chiamarla per non attendere SCHEDULER_MAX_SLEEP.
+    """
+    global _dirty
+    _dirty = True
+    _wake.set()
+
+def _on_settings_changed(previous, current):
+    if previous.automatic_programs_enabled != current.automatic_programs_enabled:
+        reschedule()
+
+def _clock_changed(now):
+    """Verifica se l'orologio di sistema è stato spostato (es. sincronizzazione NTP)"""
+    if _clock_offset is None:
+        return False
+    return abs(now - time.ticks_ms() // 1000 - _clock_offset) > CLOCK_JUMP_THRESHOLD
+
+async def _sleep_until(delay):
+    """Attende delay secondi o fino a una richiesta di ricalcolo"""
+    try:
+        await asyncio.wait_for(_wake.wait(), delay)
+    except asyncio.TimeoutError:
+        pass
+    _wake.clear()
+
+async def _run_due(program_id, fire, now):
+    """Esegue un programma la cui attivazione è arrivata"""
+    program = get_program(program_id)
+    if program is None:
+        return
+    if now - fire > MISSED_RUN_GRACE:
+        log_event(f"Attivazione del programma {program_id} saltata: ritardo di {now - fire} secondi", "WARNING")
+        return
+    if runtime_state.running:
+        log_event("Impossibile avviare il programma: un altro programma è già in esecuzione", "WARNING")
+        return
+    log_event(f"Avvio del programma pianificato: {program.get('name', 'Senza nome')}", "INFO")
+    # execute_program registra l'esecuzione nello storico, che a sua volta ricalcola la coda
+    await execute_program(program)
+
+async def scheduler_loop():
+    """
+    Task asincrono che avvia i programmi automatici all'orario previsto.
+    """
+    global _dirty
+    subscribe_programs(reschedule)
+    subscribe_runs(reschedule)
+    subscribe_settings(_on_settings_changed)
+    while True:
+        try:
+            now = time.time()
+            if _dirty or _clock_changed(now):
+                _rebuild_queue(now)
+
+            if not _queue:
+                await _sleep_until(SCHEDULER_MAX_SLEEP)
+                continue
+
+            fire, program_id = _queue[0]
+            if fire > now:
+                await _sleep_until(min(fire - now, SCHEDULER_MAX_SLEEP))
+                continue
+
+            heapq.heappop(_queue)
+            _dispatched[program_id] = fire
+            await _run_due(program_id, fire, now)
+            # Anche se il programma non è stato eseguito, la prossima attivazione è dopo questa
+            compiled = get_program_index().get(program_id)
+            next_fire = next_fire_time(compiled, fire + 60) if compiled else None
+            if next_fire is not None and not _dirty:
+                heapq.heappush(_queue, (next_fire, program_id))
+        except Exception as e:
+            log_event(f"Errore durante la pianificazione dei programmi: {e}", "ERROR")
+            _dirty = True
+            await asyncio.sleep(60)
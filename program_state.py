@@ -1,46 +1,136 @@
 """
 Modulo per la gestione dello stato del programma.
-Contiene variabili globali e funzioni per gestire lo stato di esecuzione dei programmi.
+Lo stato di esecuzione dei programmi è mantenuto in memoria nell'oggetto runtime_state,
+condiviso da tutti i moduli: va importato l'oggetto (from program_state import runtime_state)
+e letti i suoi attributi, mai copiati i valori in variabili del modulo.
+
+L'interruzione di un programma è segnalata anche dall'evento cancel_event, su cui
+l'esecuzione attende la fine di ogni passo: stop_program la risveglia subito, senza
+che il programma debba controllare lo stato ogni secondo.
+
+Lo stato viene salvato nell'archivio dati solo all'avvio e alla fine di un programma, per
+riconoscere dopo un riavvio un programma rimasto interrotto.
 """
-import ujson
+import time
+import uasyncio as asyncio
 from log_manager import log_event
+from kv_store import get_store, import_json_file
+from settings_manager import subscribe_factory_reset
+
+PROGRAM_STATE_KEY = 'program_state'
+PROGRAM_STATE_FILE = '/data/program_state.json'  # Formato precedente, importato nell'archivio dati
+
+class ProgramRuntimeState:
+    """Stato di esecuzione dei programmi, letto senza accessi alla flash"""
+    __slots__ = ('running', 'program_id', 'started_at', 'cancel_event',
+                 'step_index', 'zone_ids', 'planned_end', '_persisted')
+
+    def __init__(self):
+        self.running = False
+        self.program_id = None
+        self.started_at = 0
+        # Impostato alla fine del programma; ogni avvio ne crea uno nuovo
+        self.cancel_event = asyncio.Event()
+        self._clear_step()
+        # Ultimo stato salvato (running, program_id), per evitare scritture inutili
+        self._persisted = None
+
+    def is_running(self, program_id=None):
+        """
+        Verifica se è in esecuzione un programma (o il programma indicato).
+
+        Args:
+            program_id: ID del programma, None per qualsiasi programma
+        """
+        return self.running and (program_id is None or self.program_id == str(program_id))
+
+    def start(self, program_id):
+        """Registra l'avvio di un programma e lo salva per il recupero dopo un riavvio"""
+        self.running = True
+        self.program_id = str(program_id)
+        self.started_at = time.time()
+        self.cancel_event = asyncio.Event()
+        self._clear_step()
+        self.persist()
+
+    def finish(self):
+        """Registra la fine (o l'interruzione) del programma in esecuzione"""
+        self.cancel_event.set()
+        self.running = False
+        self.program_id = None
+        self.started_at = 0
+        self._clear_step()
+        self.persist()
+
+    def _clear_step(self):
+        self.step_index = None
+        self.zone_ids = ()
+        self.planned_end = 0
 
-# Variabili globali per gestire lo stato del programma
-program_running = False
-current_program_id = None
-PROGRAM_STATE_FILE = '/data/program_state.json'
+    def set_planned_end(self, seconds):
+        """Registra la durata prevista del programma, in secondi da adesso"""
+        self.planned_end = time.time() + seconds
+
+    def set_step(self, step_index, zone_ids):
+        """
+        Registra l'avanzamento del programma (solo in memoria, per lo stato di avanzamento).
+
+        Args:
+            step_index: Indice dell'ultimo passo avviato (da 0)
+            zone_ids: Zone accese dal programma, vuoto durante le attese
+        """
+        self.step_index = step_index
+        self.zone_ids = tuple(zone_ids)
+
+    def to_dict(self):
+        return {
+            'program_running': self.running,
+            'current_program_id': self.program_id
+        }
+
+    def persist(self):
+        """Salva lo stato nell'archivio dati, solo se è cambiato dall'ultimo salvataggio"""
+        state = (self.running, self.program_id)
+        if state == self._persisted:
+            return
+        try:
+            get_store().put(PROGRAM_STATE_KEY, self.to_dict())
+            self._persisted = state
+            log_event(f"Stato del programma salvato: program_running={self.running}, current_program_id={self.program_id}", "DEBUG")
+        except OSError as e:
+            log_event(f"Errore durante il salvataggio dello stato del programma: {e}", "ERROR")
+
+# Stato condiviso da tutti i moduli
+runtime_state = ProgramRuntimeState()
+
+def _reset_program_state(store, txn):
+    """Salva lo stato "nessun programma in esecuzione" nel ripristino dei dati di fabbrica"""
+    txn.put(PROGRAM_STATE_KEY, ProgramRuntimeState().to_dict())
+
+subscribe_factory_reset(_reset_program_state)
 
 def save_program_state():
     """
-    Salva lo stato attuale del programma in esecuzione su file.
+    Salva lo stato attuale del programma in esecuzione nell'archivio dati.
     """
-    try:
-        with open(PROGRAM_STATE_FILE, 'w') as f:
-            ujson.dump({
-                'program_running': program_running, 
-                'current_program_id': current_program_id
-            }, f)
-        print(f"Stato del programma salvato: program_running={program_running}, current_program_id={current_program_id}")
-    except OSError as e:
-        log_event(f"Errore durante il salvataggio dello stato del programma: {e}", "ERROR")
-        print(f"Errore durante il salvataggio dello stato del programma: {e}")
+    runtime_state.persist()
 
 def load_program_state():
     """
-    Carica lo stato del programma dal file.
-    Aggiorna le variabili globali program_running e current_program_id.
+    Legge lo stato salvato prima del riavvio. Da chiamare solo all'avvio del sistema:
+    durante il funzionamento lo stato in memoria è l'unico valido.
+
+    Returns:
+        dict: Stato salvato, None se non presente o non valido
     """
-    global program_running, current_program_id
     try:
-        with open(PROGRAM_STATE_FILE, 'r') as f:
-            state = ujson.load(f)
-            program_running = state.get('program_running', False)
-            current_program_id = state.get('current_program_id', None)
-            print(f"Stato del programma caricato: program_running={program_running}, current_program_id={current_program_id}")
+        state = get_store().get(PROGRAM_STATE_KEY)
+        if state is None:
+            state = import_json_file(PROGRAM_STATE_KEY, PROGRAM_STATE_FILE)
+        if isinstance(state, dict):
+            runtime_state._persisted = (state.get('program_running', False), state.get('current_program_id'))
+            return state
     except (OSError, ValueError):
-        # Resetta lo stato se il file non esiste, è vuoto o c'è un errore
-        log_event("Nessuno stato salvato trovato o stato non valido, avvio da zero", "INFO")
-        print("Nessuno stato salvato trovato o stato non valido, avvio da zero.")
-        program_running = False
-        current_program_id = None
-        save_program_state()  # Salva il nuovo stato inizializzato
\ No newline at end of file
+        pass
+    log_event("Nessuno stato salvato trovato o stato non valido, avvio da zero", "INFO")
+    return None
@@ -0,0 +1,208 @@
+"""
+Modulo per lo storico delle esecuzioni dei programmi.
+
+Ogni esecuzione terminata aggiunge una riga JSON in fondo al registro RUN_HISTORY_FILE:
+id del programma, inizio, fine, durata effettiva di ogni passo ed esito. La configurazione
+dei programmi non viene più riscritta ad ogni esecuzione.
+
+In memoria viene tenuto solo l'indice dell'ultima esecuzione di ogni programma, ricostruito
+all'avvio rileggendo il registro. Superati RUN_HISTORY_MAX_BYTES il registro diventa
+RUN_HISTORY_OLD_FILE (sostituendo il precedente) e il nuovo registro inizia con una riga
+di riepilogo che contiene l'indice, così le ultime esecuzioni non vanno mai perse.
+"""
+import ujson
+import uos
+import time
+import flash_io
+from log_manager import log_event
+from date_utils import days_from_civil
+
+RUN_HISTORY_FILE = '/data/run_history.jsonl'
+RUN_HISTORY_OLD_FILE = '/data/run_history.1.jsonl'
+RUN_HISTORY_MAX_BYTES = 8192  # Dimensione oltre la quale il registro viene ruotato
+
+# Esiti di un'esecuzione
+OUTCOME_COMPLETED = 'completed'  # Tutti i passi eseguiti
+OUTCOME_STOPPED = 'stopped'      # Interrotto dall'utente o da un altro programma
+OUTCOME_ERROR = 'error'          # Terminato da un errore
+
+DEFAULT_HISTORY_LIMIT = 20
+MAX_HISTORY_LIMIT = 100
+
+# Id del programma -> (inizio, fine, esito) dell'ultima esecuzione; None finché non viene letto il registro
+_last_runs = None
+# Cambia ad ogni esecuzione registrata e quando lo storico viene cancellato
+_history_generation = 0
+# Funzioni chiamate dopo ogni esecuzione registrata (es. il pianificatore)
+_run_subscribers = []
+
+def subscribe_runs(callback):
+    """
+    Registra una funzione senza argomenti da chiamare dopo ogni esecuzione registrata.
+    La funzione deve terminare subito: le operazioni lunghe vanno delegate a un task.
+    """
+    if callback not in _run_subscribers:
+        _run_subscribers.append(callback)
+
+def get_history_generation():
+    return _history_generation
+
+def _notify_runs():
+    global _history_generation
+    _history_generation += 1
+    for callback in _run_subscribers:
+        try:
+            callback()
+        except Exception as e:
+            log_event(f"Errore durante la notifica dello storico dei programmi: {e}", "ERROR")
+
+def _iter_file_records(path):
+    """Restituisce i record di un file del registro, saltando le righe non valide"""
+    try:
+        f = open(path, 'r')
+    except OSError:
+        return
+    with f:
+        for line in f:
+            try:
+                record = ujson.loads(line)
+            except ValueError:
+                # Riga incompleta: scrittura interrotta da una mancanza di corrente
+                continue
+            if isinstance(record, dict):
+                yield record
+
+def _iter_records():
+    """Restituisce tutti i record, dal più vecchio al più recente"""
+    for path in (RUN_HISTORY_OLD_FILE, RUN_HISTORY_FILE):
+        for record in _iter_file_records(path):
+            yield record
+
+def _index_record(last_runs, record):
+    if 'last_runs' in record:
+        # Riga di riepilogo all'inizio di un registro ruotato
+        for program_id, run in record['last_runs'].items():
+            last_runs[program_id] = tuple(run)
+    elif 'program_id' in record and record.get('outcome') != OUTCOME_ERROR:
+        # Un programma terminato da un errore verrà ritentato alla prossima attivazione
+        last_runs[record['program_id']] = (record.get('start'), record.get('end'), record.get('outcome'))
+
+def _get_last_runs():
+    global _last_runs
+    if _last_runs is None:
+        last_runs = {}
+        for record in _iter_records():
+            _index_record(last_runs, record)
+        _last_runs = last_runs
+    return _last_runs
+
+def _rotate():
+    """Sposta il registro in RUN_HISTORY_OLD_FILE e ne inizia uno nuovo con il riepilogo"""
+    try:
+        flash_io.remove(RUN_HISTORY_OLD_FILE, 'run_history')
+    except OSError:
+        pass
+    flash_io.rename(RUN_HISTORY_FILE, RUN_HISTORY_OLD_FILE, 'run_history')
+    with flash_io.open_write(RUN_HISTORY_FILE, 'w', 'run_history') as f:
+        f.write(ujson.dumps({'last_runs': _get_last_runs()}) + '\n')
+
+def record_run(program_id, start, end, steps, outcome):
+    """
+    Aggiunge un'esecuzione al registro e aggiorna l'indice delle ultime esecuzioni.
+
+    Args:
+        program_id: ID del programma
+        start: Timestamp di inizio
+        end: Timestamp di fine
+        steps: Lista di [zone_id, secondi effettivi di irrigazione]
+        outcome: OUTCOME_COMPLETED, OUTCOME_STOPPED o OUTCOME_ERROR
+    """
+    program_id = str(program_id)
+    record = {'program_id': program_id, 'start': start, 'end': end, 'steps': steps, 'outcome': outcome}
+    last_runs = _get_last_runs()
+    try:
+        try:
+            size = uos.stat(RUN_HISTORY_FILE)[6]
+        except OSError:
+            size = 0
+        if size >= RUN_HISTORY_MAX_BYTES:
+            _rotate()
+            size = None
+        with flash_io.open_write(RUN_HISTORY_FILE, 'a', 'run_history', size) as f:
+            f.write(ujson.dumps(record) + '\n')
+    except OSError as e:
+        log_event(f"Errore durante il salvataggio dello storico del programma {program_id}: {e}", "ERROR")
+    # L'indice in memoria viene aggiornato anche se la scrittura non è riuscita
+    _index_record(last_runs, record)
+    _notify_runs()
+
+def _format_timestamp(timestamp):
+    t = time.localtime(timestamp)
+    return f"{t[0]}-{t[1]:02d}-{t[2]:02d} {t[3]:02d}:{t[4]:02d}:{t[5]:02d}"
+
+def get_last_run_day(program_id):
+    """
+    Restituisce il giorno (dal 1970-01-01) dell'inizio dell'ultima esecuzione valida.
+
+    Returns:
+        int: Giorno dell'ultima esecuzione, None se il programma non è mai stato eseguito
+    """
+    run = _get_last_runs().get(str(program_id))
+    if run is None or run[0] is None:
+        return None
+    t = time.localtime(run[0])
+    return days_from_civil(t[0], t[1], t[2])
+
+def get_last_run_date(program_id):
+    """Restituisce la data (YYYY-MM-DD) dell'ultima esecuzione valida, None se mai eseguito"""
+    run = _get_last_runs().get(str(program_id))
+    if run is None or run[0] is None:
+        return None
+    return _format_timestamp(run[0])[:10]
+
+def query_history(program_id=None, offset=0, limit=DEFAULT_HISTORY_LIMIT):
+    """
+    Restituisce le esecuzioni registrate, dalla più recente.
+
+    Args:
+        program_id: ID del programma, None per tutti
+        offset: Numero di esecuzioni recenti da saltare
+        limit: Numero massimo di esecuzioni restituite (al massimo MAX_HISTORY_LIMIT)
+
+    Returns:
+        dict: {'runs': [...], 'total': numero di esecuzioni corrispondenti}
+    """
+    limit = max(1, min(limit, MAX_HISTORY_LIMIT))
+    offset = max(0, offset)
+    keep = offset + limit
+    if program_id is not None:
+        program_id = str(program_id)
+    # Vengono tenute in memoria solo le ultime offset + limit esecuzioni lette
+    runs = []
+    total = 0
+    for record in _iter_records():
+        if 'program_id' not in record:
+            continue
+        if program_id is not None and record['program_id'] != program_id:
+            continue
+        total += 1
+        runs.append(record)
+        if len(runs) > keep:
+            runs.pop(0)
+    runs.reverse()
+    runs = runs[offset:keep]
+    for run in runs:
+        run['start_time'] = _format_timestamp(run['start']) if run.get('start') is not None else None
+        run['end_time'] = _format_timestamp(run['end']) if run.get('end') is not None else None
+    return {'runs': runs, 'total': total}
+
+def clear_history():
+    """Elimina lo storico delle esecuzioni (ripristino dei dati di fabbrica)"""
+    global _last_runs
+    for path in (RUN_HISTORY_FILE, RUN_HISTORY_OLD_FILE):
+        try:
+            flash_io.remove(path, 'run_history')
+        except OSError:
+            pass
+    _last_runs = {}
+    _notify_runs()
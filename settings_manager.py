@@ -1,11 +1,33 @@
 """
 Modulo per la gestione delle impostazioni utente.
 Gestisce il caricamento, salvataggio e ripristino delle impostazioni utente.
+
+Le impostazioni vengono lette dalla flash una sola volta e mantenute in memoria:
+load_user_settings restituisce sempre lo stesso dizionario finché non viene chiamata
+save_user_settings (usata anche dalle funzioni di ripristino). Ogni salvataggio
+incrementa un numero di generazione (get_settings_generation) che permette ai moduli
+di riutilizzare i valori calcolati a partire dalle impostazioni finché non cambiano.
+
+Le impostazioni sono salvate nell'archivio dati (kv_store) con la chiave "settings"; il
+vecchio file user_settings.json viene importato al primo avvio. save_user_settings_async
+accorpa in un'unica scrittura i salvataggi ravvicinati (entro SETTINGS_SAVE_DELAY_MS).
+
+Per i percorsi frequenti get_settings_model restituisce le impostazioni compilate in un
+modello validato (SettingsModel, con le zone come record ZoneConfig indicizzati per id),
+ricalcolato solo quando cambia la generazione. I moduli che dipendono dalle impostazioni
+si registrano con subscribe_settings e ricevono il modello precedente e quello nuovo ad
+ogni modifica, per riconfigurare solo ciò che è cambiato.
 """
 import ujson
 import uos
 import gc
+import time
+import ubinascii
+import uasyncio as asyncio
 from log_manager import log_event
+from kv_store import get_store
+from run_history import clear_history
+import flash_io
 
 # Configurazione predefinita
 FACTORY_SETTINGS = {
@@ -29,6 +51,58 @@ FACTORY_SETTINGS = {
     "max_zone_duration": 180  # 3 ore in minuti
 }
 
+SETTINGS_KEY = 'settings'
+# File del formato precedente, importati nell'archivio dati al primo avvio
+USER_SETTINGS_FILE = '/data/user_settings.json'
+USER_SETTINGS_TEMP_FILE = '/data/user_settings.json.tmp'
+CHECKSUM_PREFIX = '#crc32:'  # Prima riga del file: CRC32 del JSON che segue
+SETTINGS_SAVE_DELAY_MS = 500  # Attesa dopo l'ultima modifica prima della scrittura accorpata
+
+# Sottosistema da riconfigurare quando cambia ciascuna impostazione
+# Impostazioni intere -> valore minimo ammesso (il predefinito è in FACTORY_SETTINGS)
+INT_SETTINGS = {
+    'max_active_zones': 1,
+    'max_zone_duration': 1,
+    'activation_delay': 0
+}
+BOOL_SETTINGS = ('automatic_programs_enabled', 'client_enabled')
+MAX_PIN = 40  # Numero di GPIO più alto accettato (lo stesso limite della pagina delle impostazioni)
+
+SETTINGS_SUBSYSTEMS = {
+    'zones': 'zones',
+    'safety_relay': 'zones',
+    'max_active_zones': 'zones',
+    'max_zone_duration': 'zones',
+    'wifi': 'wifi',
+    'ap': 'wifi',
+    'client_enabled': 'wifi',
+    'automatic_programs_enabled': 'scheduler',
+    'activation_delay': 'scheduler',
+    'log_sinks': 'logging'
+}
+
+# Impostazioni in memoria e numero di generazione, incrementato ad ogni salvataggio
+_settings_cache = None
+_settings_generation = 0
+
+# Salvataggio accorpato in attesa di essere scritto
+_pending_save = None
+_pending_deadline = 0
+
+# Modello compilato delle impostazioni, valido per la generazione che contiene
+_settings_model = None
+
+# Funzioni chiamate ad ogni modifica delle impostazioni: callback(precedente, nuovo)
+_subscribers = []
+# Funzioni dei moduli che salvano dati nell'archivio, chiamate dal ripristino dei dati di fabbrica
+_factory_resetters = []
+
+class _SaveBatch:
+    """Gruppo di salvataggi accorpati in un'unica scrittura su flash"""
+    def __init__(self):
+        self.done = asyncio.Event()
+        self.result = False
+
 def ensure_directory_exists(path):
     """
     Crea la directory se non esiste
@@ -52,9 +126,65 @@ def ensure_directory_exists(path):
     except Exception as e:
         print(f"Errore nella creazione della directory {path}: {e}")
 
-def load_user_settings():
+def _factory_settings():
+    """Restituisce una copia completa (anche dei dizionari annidati) delle impostazioni di fabbrica"""
+    return ujson.loads(ujson.dumps(FACTORY_SETTINGS))
+
+def _parse_settings_file(path):
     """
-    Carica le impostazioni da user_settings.json, garantendo valori di default se mancano.
+    Legge e verifica un file di impostazioni.
+    Sono accettati anche i file del vecchio formato, senza riga di checksum.
+
+    Raises:
+        OSError: Se il file non può essere letto
+        ValueError: Se il checksum non corrisponde o il JSON non è valido
+    """
+    with open(path, 'r') as f:
+        data = f.read()
+    if data.startswith(CHECKSUM_PREFIX):
+        header, _, data = data.partition('\n')
+        if int(header[len(CHECKSUM_PREFIX):], 16) != ubinascii.crc32(data.encode()) & 0xFFFFFFFF:
+            raise ValueError("checksum non valido")
+    settings = ujson.loads(data)
+    if not isinstance(settings, dict):
+        raise ValueError("il contenuto non è un oggetto JSON")
+    return settings
+
+def _import_legacy_settings():
+    """
+    Importa nell'archivio dati le impostazioni dei file user_settings.json, compreso
+    il file temporaneo di una scrittura interrotta prima del rename.
+
+    Returns:
+        dict: Impostazioni importate, None se non ci sono file validi
+    """
+    for path in (USER_SETTINGS_FILE, USER_SETTINGS_TEMP_FILE):
+        try:
+            settings = _parse_settings_file(path)
+        except (OSError, ValueError):
+            continue
+        get_store().put(SETTINGS_KEY, settings)
+        for old_path in (USER_SETTINGS_FILE, USER_SETTINGS_TEMP_FILE):
+            try:
+                flash_io.remove(old_path, 'settings')
+            except OSError:
+                pass
+        log_event(f"Impostazioni utente importate da {path} nell'archivio dati", "INFO")
+        return settings
+    return None
+
+def _write_settings(settings):
+    """
+    Scrive le impostazioni nell'archivio dati.
+
+    Raises:
+        OSError: Se la scrittura non riesce
+    """
+    get_store().put(SETTINGS_KEY, settings)
+
+def _read_user_settings():
+    """
+    Legge le impostazioni dall'archivio dati, garantendo valori di default se mancano.
     
     Returns:
         dict: Impostazioni utente
@@ -62,33 +192,275 @@ def load_user_settings():
     ensure_directory_exists('/data')
     
     try:
-        with open('/data/user_settings.json', 'r') as f:
-            settings = ujson.load(f)
-            
-            # Garantisce che tutte le chiavi necessarie siano presenti
-            settings.setdefault('zones', FACTORY_SETTINGS['zones'])
-            settings.setdefault('max_active_zones', 3)
-            settings.setdefault('activation_delay', 5)
-            settings.setdefault('safety_relay', {"pin": 13})
-            settings.setdefault('ap', {"ssid": "IrrigationSystem", "password": "12345678"})
-            settings.setdefault('wifi', {"ssid": "", "password": ""})
-            settings.setdefault('automatic_programs_enabled', False)
-            settings.setdefault('client_enabled', False)
-            settings.setdefault('max_zone_duration', 180)  # 3 ore in minuti
-            
-            return settings
+        settings = get_store().get(SETTINGS_KEY)
+        if settings is None:
+            settings = _import_legacy_settings()
     except (OSError, ValueError) as e:
         log_event(f"Errore durante il caricamento delle impostazioni utente: {e}", "ERROR")
-        print(f"Errore durante il caricamento delle impostazioni utente: {e}")
+        settings = None
+    if not isinstance(settings, dict):
+        log_event("Impostazioni utente non trovate, ripristino delle impostazioni di fabbrica", "WARNING")
         
-        # Crea un nuovo file con le impostazioni di fabbrica
+        # Salva le impostazioni di fabbrica
         factory_reset()
         
-        return FACTORY_SETTINGS.copy()
+        return _factory_settings()
+
+    # Garantisce che tutte le chiavi necessarie siano presenti
+    settings.setdefault('zones', FACTORY_SETTINGS['zones'])
+    settings.setdefault('max_active_zones', 3)
+    settings.setdefault('activation_delay', 5)
+    settings.setdefault('safety_relay', {"pin": 13})
+    settings.setdefault('ap', {"ssid": "IrrigationSystem", "password": "12345678"})
+    settings.setdefault('wifi', {"ssid": "", "password": ""})
+    settings.setdefault('automatic_programs_enabled', False)
+    settings.setdefault('client_enabled', False)
+    settings.setdefault('max_zone_duration', 180)  # 3 ore in minuti
+    if isinstance(settings['safety_relay'], dict):
+        settings['safety_relay'].setdefault('pin', 13)
+    
+    return settings
+
+def load_user_settings():
+    """
+    Restituisce le impostazioni utente, leggendole dalla flash solo al primo utilizzo.
+    Il dizionario restituito è condiviso: non va modificato. Per cambiare le impostazioni
+    usare copy_user_settings e poi save_user_settings.
+    
+    Returns:
+        dict: Impostazioni utente
+    """
+    global _settings_cache
+    if _settings_cache is None:
+        settings = _read_user_settings()
+        # factory_reset potrebbe aver già popolato la cache
+        if _settings_cache is None:
+            _settings_cache = settings
+    return _settings_cache
+
+def copy_user_settings():
+    """
+    Restituisce una copia modificabile delle impostazioni utente, da passare a save_user_settings.
+    
+    Returns:
+        dict: Copia completa delle impostazioni utente
+    """
+    return ujson.loads(ujson.dumps(load_user_settings()))
+
+def get_settings_generation():
+    """
+    Restituisce il numero di generazione delle impostazioni: cambia ad ogni salvataggio.
+    
+    Returns:
+        int: Numero di generazione
+    """
+    return _settings_generation
+
+class ZoneConfig:
+    """Configurazione di una zona, in sola lettura"""
+    __slots__ = ('id', 'pin', 'name', 'visible')
+
+    def __init__(self, zone_id, pin, name, visible):
+        self.id = zone_id
+        self.pin = pin
+        self.name = name
+        self.visible = visible
+
+class SettingsModel:
+    """
+    Impostazioni compilate e validate, in sola lettura.
+    I valori non validi sono sostituiti con quelli predefiniti durante la compilazione,
+    così i percorsi frequenti leggono direttamente gli attributi senza controlli.
+    """
+    __slots__ = (
+        'generation', 'zones', 'zone_list', 'visible_zones', 'max_active_zones',
+        'max_zone_duration', 'activation_delay', 'safety_relay_pin',
+        'automatic_programs_enabled', 'client_enabled', 'wifi_ssid', 'wifi_password',
+        'ap_ssid', 'ap_password', 'log_sinks'
+    )
+
+    def __init__(self, settings, generation):
+        """
+        Args:
+            settings: Dizionario delle impostazioni
+            generation: Generazione delle impostazioni da cui è compilato il modello
+        """
+        self.generation = generation
+        self.max_active_zones = _int_setting(settings, 'max_active_zones')
+        self.max_zone_duration = _int_setting(settings, 'max_zone_duration')
+        self.activation_delay = _int_setting(settings, 'activation_delay')
+        self.automatic_programs_enabled = bool(settings.get('automatic_programs_enabled', FACTORY_SETTINGS['automatic_programs_enabled']))
+        self.client_enabled = bool(settings.get('client_enabled', FACTORY_SETTINGS['client_enabled']))
+        wifi = settings.get('wifi') or {}
+        self.wifi_ssid = wifi.get('ssid') or ''
+        self.wifi_password = wifi.get('password') or ''
+        ap = settings.get('ap') or {}
+        self.ap_ssid = ap.get('ssid') or ''
+        self.ap_password = ap.get('password') or ''
+        # Configurazione dei sink dei log, interpretata da log_manager.configure_sinks
+        self.log_sinks = settings.get('log_sinks')
+
+        safety_relay = settings.get('safety_relay')
+        pin = safety_relay.get('pin') if isinstance(safety_relay, dict) else None
+        self.safety_relay_pin = pin if isinstance(pin, int) and pin >= 0 else None
+
+        zones = {}
+        zone_list = []
+        for zone in settings.get('zones') or ():
+            zone_id = zone.get('id') if isinstance(zone, dict) else None
+            if not isinstance(zone_id, int) or zone_id in zones:
+                log_event(f"Zona non valida ignorata nelle impostazioni: {zone}", "WARNING")
+                continue
+            pin = zone.get('pin')
+            config = ZoneConfig(
+                zone_id,
+                pin if isinstance(pin, int) and pin >= 0 else None,
+                str(zone.get('name') or f"Zona {zone_id + 1}"),
+                zone.get('status') == 'show'
+            )
+            zones[zone_id] = config
+            zone_list.append(config)
+        # Zone indicizzate per id, nell'ordine delle impostazioni e solo quelle visibili
+        self.zones = zones
+        self.zone_list = tuple(zone_list)
+        self.visible_zones = tuple(zone for zone in zone_list if zone.visible)
+
+def _is_valid_int_setting(key, value):
+    return not isinstance(value, bool) and isinstance(value, int) and value >= INT_SETTINGS[key]
+
+def _int_setting(settings, key):
+    """Restituisce un'impostazione intera, o il valore di fabbrica se non è valida"""
+    default = FACTORY_SETTINGS[key]
+    value = settings.get(key, default)
+    if not _is_valid_int_setting(key, value):
+        log_event(f"Impostazione '{key}' non valida ({value}): uso {default}", "WARNING")
+        return default
+    return value
+
+def _validate_setting(key, value):
+    """
+    Verifica il tipo di un'impostazione modificata da una patch.
+
+    Raises:
+        ValueError: Se il valore non è valido
+    """
+    if key in INT_SETTINGS:
+        if not _is_valid_int_setting(key, value):
+            raise ValueError(f"'{key}' deve essere un numero intero non inferiore a {INT_SETTINGS[key]}")
+    elif key in BOOL_SETTINGS:
+        if not isinstance(value, bool):
+            raise ValueError(f"'{key}' deve essere true o false")
+    elif key == 'zones':
+        if not isinstance(value, list):
+            raise ValueError("'zones' deve essere una lista")
+        for zone in value:
+            if not isinstance(zone, dict):
+                raise ValueError(f"Zona non valida: {zone}")
+            _validate_pin(zone.get('pin'), f"della zona {zone.get('id')}")
+    elif key == 'safety_relay':
+        if isinstance(value, dict):
+            _validate_pin(value.get('pin'), "del relè di sicurezza")
+
+def _validate_pin(pin, owner):
+    """Verifica un numero di pin (None se assente); owner descrive il pin nel messaggio di errore"""
+    if pin is None:
+        return
+    if isinstance(pin, bool) or not isinstance(pin, int) or not 0 <= pin <= MAX_PIN:
+        raise ValueError(f"Pin {owner} non valido: deve essere un numero intero tra 0 e {MAX_PIN}")
+
+def get_settings_model():
+    """
+    Restituisce il modello compilato delle impostazioni, ricompilato solo dopo un salvataggio.
+    Il modello è condiviso: non va modificato.
+
+    Returns:
+        SettingsModel: Impostazioni compilate
+    """
+    global _settings_model
+    settings = load_user_settings()
+    if _settings_model is None or _settings_model.generation != _settings_generation:
+        _settings_model = SettingsModel(settings, _settings_generation)
+    return _settings_model
+
+def _normalize_settings(settings):
+    """Completa le impostazioni con le chiavi mancanti e i campi obbligatori delle zone"""
+    # Assicurati che tutte le chiavi siano presenti
+    for key, value in FACTORY_SETTINGS.items():
+        if key not in settings:
+            settings[key] = value
+            
+    # Validazione delle zone
+    if 'zones' in settings:
+        for i, zone in enumerate(settings['zones']):
+            if 'id' not in zone:
+                zone['id'] = i
+            if 'status' not in zone:
+                zone['status'] = 'show'
+            if 'pin' not in zone:
+                zone['pin'] = 14 + i
+            if 'name' not in zone:
+                zone['name'] = f"Zona {i+1}"
+
+def subscribe_settings(callback):
+    """
+    Registra una funzione da chiamare ad ogni modifica delle impostazioni.
+    La funzione riceve (modello precedente, modello nuovo) e deve terminare subito:
+    le operazioni lunghe vanno delegate a un task.
+
+    Args:
+        callback: Funzione callback(previous, current) con due SettingsModel
+    """
+    if callback not in _subscribers:
+        _subscribers.append(callback)
+
+def subscribe_factory_reset(callback):
+    """
+    Registra la funzione con cui un modulo ripristina i propri dati nell'archivio.
+    La funzione riceve (store, txn) e aggiunge le operazioni alla transazione del
+    ripristino, così tutti i dati vengono ripristinati insieme alle impostazioni.
+
+    Args:
+        callback: Funzione callback(store, txn)
+    """
+    if callback not in _factory_resetters:
+        _factory_resetters.append(callback)
+
+def unsubscribe_settings(callback):
+    """Rimuove una funzione registrata con subscribe_settings"""
+    if callback in _subscribers:
+        _subscribers.remove(callback)
+
+def _notify_subscribers(previous, current):
+    """Notifica la modifica delle impostazioni a tutti i moduli registrati"""
+    for callback in _subscribers:
+        try:
+            callback(previous, current)
+        except Exception as e:
+            log_event(f"Errore durante l'applicazione delle nuove impostazioni: {e}", "ERROR")
+
+def _set_cached_settings(settings):
+    """Rende settings le impostazioni condivise, incrementa la generazione e notifica i moduli"""
+    global _settings_cache, _settings_generation
+    # Senza impostazioni in memoria (primo avvio) non c'è nulla da riconfigurare
+    previous = get_settings_model() if _settings_cache is not None and _subscribers else None
+    _settings_cache = settings
+    _settings_generation += 1
+    if previous is not None:
+        _notify_subscribers(previous, get_settings_model())
+
+def _resolve_pending_save():
+    """Completa il salvataggio accorpato in attesa, superato da una scrittura immediata"""
+    global _pending_save
+    batch = _pending_save
+    if batch:
+        _pending_save = None
+        batch.result = True
+        batch.done.set()
 
 def save_user_settings(settings):
     """
-    Salva le impostazioni su user_settings.json
+    Salva le impostazioni su user_settings.json e aggiorna le impostazioni in memoria.
+    Il dizionario passato diventa quello condiviso: non va modificato dopo il salvataggio.
     
     Args:
         settings: Dizionario delle impostazioni da salvare
@@ -104,36 +476,187 @@ def save_user_settings(settings):
             log_event("Tentativo di salvare impostazioni non valide", "ERROR")
             return False
 
-        # Assicurati che tutte le chiavi siano presenti
-        for key, value in FACTORY_SETTINGS.items():
-            if key not in settings:
-                settings[key] = value
-                
-        # Validazione delle zone
-        if 'zones' in settings:
-            for i, zone in enumerate(settings['zones']):
-                if 'id' not in zone:
-                    zone['id'] = i
-                if 'status' not in zone:
-                    zone['status'] = 'show'
-                if 'pin' not in zone:
-                    zone['pin'] = 14 + i
-                if 'name' not in zone:
-                    zone['name'] = f"Zona {i+1}"
-        
-        with open('/data/user_settings.json', 'w') as f:
-            ujson.dump(settings, f)
-            log_event("Impostazioni utente salvate con successo", "INFO")
-            print("Impostazioni salvate con successo.")
+        _normalize_settings(settings)
+        _write_settings(settings)
+        _set_cached_settings(settings)
+        log_event("Impostazioni utente salvate con successo", "INFO")
+        _resolve_pending_save()
             
         # Forza garbage collection
         gc.collect()
         return True
     except OSError as e:
         log_event(f"Errore durante il salvataggio delle impostazioni utente: {e}", "ERROR")
-        print(f"Errore durante il salvataggio delle impostazioni utente: {e}")
         return False
 
+async def _write_pending_settings(batch):
+    """Task che scrive su flash il salvataggio accorpato quando non arrivano altre modifiche"""
+    global _pending_save, _settings_cache, _settings_generation
+    while True:
+        remaining = time.ticks_diff(_pending_deadline, time.ticks_ms())
+        if remaining <= 0:
+            break
+        await asyncio.sleep_ms(remaining)
+    if _pending_save is not batch:
+        # Già scritto da save_user_settings
+        return
+    _pending_save = None
+    try:
+        _write_settings(_settings_cache)
+        batch.result = True
+        log_event("Impostazioni utente salvate con successo", "INFO")
+    except OSError as e:
+        log_event(f"Errore durante il salvataggio delle impostazioni utente: {e}", "ERROR")
+        # Le impostazioni in memoria non sono state salvate: vengono rilette dalla flash
+        # e i moduli già riconfigurati con quelle non salvate tornano ai valori riletti
+        previous = get_settings_model() if _subscribers else None
+        _settings_cache = None
+        _settings_generation += 1
+        if previous is not None:
+            _notify_subscribers(previous, get_settings_model())
+    batch.done.set()
+    gc.collect()
+
+async def save_user_settings_async(settings):
+    """
+    Salva le impostazioni accorpando in un'unica scrittura su flash i salvataggi che
+    arrivano entro SETTINGS_SAVE_DELAY_MS l'uno dall'altro.
+    Le impostazioni in memoria vengono aggiornate subito; la funzione termina solo
+    quando la scrittura su flash è completata.
+    
+    Args:
+        settings: Dizionario delle impostazioni da salvare (diventa quello condiviso)
+        
+    Returns:
+        boolean: True se le impostazioni sono state salvate su flash, False altrimenti
+    """
+    global _pending_save, _pending_deadline
+    if not isinstance(settings, dict):
+        log_event("Tentativo di salvare impostazioni non valide", "ERROR")
+        return False
+    ensure_directory_exists('/data')
+    _normalize_settings(settings)
+    _set_cached_settings(settings)
+
+    batch = _pending_save
+    if batch is None:
+        batch = _SaveBatch()
+        _pending_save = batch
+        asyncio.create_task(_write_pending_settings(batch))
+    _pending_deadline = time.ticks_add(time.ticks_ms(), SETTINGS_SAVE_DELAY_MS)
+    await batch.done.wait()
+    return batch.result
+
+def _merge_patch(target, patch):
+    """
+    Applica una merge patch (RFC 7396) a un dizionario: i valori null eliminano la chiave,
+    i dizionari vengono uniti ricorsivamente e gli altri valori sostituiti.
+
+    Returns:
+        boolean: True se target è stato modificato
+    """
+    changed = False
+    for key, value in patch.items():
+        if value is None:
+            if key in target:
+                del target[key]
+                changed = True
+        elif isinstance(value, dict) and isinstance(target.get(key), dict):
+            if _merge_patch(target[key], value):
+                changed = True
+        else:
+            if isinstance(value, dict):
+                # Un nuovo dizionario non deve contenere i null della patch
+                new_value = {}
+                _merge_patch(new_value, value)
+                value = new_value
+            if key not in target or target[key] != value:
+                target[key] = value
+                changed = True
+    return changed
+
+def _patch_zones(zones, patch):
+    """
+    Applica a una lista di zone una patch indicizzata per id: {"3": {"name": "Orto"}}.
+    Un valore null elimina la zona, un id non presente la aggiunge.
+
+    Returns:
+        boolean: True se la lista è stata modificata
+
+    Raises:
+        ValueError: Se un id non è un numero intero
+    """
+    changed = False
+    for key, zone_patch in patch.items():
+        try:
+            zone_id = int(key)
+        except ValueError:
+            raise ValueError(f"Id zona non valido: {key}")
+        index = None
+        for i, zone in enumerate(zones):
+            if zone.get('id') == zone_id:
+                index = i
+                break
+        if zone_patch is None:
+            if index is not None:
+                zones.pop(index)
+                changed = True
+        elif not isinstance(zone_patch, dict):
+            raise ValueError(f"La patch della zona {zone_id} deve essere un oggetto")
+        elif index is None:
+            zone = {'id': zone_id}
+            _merge_patch(zone, zone_patch)
+            zones.append(zone)
+            changed = True
+        elif _merge_patch(zones[index], zone_patch):
+            changed = True
+    return changed
+
+async def patch_user_settings(patch):
+    """
+    Applica una modifica parziale alle impostazioni (merge patch, RFC 7396).
+    Come estensione, "zones" può essere un oggetto indicizzato per id di zona, per
+    modificare una sola zona senza inviare l'intera lista.
+    Se la patch non cambia nulla, le impostazioni non vengono scritte su flash.
+
+    Args:
+        patch: Dizionario con le modifiche
+
+    Returns:
+        dict: {'success', 'changed': chiavi modificate, 'subsystems': sottosistemi interessati}
+
+    Raises:
+        ValueError: Se la patch non è valida
+    """
+    if not isinstance(patch, dict):
+        raise ValueError("La patch deve essere un oggetto JSON")
+    settings = copy_user_settings()
+    changed = []
+    for key, value in patch.items():
+        if key == 'zones' and isinstance(value, dict):
+            zones = settings.get('zones')
+            if not isinstance(zones, list):
+                zones = []
+                settings['zones'] = zones
+            if _patch_zones(zones, value):
+                changed.append(key)
+        elif _merge_patch(settings, {key: value}):
+            changed.append(key)
+
+    if not changed:
+        return {'success': True, 'changed': [], 'subsystems': []}
+    for key in changed:
+        if key in settings:
+            _validate_setting(key, settings[key])
+
+    subsystems = []
+    for key in changed:
+        subsystem = SETTINGS_SUBSYSTEMS.get(key, 'other')
+        if subsystem not in subsystems:
+            subsystems.append(subsystem)
+    success = await save_user_settings_async(settings)
+    return {'success': success, 'changed': changed, 'subsystems': subsystems}
+
 def reset_user_settings():
     """
     Ripristina le impostazioni utente ai valori di fabbrica
@@ -142,7 +665,7 @@ def reset_user_settings():
         boolean: True se l'operazione è riuscita, False altrimenti
     """
     try:
-        save_user_settings(FACTORY_SETTINGS.copy())
+        save_user_settings(_factory_settings())
         log_event("Impostazioni utente ripristinate ai valori di fabbrica", "INFO")
         print("Impostazioni di fabbrica ripristinate.")
         return True
@@ -159,17 +682,18 @@ def reset_factory_data():
         boolean: True se l'operazione è riuscita, False altrimenti
     """
     try:
-        # Ripristina impostazioni utente
-        reset_user_settings()
-        
-        # Cancella i programmi
+        settings = _factory_settings()
         ensure_directory_exists('/data')
-        with open('/data/program.json', 'w') as f:
-            ujson.dump({}, f)
-            
-        # Cancella lo stato dei programmi
-        with open('/data/program_state.json', 'w') as f:
-            ujson.dump({"program_running": False, "current_program_id": None}, f)
+        # Le impostazioni e i dati degli altri moduli (vedi subscribe_factory_reset) vengono
+        # ripristinati insieme in un'unica transazione
+        store = get_store()
+        with store.transaction() as txn:
+            txn.put(SETTINGS_KEY, settings)
+            for callback in _factory_resetters:
+                callback(store, txn)
+        _set_cached_settings(settings)
+        _resolve_pending_save()
+        clear_history()
             
         log_event("Tutti i dati ripristinati ai valori di fabbrica", "INFO")
         print("Dati di fabbrica ripristinati.")
@@ -187,7 +711,7 @@ def factory_reset():
         boolean: True se l'operazione è riuscita, False altrimenti
     """
     try:
-        save_user_settings(FACTORY_SETTINGS.copy())
+        save_user_settings(_factory_settings())
         log_event("Impostazioni di fabbrica ripristinate", "INFO")
         print("Impostazioni di fabbrica ripristinate.")
         return True
@@ -0,0 +1,72 @@
+"""
+Test di avvio: importa main ed esegue main() fino alla creazione dei task, con rete WiFi
+e web server sostituiti da moduli fittizi. Fallisce se l'avvio termina con un errore
+(che sul dispositivo provocherebbe machine.reset() e un riavvio continuo).
+
+Da eseguire sul dispositivo, ad esempio con: mpremote run tests/smoke_main.py
+"""
+import sys
+import uasyncio as asyncio
+
+STARTUP_TIMEOUT = 5  # Secondi concessi a main() per avviare i task
+
+_started = []
+
+class _FakeModule:
+    pass
+
+async def _task(name):
+    _started.append(name)
+    while True:
+        await asyncio.sleep(1)
+
+def _fake_wifi_manager():
+    module = _FakeModule()
+    module.initialize_network = lambda: None
+    module.reset_wifi_module = lambda: None
+    module.retry_client_connection = lambda: _task('wifi')
+    return module
+
+def _fake_web_server():
+    module = _FakeModule()
+    module.start_web_server = lambda: _task('web')
+    return module
+
+# Rete e web server non vengono avviati: main li importa da questi moduli
+sys.modules['wifi_manager'] = _fake_wifi_manager()
+sys.modules['web_server'] = _fake_web_server()
+
+import main
+
+class _ResetCalled(Exception):
+    pass
+
+def _reset():
+    raise _ResetCalled()
+
+class _FakeMachine:
+    reset = staticmethod(_reset)
+
+class _FakeTime:
+    # L'attesa prima del riavvio non serve al test
+    sleep = staticmethod(lambda seconds: None)
+
+main.machine = _FakeMachine
+main.time = _FakeTime
+main.scheduler_loop = lambda: _task('scheduler')
+main.watchdog_loop = lambda: _task('watchdog')
+
+async def run():
+    try:
+        await asyncio.wait_for(main.main(), STARTUP_TIMEOUT)
+    except asyncio.TimeoutError:
+        # main() non termina mai se l'avvio è riuscito
+        pass
+    except _ResetCalled:
+        raise AssertionError("main() è terminato con un errore critico")
+    await asyncio.sleep(0)
+    for name in ('web', 'scheduler', 'wifi', 'watchdog'):
+        assert name in _started, f"Task non avviato: {name}"
+    print("Avvio completato: task", ", ".join(_started))
+
+asyncio.run(run())
@@ -135,6 +135,9 @@ function generateZonesGrid(zones) {
                 <input type="number" class="zone-duration" id="duration-${zone.id}" 
                        min="1" max="180" value="10" placeholder="Durata (minuti)" 
                        data-zone-id="${zone.id}" disabled>
+                <input type="number" class="zone-duration zone-group" id="group-${zone.id}"
+                       min="1" max="9" value="1" placeholder="Gruppo" title="Le zone dello stesso gruppo si attivano insieme"
+                       data-zone-id="${zone.id}" style="display: none;" disabled>
             </div>
         `;
         
@@ -143,10 +146,12 @@ function generateZonesGrid(zones) {
         // Aggiungi listener al checkbox
         const checkbox = zoneItem.querySelector('.zone-checkbox');
         const durationInput = zoneItem.querySelector('.zone-duration');
+        const groupInput = zoneItem.querySelector('.zone-group');
         
         checkbox.addEventListener('change', () => {
             // Abilita/disabilita l'input durata in base allo stato del checkbox
             durationInput.disabled = !checkbox.checked;
+            groupInput.disabled = !checkbox.checked;
             
             // Aggiorna la classe selected della zona
             zoneItem.classList.toggle('selected', checkbox.checked);
@@ -159,6 +164,15 @@ function generateZonesGrid(zones) {
     });
 }
 
+// Mostra il gruppo di ogni zona solo nella modalità di esecuzione per gruppi
+function toggleGroupInputs() {
+    const concurrencySelect = document.getElementById('concurrency');
+    const showGroups = concurrencySelect && concurrencySelect.value === 'gruppi';
+    document.querySelectorAll('.zone-group').forEach(input => {
+        input.style.display = showGroups ? 'block' : 'none';
+    });
+}
+
 // Mostra/nascondi l'input per i giorni personalizzati
 function toggleCustomDays() {
     const recurrenceSelect = document.getElementById('recurrence');
@@ -201,6 +215,10 @@ function loadProgramData(programId) {
                 document.getElementById('interval-days').value = program.interval_days || 3;
             }
             
+            // Modalità di esecuzione delle zone
+            document.getElementById('concurrency').value = program.concurrency || 'sequenziale';
+            toggleGroupInputs();
+            
             // Seleziona i mesi
             if (program.months && program.months.length > 0) {
                 const monthItems = document.querySelectorAll('.month-item');
@@ -219,10 +237,16 @@ function loadProgramData(programId) {
                     const checkbox = document.getElementById(`zone-${step.zone_id}`);
                     const durationInput = document.getElementById(`duration-${step.zone_id}`);
                     
+                    const groupInput = document.getElementById(`group-${step.zone_id}`);
+                    
                     if (checkbox && durationInput) {
                         checkbox.checked = true;
                         durationInput.disabled = false;
                         durationInput.value = step.duration || 10;
+                        if (groupInput) {
+                            groupInput.disabled = false;
+                            groupInput.value = step.group || 1;
+                        }
                         
                         // Seleziona anche la card della zona
                         const zoneItem = document.querySelector(`.zone-item[data-zone-id="${step.zone_id}"]`);
@@ -322,6 +346,7 @@ function saveProgram() {
     }
     
     // Raccogli le zone selezionate e le loro durate
+    const concurrency = document.getElementById('concurrency').value;
     const steps = [];
     document.querySelectorAll('.zone-checkbox:checked').forEach(checkbox => {
         const zoneId = parseInt(checkbox.dataset.zoneId);
@@ -341,10 +366,15 @@ function saveProgram() {
             return;
         }
         
-        steps.push({
+        const step = {
             zone_id: zoneId,
             duration: duration
-        });
+        };
+        // Nella modalità per gruppi le zone dello stesso gruppo si attivano insieme
+        if (concurrency === 'gruppi') {
+            step.group = parseInt(document.getElementById(`group-${zoneId}`).value) || 1;
+        }
+        steps.push(step);
     });
     
     if (steps.length === 0) {
@@ -366,6 +396,7 @@ function saveProgram() {
         activation_time: activationTime,
         recurrence: recurrence,
         months: selectedMonths,
+        concurrency: concurrency,
         steps: steps
     };
     
@@ -3,6 +3,10 @@
 // Variabili globali
 let isLoadingLogs = false;
 let autoRefreshInterval = null;
+const LOGS_PAGE_SIZE = 50;
+let loadedLogs = [];      // Log visualizzati, dal più recente al più vecchio
+let lastSeq = null;       // Numero di sequenza dell'ultimo log ricevuto
+let hasMoreLogs = false;  // Indica se esistono log più vecchi da caricare
 
 // Inizializza la pagina dei log
 function initializeLogsPage() {
@@ -14,6 +18,12 @@ function initializeLogsPage() {
     // Imposta l'aggiornamento automatico ogni 30 secondi
     startAutoRefresh();
     
+    // Ricarica da capo quando cambia il filtro per livello
+    const levelFilter = document.getElementById('log-level-filter');
+    if (levelFilter) {
+        levelFilter.addEventListener('change', loadLogs);
+    }
+    
     // Ascoltatori per la pulizia quando l'utente lascia la pagina
     window.addEventListener('pagehide', cleanupLogsPage);
 }
@@ -23,8 +33,8 @@ function startAutoRefresh() {
     // Ferma eventuali timer precedenti
     stopAutoRefresh();
     
-    // Aggiorna ogni 30 secondi
-    autoRefreshInterval = setInterval(loadLogs, 30000);
+    // Aggiorna ogni 30 secondi chiedendo solo i log più recenti
+    autoRefreshInterval = setInterval(loadNewLogs, 30000);
     console.log("Aggiornamento automatico dei log avviato");
 }
 
@@ -42,7 +52,17 @@ function cleanupLogsPage() {
     stopAutoRefresh();
 }
 
-// Carica i log dal server
+// Costruisce l'URL dell'API dei log con i filtri correnti
+function buildLogsUrl(params) {
+    const query = new URLSearchParams(params);
+    const levelFilter = document.getElementById('log-level-filter');
+    if (levelFilter && levelFilter.value) {
+        query.set('level', levelFilter.value);
+    }
+    return `/api/logs?${query.toString()}`;
+}
+
+// Carica dal server la prima pagina dei log
 function loadLogs() {
     if (isLoadingLogs) return;
     isLoadingLogs = true;
@@ -56,13 +76,16 @@ function loadLogs() {
     // Mostra l'indicatore di caricamento
     logsBody.innerHTML = `<tr><td colspan="4" class="loading">Caricamento log...</td></tr>`;
     
-    fetch('/data/system_log.json')
+    fetch(buildLogsUrl({ limit: LOGS_PAGE_SIZE }))
         .then(response => {
             if (!response.ok) throw new Error('Errore nel caricamento dei log');
             return response.json();
         })
-        .then(logs => {
-            displayLogs(logs);
+        .then(page => {
+            loadedLogs = page.logs;
+            lastSeq = page.last_seq;
+            hasMoreLogs = page.has_more;
+            displayLogs(loadedLogs);
         })
         .catch(error => {
             console.error('Errore:', error);
@@ -83,11 +106,79 @@ function loadLogs() {
         });
 }
 
+// Carica solo i log con sequenza successiva all'ultimo ricevuto e li aggiunge in cima
+function loadNewLogs() {
+    if (isLoadingLogs) return;
+    if (lastSeq === null) {
+        loadLogs();
+        return;
+    }
+    isLoadingLogs = true;
+    let needsReload = false;
+    
+    fetch(buildLogsUrl({ after_seq: lastSeq, limit: LOGS_PAGE_SIZE }))
+        .then(response => {
+            // 304: nessun nuovo log dall'ultimo aggiornamento
+            if (response.status === 304) return null;
+            if (!response.ok) throw new Error('Errore nel caricamento dei log');
+            return response.json();
+        })
+        .then(page => {
+            if (!page) return;
+            if (page.has_more || page.last_seq < lastSeq) {
+                // Troppi log nuovi o log cancellati: più semplice ricaricare la prima pagina
+                needsReload = true;
+                return;
+            }
+            lastSeq = page.last_seq;
+            if (page.logs.length > 0) {
+                loadedLogs = page.logs.concat(loadedLogs);
+                displayLogs(loadedLogs);
+            }
+        })
+        .catch(error => {
+            console.error('Errore:', error);
+        })
+        .finally(() => {
+            isLoadingLogs = false;
+            if (needsReload) loadLogs();
+        });
+}
+
+// Carica la pagina successiva di log più vecchi
+function loadMoreLogs() {
+    if (isLoadingLogs || !hasMoreLogs) return;
+    isLoadingLogs = true;
+    
+    fetch(buildLogsUrl({ offset: loadedLogs.length, limit: LOGS_PAGE_SIZE }))
+        .then(response => {
+            if (!response.ok) throw new Error('Errore nel caricamento dei log');
+            return response.json();
+        })
+        .then(page => {
+            loadedLogs = loadedLogs.concat(page.logs);
+            hasMoreLogs = page.has_more;
+            displayLogs(loadedLogs);
+        })
+        .catch(error => {
+            console.error('Errore:', error);
+            showToast('Errore nel caricamento dei log', 'error');
+        })
+        .finally(() => {
+            isLoadingLogs = false;
+        });
+}
+
 // Visualizza i log nell'interfaccia
 function displayLogs(logs) {
     const logsBody = document.getElementById('logs-tbody');
     if (!logsBody) return;
     
+    const loadMoreButton = document.getElementById('load-more-logs-btn');
+    if (loadMoreButton) {
+        loadMoreButton.style.display = hasMoreLogs ? 'inline-flex' : 'none';
+    }
+    
     if (!logs || logs.length === 0) {
         logsBody.innerHTML = `
             <tr>
@@ -99,13 +190,7 @@ function displayLogs(logs) {
         return;
     }
     
-    // Ordina i log per data e ora (dal più recente al più vecchio)
-    logs.sort((a, b) => {
-        const dateA = a.date + ' ' + a.time;
-        const dateB = b.date + ' ' + b.time;
-        return dateB.localeCompare(dateA);
-    });
-    
+    // I log arrivano già ordinati dal più recente al più vecchio
     // Crea le righe della tabella
     logsBody.innerHTML = logs.map(log => {
         const level = log.level || 'INFO';
@@ -118,12 +203,23 @@ function displayLogs(logs) {
                 <td>
                     <span class="log-level ${levelClass}">${level}</span>
                 </td>
-                <td>${log.message || 'Nessun messaggio'}</td>
+                <td>${log.message || 'Nessun messaggio'}${log.repeat ? ` <span class="log-repeat">(ripetuto ${log.repeat} volte fino alle ${log.last_time})</span>` : ''}</td>
             </tr>
         `;
     }).join('');
 }
 
+// Scarica i log in formato CSV (chiamato dal pulsante Esporta)
+function exportLogs() {
+    // Il file viene generato dal server in streaming e compresso durante il trasferimento
+    const query = new URLSearchParams({ format: 'csv', compress: 'gzip' });
+    const levelFilter = document.getElementById('log-level-filter');
+    if (levelFilter && levelFilter.value) {
+        query.set('level', levelFilter.value);
+    }
+    window.location.href = `/api/logs/export?${query.toString()}`;
+}
+
 // Aggiorna i log (chiamato dal pulsante Aggiorna)
 function refreshLogs() {
     const refreshButton = document.getElementById('refresh-logs-btn');
@@ -128,6 +128,9 @@ function generateZonesGrid(zones) {
                 <input type="number" class="zone-duration" id="duration-${zone.id}" 
                        min="1" max="180" value="10" placeholder="Durata (minuti)" 
                        data-zone-id="${zone.id}" disabled>
+                <input type="number" class="zone-duration zone-group" id="group-${zone.id}"
+                       min="1" max="9" value="1" placeholder="Gruppo" title="Le zone dello stesso gruppo si attivano insieme"
+                       data-zone-id="${zone.id}" style="display: none;" disabled>
             </div>
         `;
         
@@ -136,10 +139,12 @@ function generateZonesGrid(zones) {
         // Aggiungi listener al checkbox
         const checkbox = zoneItem.querySelector('.zone-checkbox');
         const durationInput = zoneItem.querySelector('.zone-duration');
+        const groupInput = zoneItem.querySelector('.zone-group');
         
         checkbox.addEventListener('change', () => {
             // Abilita/disabilita l'input durata in base allo stato del checkbox
             durationInput.disabled = !checkbox.checked;
+            groupInput.disabled = !checkbox.checked;
             
             // Aggiorna la classe selected della zona
             zoneItem.classList.toggle('selected', checkbox.checked);
@@ -152,6 +157,15 @@ function generateZonesGrid(zones) {
     });
 }
 
+// Mostra il gruppo di ogni zona solo nella modalità di esecuzione per gruppi
+function toggleGroupInputs() {
+    const concurrencySelect = document.getElementById('concurrency');
+    const showGroups = concurrencySelect && concurrencySelect.value === 'gruppi';
+    document.querySelectorAll('.zone-group').forEach(input => {
+        input.style.display = showGroups ? 'block' : 'none';
+    });
+}
+
 // Mostra/nascondi l'input per i giorni personalizzati
 function toggleDaysSelection() {
     const recurrenceSelect = document.getElementById('recurrence');
@@ -189,6 +203,10 @@ function loadProgramData(programId) {
                 document.getElementById('custom-days-interval').value = program.interval_days || 3;
             }
             
+            // Modalità di esecuzione delle zone
+            document.getElementById('concurrency').value = program.concurrency || 'sequenziale';
+            toggleGroupInputs();
+            
             // Seleziona i mesi
             if (program.months && program.months.length > 0) {
                 const monthItems = document.querySelectorAll('.month-item');
@@ -207,10 +225,16 @@ function loadProgramData(programId) {
                     const checkbox = document.getElementById(`zone-${step.zone_id}`);
                     const durationInput = document.getElementById(`duration-${step.zone_id}`);
                     
+                    const groupInput = document.getElementById(`group-${step.zone_id}`);
+                    
                     if (checkbox && durationInput) {
                         checkbox.checked = true;
                         durationInput.disabled = false;
                         durationInput.value = step.duration || 10;
+                        if (groupInput) {
+                            groupInput.disabled = false;
+                            groupInput.value = step.group || 1;
+                        }
                         
                         // Seleziona anche la card della zona
                         const zoneItem = document.querySelector(`.zone-item[data-zone-id="${step.zone_id}"]`);
@@ -309,6 +333,7 @@ function saveProgram() {
     }
     
     // Raccogli le zone selezionate e le loro durate
+    const concurrency = document.getElementById('concurrency').value;
     const steps = [];
     document.querySelectorAll('.zone-checkbox:checked').forEach(checkbox => {
         const zoneId = parseInt(checkbox.dataset.zoneId);
@@ -328,10 +353,15 @@ function saveProgram() {
             return;
         }
         
-        steps.push({
+        const step = {
             zone_id: zoneId,
             duration: duration
-        });
+        };
+        // Nella modalità per gruppi le zone dello stesso gruppo si attivano insieme
+        if (concurrency === 'gruppi') {
+            step.group = parseInt(document.getElementById(`group-${zoneId}`).value) || 1;
+        }
+        steps.push(step);
     });
     
     if (steps.length === 0) {
@@ -354,6 +384,7 @@ function saveProgram() {
         activation_time: activationTime,
         recurrence: recurrence,
         months: selectedMonths,
+        concurrency: concurrency,
         steps: steps
     };
     
@@ -644,9 +644,10 @@ function saveAdvancedSettings() {
 
 // Funzione generica per il salvataggio delle impostazioni
 function saveSettings(settings, onSuccess, onError) {
-    fetch('/save_user_settings', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+    // Invia solo le impostazioni modificate: il server riscrive il file solo se cambia qualcosa
+    fetch('/api/settings', {
+        method: 'PATCH',
+        headers: { 'Content-Type': 'application/merge-patch+json' },
         body: JSON.stringify(settings)
     })
     .then(response => response.json())
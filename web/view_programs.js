@@ -4,6 +4,7 @@
 let programStatusInterval = null;
 let programsData = {};
 let zoneNameMap = {};
+let activeJobId = null;  // Attività in background del programma avviato manualmente
 
 // Inizializza la pagina
 function initializeViewProgramsPage() {
@@ -55,12 +56,69 @@ function fetchProgramState() {
         })
         .then(state => {
             updateProgramsUI(state);
+            // Avanzamento dell'attività in corso (anche se avviata da un'altra pagina)
+            if (state.job_id) {
+                activeJobId = state.job_id;
+            }
+            if (activeJobId) {
+                fetchJobStatus(activeJobId);
+            }
         })
         .catch(error => {
             console.error('Errore nel recupero dello stato del programma:', error);
         });
 }
 
+// Formatta una durata in secondi come mm:ss o h:mm:ss
+function formatSeconds(seconds) {
+    seconds = Math.max(0, Math.round(seconds));
+    const h = Math.floor(seconds / 3600);
+    const m = Math.floor((seconds % 3600) / 60);
+    const s = String(seconds % 60).padStart(2, '0');
+    return h > 0 ? `${h}:${String(m).padStart(2, '0')}:${s}` : `${m}:${s}`;
+}
+
+// Ottiene lo stato di avanzamento dell'attività in background
+function fetchJobStatus(jobId) {
+    fetch(`/api/jobs/${jobId}`)
+        .then(response => {
+            if (response.status === 404) {
+                activeJobId = null;
+                return null;
+            }
+            if (!response.ok) throw new Error("Errore nel recupero dello stato dell'attività");
+            return response.json();
+        })
+        .then(job => {
+            if (job) updateJobProgress(job);
+        })
+        .catch(error => {
+            console.error("Errore nel recupero dello stato dell'attività:", error);
+        });
+}
+
+// Mostra l'avanzamento nell'indicatore del programma in esecuzione
+function updateJobProgress(job) {
+    if (job.state !== 'pending' && job.state !== 'running') {
+        activeJobId = null;
+        if (job.state === 'error' && typeof showToast === 'function') {
+            showToast(`Errore durante l'esecuzione del programma ${job.program_name}`, 'error');
+        }
+        return;
+    }
+    const indicator = document.querySelector(`.program-card[data-program-id="${job.program_id}"] .active-indicator`);
+    if (!indicator) return;
+    let text = 'In esecuzione';
+    if (job.current_step) {
+        const zones = job.zone_ids.length > 0
+            ? job.zone_ids.map(id => zoneNameMap[id] || `Zona ${id + 1}`).join(', ')
+            : 'Pausa';
+        text += ` · ${zones} (${job.current_step}/${job.step_count})`;
+    }
+    text += ` · ${formatSeconds(job.remaining)} rimanenti`;
+    indicator.textContent = text;
+}
+
 // Aggiorna l'interfaccia in base allo stato del programma
 function updateProgramsUI(state) {
     const currentProgramId = state.current_program_id;
@@ -259,6 +317,10 @@ function renderProgramCards(programs, state) {
                     <div class="info-label">Cadenza:</div>
                     <div class="info-value">${formatRecurrence(program.recurrence, program.interval_days)}</div>
                 </div>
+                <div class="info-row">
+                    <div class="info-label">Esecuzione:</div>
+                    <div class="info-value">${formatConcurrency(program.concurrency)}</div>
+                </div>
                 <div class="info-row">
                     <div class="info-label">Ultima esecuzione:</div>
                     <div class="info-value">${program.last_run_date || 'Mai eseguito'}</div>
@@ -352,6 +414,18 @@ function formatRecurrence(recurrence, interval_days) {
     }
 }
 
+// Formatta la modalità di esecuzione delle zone per la visualizzazione
+function formatConcurrency(concurrency) {
+    switch (concurrency) {
+        case 'gruppi':
+            return 'Per gruppi';
+        case 'automatica':
+            return 'Zone in parallelo (automatica)';
+        default:
+            return 'Una zona alla volta';
+    }
+}
+
 // Costruisce la griglia dei mesi
 function buildMonthsGrid(activeMonths) {
     const months = [
@@ -386,7 +460,7 @@ function buildZonesGrid(steps) {
         return `
             <div class="zone-tag">
                 ${zoneName}
-                <span class="duration">${step.duration || 0} min</span>
+                <span class="duration">${step.duration || 0} min${step.group ? ` · G${step.group}` : ''}</span>
             </div>
         `;
     }).join('');
@@ -408,6 +482,8 @@ function startProgram(programId) {
     .then(response => response.json())
     .then(data => {
         if (data.success) {
+            // Il programma prosegue in background: l'avanzamento si legge dall'attività
+            activeJobId = data.job_id;
             if (typeof showToast === 'function') {
                 showToast('Programma avviato con successo', 'success');
             }
@@ -4,25 +4,43 @@ Fornisce le API REST e serve i file statici.
 """
 from microdot import Request, Microdot, Response, send_file
 import uasyncio as asyncio
-from log_manager import log_event, get_logs, clear_logs
+from log_manager import (
+    log_event,
+    query_logs,
+    get_recent_logs,
+    get_last_seq,
+    clear_logs,
+    flush_logs,
+    get_log_store_stats
+)
+from flash_io import get_storage_metrics
+from log_export import LogExportStream
 
 from settings_manager import (
     load_user_settings,
-    save_user_settings,
+    copy_user_settings,
+    save_user_settings_async,
+    patch_user_settings,
+    get_settings_model,
     reset_user_settings,
     reset_factory_data,
     ensure_directory_exists
 )
 from program_manager import (
     load_programs,
-    save_programs,
+    get_program,
+    get_programs_generation,
+    save_program,
+    reload_programs,
     stop_program,
     update_program,
     delete_program,
-    execute_program,
     check_program_conflicts
 )
-from program_state import program_running, current_program_id, load_program_state
+from program_state import runtime_state
+from program_plan import validate_concurrency
+from program_jobs import submit_program, get_job_status, get_active_job
+from run_history import query_history, get_last_run_date, get_history_generation
 from wifi_manager import (
     start_access_point,
     clear_wifi_scan_file,
@@ -83,16 +101,93 @@ def file_exists(path):
 
 # -------- API endpoints --------
 
-@app.route('/data/system_log.json', methods=['GET'])
+@app.route('/api/logs', methods=['GET'])
 def get_system_logs(request):
-    """API per ottenere i log di sistema."""
+    """
+    API per ottenere una pagina di log di sistema, dal più recente al più vecchio.
+
+    Parametri (query string): level, date (YYYY-MM-DD), since (cursore restituito dalla
+    pagina precedente, oppure data "YYYY-MM-DD HH:MM:SS"), offset, limit,
+    after_seq (restituisce solo i log con sequenza maggiore; 304 senza corpo se non ce ne sono).
+    """
     try:
-        logs = get_logs()
-        return json_response(logs)
+        try:
+            offset = request.args.get('offset', 0, type=int)
+            limit = request.args.get('limit', 50, type=int)
+            after_seq = request.args.get('after_seq', None, type=int)
+        except ValueError:
+            return json_response({'error': 'Parametri offset/limit/after_seq non validi'}, 400)
+
+        if after_seq is not None:
+            last_seq = get_last_seq()
+            if after_seq == last_seq:
+                # Nessun nuovo log: risposta vuota senza leggere la flash
+                return Response(status_code=304)
+            if after_seq > last_seq:
+                # La sequenza del client non è più valida: restituisce la prima pagina
+                after_seq = None
+
+        result = query_logs(
+            date=request.args.get('date') or None,
+            level=request.args.get('level') or None,
+            since=request.args.get('since') or None,
+            offset=offset,
+            limit=limit,
+            after_seq=after_seq
+        )
+        return json_response(result)
     except Exception as e:
         log_event(f"Errore durante la lettura dei log: {e}", "ERROR")
         return json_response({'error': str(e)}, 500)
 
+@app.route('/api/logs/recent', methods=['GET'])
+def get_recent_system_logs(request):
+    """
+    API per ottenere gli ultimi eventi mantenuti in memoria, compresi quelli
+    non salvati su flash (es. DEBUG). Parametro opzionale: level.
+    """
+    try:
+        return json_response({'logs': get_recent_logs(request.args.get('level') or None)})
+    except Exception as e:
+        log_event(f"Errore durante la lettura dei log recenti: {e}", "ERROR")
+        return json_response({'error': str(e)}, 500)
+
+@app.route('/api/logs/export', methods=['GET'])
+def export_system_logs(request):
+    """
+    API per scaricare i log di un intervallo di date, in ordine cronologico.
+    Il file viene generato in streaming, senza mai tenere in memoria l'intero export.
+
+    Parametri (query string): from, to (YYYY-MM-DD, inclusi), level,
+    format (ndjson o csv), compress (gzip o deflate, ignorato se non disponibile).
+    """
+    try:
+        export_format = request.args.get('format', 'ndjson')
+        date_from = request.args.get('from') or None
+        date_to = request.args.get('to') or None
+        try:
+            stream = LogExportStream(
+                date_from=date_from,
+                date_to=date_to,
+                level=request.args.get('level') or None,
+                export_format=export_format,
+                encoding=request.args.get('compress') or None
+            )
+        except ValueError as e:
+            return json_response({'error': str(e)}, 400)
+
+        filename = f"logs_{date_from or 'inizio'}_{date_to or 'oggi'}.{stream.extension}"
+        headers = {
+            'Content-Type': stream.content_type,
+            'Content-Disposition': f'attachment; filename="{filename}"'
+        }
+        if stream.encoding:
+            headers['Content-Encoding'] = stream.encoding
+        return Response(body=stream, headers=headers)
+    except Exception as e:
+        log_event(f"Errore durante l'esportazione dei log: {e}", "ERROR")
+        return json_response({'error': str(e)}, 500)
+
 @app.route('/clear_logs', methods=['POST'])
 def clear_system_logs(request):
     """API per cancellare i log di sistema."""
@@ -107,6 +202,21 @@ def clear_system_logs(request):
         log_event(f"Errore durante la cancellazione dei log: {e}", "ERROR")
         return json_response({'success': False, 'error': str(e)}, 500)
 
+@app.route('/api/storage/wear', methods=['GET'])
+def get_storage_wear(request):
+    """
+    API per ottenere le metriche di scrittura su flash dall'avvio, per file e per chiamante
+    (scritture, byte, tempo impiegato, blocchi di cancellazione e stima dei byte al giorno),
+    e lo spazio occupato dall'archivio dei log.
+    """
+    try:
+        metrics = get_storage_metrics()
+        metrics['log_store'] = get_log_store_stats()
+        return json_response(metrics)
+    except Exception as e:
+        log_event(f"Errore durante la lettura delle metriche della flash: {e}", "ERROR")
+        return json_response({'error': str(e)}, 500)
+
 @app.route('/data/wifi_scan.json', methods=['GET'])
 def get_wifi_scan_results(request):
     """API per ottenere i risultati della scansione WiFi."""
@@ -222,32 +332,52 @@ def activate_ap(request):
 def get_user_settings(request):
     """API per ottenere le impostazioni utente."""
     try:
-        settings = load_user_settings()
-        # Assicurati che il pin del relè di sicurezza sia sempre presente nella risposta
-        if 'safety_relay' not in settings:
-            settings['safety_relay'] = {'pin': 13}  # Valore di default
-        elif 'pin' not in settings['safety_relay']:
-            settings['safety_relay']['pin'] = 13  # Valore di default
-            
-        return json_response(settings)
+        # Il pin del relè di sicurezza è sempre presente: lo garantisce load_user_settings
+        return json_response(load_user_settings())
     except Exception as e:
         log_event(f"Errore durante il caricamento di user_settings.json: {e}", "ERROR")
         print(f"Errore durante il caricamento di user_settings.json: {e}")
         return Response('Errore interno del server', status_code=500)
 
+# Corpo JSON dell'elenco programmi e generazioni (programmi, storico) da cui è stato serializzato
+_programs_body = None
+_programs_body_generation = None
+
+def _programs_with_last_run():
+    """Programmi con la data dell'ultima esecuzione presa dallo storico"""
+    programs = {}
+    for program_id, program in load_programs().items():
+        last_run_date = get_last_run_date(program_id)
+        if last_run_date:
+            program = dict(program)
+            program['last_run_date'] = last_run_date
+        programs[program_id] = program
+    return programs
+
 @app.route('/data/program.json', methods=['GET'])
 def get_programs(request):
     """API per ottenere i programmi."""
+    global _programs_body, _programs_body_generation
     try:
-        programs = load_programs()
-        return json_response(programs)
+        generation = (get_programs_generation(), get_history_generation())
+        etag = f'"p{generation[0]}-{generation[1]}"'
+        # Il browser ha già l'elenco aggiornato: nessuna serializzazione né invio
+        if request.headers.get('If-None-Match') == etag:
+            return Response(status_code=304, headers={'ETag': etag})
+        if _programs_body_generation != generation:
+            _programs_body = ujson.dumps(_programs_with_last_run())
+            _programs_body_generation = generation
+        return Response(
+            body=_programs_body,
+            headers={'Content-Type': 'application/json', 'ETag': etag, 'Cache-Control': 'no-cache'}
+        )
     except Exception as e:
         log_event(f"Errore durante il caricamento di program.json: {e}", "ERROR")
         print(f"Errore durante il caricamento di program.json: {e}")
         return Response('Errore interno del server', status_code=500)
 
 @app.route('/toggle_automatic_programs', methods=['POST'])
-def toggle_automatic_programs(request):
+async def toggle_automatic_programs(request):
     """API per abilitare/disabilitare i programmi automatici."""
     try:
         data = request.json
@@ -256,13 +386,16 @@ def toggle_automatic_programs(request):
             
         enable = data.get('enable', False)
         
-        # Salva l'impostazione in un file
-        settings = load_user_settings()
-        settings['automatic_programs_enabled'] = enable
-        save_user_settings(settings)
+        # Salva l'impostazione (nessuna scrittura se il valore non cambia)
+        result = await patch_user_settings({'automatic_programs_enabled': enable})
+        if not result['success']:
+            return json_response({'success': False, 'error': 'Errore nella scrittura delle impostazioni'}, 500)
         
         log_event(f"Programmi automatici {'abilitati' if enable else 'disabilitati'}", "INFO")
         return json_response({'success': True})
+    except ValueError as e:
+        log_event(f"Modifica dei programmi automatici non valida: {e}", "WARNING")
+        return json_response({'success': False, 'error': str(e)}, 400)
     except Exception as e:
         log_event(f"Errore durante la modifica dell'impostazione dei programmi automatici: {e}", "ERROR")
         print(f"Errore durante la modifica dell'impostazione dei programmi automatici: {e}")
@@ -299,15 +432,13 @@ def handle_start_zone(request):
         duration = int(duration)
 
         # Verifica se il valore di durata è valido
-        settings = load_user_settings()
-        max_duration = settings.get('max_zone_duration', 180)  # Default 3 ore
+        max_duration = get_settings_model().max_zone_duration
         if duration <= 0 or duration > max_duration:
             log_event(f"Errore: durata non valida per l'avvio della zona {zone_id}: {duration}", "ERROR")
             return json_response({'error': f'Durata non valida. Deve essere tra 1 e {max_duration} minuti', 'success': False}, 400)
 
         # Verifica se un programma è in esecuzione
-        load_program_state()
-        if program_running:
+        if runtime_state.running:
             log_event(f"Impossibile avviare la zona {zone_id}: un programma è già in esecuzione", "WARNING")
             return json_response({'error': 'Impossibile avviare la zona: un programma è già in esecuzione', 'success': False}, 400)
 
@@ -388,6 +519,11 @@ def save_program_route(request):
             log_event("Errore: nessuna zona selezionata", "ERROR")
             return json_response({'success': False, 'error': 'Seleziona almeno una zona per il programma'}, 400)
 
+        concurrency_error = validate_concurrency(program_data)
+        if concurrency_error:
+            log_event(f"Errore: {concurrency_error}", "ERROR")
+            return json_response({'success': False, 'error': concurrency_error}, 400)
+
         # Carica i programmi esistenti
         programs = load_programs()
 
@@ -409,11 +545,8 @@ def save_program_route(request):
             new_id = str(max([int(pid) for pid in programs.keys()]) + 1)
         program_data['id'] = new_id  # Assicurati che l'ID sia una stringa
 
-        # Aggiungi il nuovo programma al dizionario
-        programs[new_id] = program_data
-
-        # Salva i programmi aggiornati
-        if save_programs(programs):
+        # Salva solo il nuovo programma
+        if save_program(program_data):
             log_event(f"Nuovo programma '{program_data['name']}' creato con ID {new_id}", "INFO")
             return json_response({'success': True, 'message': 'Programma salvato con successo', 'program_id': new_id})
         else:
@@ -443,6 +576,11 @@ def update_program_route(request):
             log_event("Errore: nome programma troppo lungo", "ERROR")
             return json_response({'success': False, 'error': 'Il nome del programma non può superare 16 caratteri'}, 400)
 
+        concurrency_error = validate_concurrency(updated_program_data)
+        if concurrency_error:
+            log_event(f"Errore: {concurrency_error}", "ERROR")
+            return json_response({'success': False, 'error': concurrency_error}, 400)
+
         # Aggiorna il programma esistente
         success, error_msg = update_program(program_id, updated_program_data)
 
@@ -505,6 +643,7 @@ def restart_system_route(request):
 async def _delayed_reset(delay_seconds):
     """Esegue un reset del sistema dopo un ritardo specificato."""
     await asyncio.sleep(delay_seconds)
+    flush_logs(force=True)
     machine.reset()
 
 @app.route('/reset_settings', methods=['POST'])
@@ -528,6 +667,8 @@ def reset_factory_data_route(request):
     """API per ripristinare le impostazioni e i dati di fabbrica."""
     try:
         success = reset_factory_data()
+        # I programmi sono stati eliminati direttamente nell'archivio
+        reload_programs()
         if success:
             log_event("Dati di fabbrica resettati con successo", "INFO")
             return json_response({'success': True, 'message': 'Dati di fabbrica resettati con successo'})
@@ -540,8 +681,11 @@ def reset_factory_data_route(request):
         return json_response({'success': False, 'error': str(e)}, 500)
 
 @app.route('/start_program', methods=['POST'])
-async def start_program_route(request):
-    """API per avviare manualmente un programma."""
+def start_program_route(request):
+    """
+    API per avviare manualmente un programma. Il programma viene eseguito in background:
+    la risposta (202) contiene l'id dell'attività, il cui stato si legge da /api/jobs/<id>.
+    """
     try:
         data = request.json
         if data is None:
@@ -553,42 +697,69 @@ async def start_program_route(request):
             log_event("Errore: ID del programma mancante", "ERROR")
             return json_response({'success': False, 'error': 'ID del programma mancante'}, 400)
 
-        programs = load_programs()
-        program = programs.get(program_id)
+        program = get_program(program_id)
 
         if program is None:
             log_event(f"Errore: programma con ID {program_id} non trovato", "ERROR")
             return json_response({'success': False, 'error': 'Programma non trovato'}, 404)
 
-        # Controlla se un altro programma è già in esecuzione
-        load_program_state()
-        if program_running:
-            log_event("Impossibile avviare il programma: un altro programma è già in esecuzione", "WARNING")
-            return json_response({'success': False, 'error': 'Un altro programma è già in esecuzione'}, 400)
+        job_id, error_msg = submit_program(program)
+        if job_id is None:
+            log_event(f"Impossibile avviare il programma: {error_msg}", "WARNING")
+            return json_response({'success': False, 'error': error_msg}, 409)
 
-        # Avvia il programma manualmente
-        success = await execute_program(program, manual=True)
-        
-        if success:
-            log_event(f"Programma {program.get('name', '')} avviato manualmente", "INFO")
-            return json_response({'success': True, 'message': 'Programma avviato manualmente'})
-        else:
-            return json_response({'success': False, 'error': 'Errore nell\'avvio del programma'}, 500)
+        return json_response({'success': True, 'message': 'Programma avviato manualmente', 'job_id': job_id}, 202)
     except Exception as e:
         log_event(f"Errore nell'avvio del programma: {e}", "ERROR")
         print(f"Errore nell'avvio del programma: {e}")
         return json_response({'success': False, 'error': str(e)}, 500)
 
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def get_job_route(request, job_id):
+    """
+    API per lo stato di un'attività in background: stato (pending, running o l'esito
+    finale), passo e zona in corso, secondi trascorsi e rimanenti.
+    """
+    try:
+        status = get_job_status(job_id)
+        if status is None:
+            return json_response({'error': 'Attività non trovata'}, 404)
+        return json_response(status)
+    except Exception as e:
+        log_event(f"Errore durante la lettura dell'attività {job_id}: {e}", "ERROR")
+        return json_response({'error': str(e)}, 500)
+
+@app.route('/api/programs/history', methods=['GET'])
+def get_program_history(request):
+    """
+    API per ottenere lo storico delle esecuzioni dei programmi, dalla più recente.
+
+    Parametri (query string): program_id, offset, limit.
+    """
+    try:
+        try:
+            offset = request.args.get('offset', 0, type=int)
+            limit = request.args.get('limit', 20, type=int)
+        except ValueError:
+            return json_response({'error': 'Parametri offset/limit non validi'}, 400)
+        result = query_history(
+            program_id=request.args.get('program_id') or None,
+            offset=offset,
+            limit=limit
+        )
+        return json_response(result)
+    except Exception as e:
+        log_event(f"Errore durante la lettura dello storico dei programmi: {e}", "ERROR")
+        return json_response({'error': str(e)}, 500)
+
 @app.route('/get_program_state', methods=['GET'])
 def get_program_state(request):
     """API per ottenere lo stato del programma corrente."""
     try:
-        # Ricarichiamo lo stato per essere sicuri di avere dati aggiornati
-        load_program_state()
-        state = {
-            'program_running': program_running,
-            'current_program_id': current_program_id
-        }
+        # Lo stato in memoria è sempre aggiornato: nessuna lettura dalla flash
+        state = runtime_state.to_dict()
+        job = get_active_job()
+        state['job_id'] = job.id if job is not None else None
         return json_response(state)
     except Exception as e:
         log_event(f"Errore durante il caricamento dello stato del programma: {e}", "ERROR")
@@ -596,7 +767,7 @@ def get_program_state(request):
         return json_response({'program_running': False, 'current_program_id': None})
 
 @app.route('/connect_wifi', methods=['POST'])
-def connect_wifi_route(request):
+async def connect_wifi_route(request):
     """API per connettersi a una rete WiFi."""
     try:
         # Ottieni i dati della richiesta
@@ -634,16 +805,14 @@ def connect_wifi_route(request):
             print(f"Connesso alla rete WiFi con IP: {ip}")
 
             # Carica le impostazioni esistenti
-            existing_settings = load_user_settings()
-            if not isinstance(existing_settings, dict):
-                existing_settings = {}
+            existing_settings = copy_user_settings()
 
             # Aggiorna solo le impostazioni WiFi e salva il file
             existing_settings['wifi'] = {'ssid': ssid, 'password': password}
             existing_settings['client_enabled'] = True
 
             # Salva le impostazioni aggiornate
-            save_user_settings(existing_settings)
+            await save_user_settings_async(existing_settings)
 
             # Restituisci una risposta di successo
             return json_response({'success': True, 'ip': ip, 'mode': 'client'})
@@ -658,8 +827,21 @@ def connect_wifi_route(request):
         print(f"Errore durante la connessione alla rete WiFi: {e}")
         return json_response({'success': False, 'error': str(e)}, 500)
 
+async def _apply_settings_patch(patch):
+    """
+    Applica una modifica parziale alle impostazioni.
+    I sottosistemi interessati si riconfigurano da soli, notificati da settings_manager.
+
+    Returns:
+        dict: Risultato di patch_user_settings
+    """
+    result = await patch_user_settings(patch)
+    if result['success'] and result['changed']:
+        log_event(f"Impostazioni modificate: {', '.join(result['changed'])}", "INFO")
+    return result
+
 @app.route('/save_user_settings', methods=['POST'])
-def save_user_settings_route(request):
+async def save_user_settings_route(request):
     """API per salvare le impostazioni utente."""
     try:
         # Ricevi i dati delle impostazioni dal client e assicurati che siano validi
@@ -672,42 +854,11 @@ def save_user_settings_route(request):
             log_event("Errore: dati impostazioni non validi", "ERROR")
             return json_response({'success': False, 'error': 'I dati delle impostazioni devono essere un oggetto JSON valido'}, 400)
 
-        # Stampa di debug delle impostazioni ricevute
-        print("Dati ricevuti per le impostazioni:", ujson.dumps(settings_data))
-
-        # Carica le impostazioni esistenti dal file
-        existing_settings = load_user_settings()
-        if not isinstance(existing_settings, dict):
-            existing_settings = {}
-
-        # Aggiorna le impostazioni esistenti con le nuove impostazioni ricevute
-        for key, value in settings_data.items():
-            if isinstance(value, dict) and key in existing_settings and isinstance(existing_settings[key], dict):
-                # Se il valore è un dizionario, aggiorna in modo ricorsivo
-                existing_settings[key].update(value)
-            else:
-                # Se il valore non è un dizionario, sovrascrivi direttamente
-                existing_settings[key] = value
-
-        # Salva le impostazioni aggiornate
-        success = save_user_settings(existing_settings)
-        if not success:
+        # Le impostazioni ricevute vengono unite a quelle esistenti come una merge patch
+        result = await _apply_settings_patch(settings_data)
+        if not result['success']:
             return json_response({'success': False, 'error': 'Errore nella scrittura del file'}, 500)
 
-        # Verifica se client_enabled è stato impostato su False
-        client_enabled = existing_settings.get('client_enabled', True)
-        wlan_sta = network.WLAN(network.STA_IF)
-
-        if not client_enabled:
-            # Se il client Wi-Fi è attivo, disattivalo
-            if wlan_sta.active() or wlan_sta.isconnected():
-                wlan_sta.active(False)
-                log_event("Modalità client disattivata poiché 'client_enabled' è False", "INFO")
-                print("Modalità client disattivata poiché 'client_enabled' è False.")
-        else:
-            log_event("Modalità client attivata o già attiva", "INFO")
-            print("Modalità client attivata o già attiva.")
-
         # Forza la garbage collection
         gc.collect()
         
@@ -723,6 +874,30 @@ def save_user_settings_route(request):
         print(f"Errore durante il salvataggio delle impostazioni: {e}")
         return json_response({'success': False, 'error': str(e)})
 
+@app.route('/api/settings', methods=['PATCH'])
+async def patch_user_settings_route(request):
+    """
+    API per la modifica parziale delle impostazioni (merge patch, RFC 7396).
+    Risponde con le chiavi modificate e i sottosistemi riconfigurati; se nulla cambia
+    le impostazioni non vengono riscritte.
+    """
+    try:
+        # Il content type application/merge-patch+json non viene decodificato da Microdot
+        patch = request.json
+        if patch is None:
+            patch = ujson.loads(request.body.decode('utf-8'))
+
+        result = await _apply_settings_patch(patch)
+        if not result['success']:
+            return json_response({'success': False, 'error': 'Errore nella scrittura del file'}, 500)
+        return json_response(result)
+    except ValueError as e:
+        log_event(f"Modifica delle impostazioni non valida: {e}", "WARNING")
+        return json_response({'success': False, 'error': str(e)}, 400)
+    except Exception as e:
+        log_event(f"Errore durante la modifica delle impostazioni: {e}", "ERROR")
+        return json_response({'success': False, 'error': str(e)}, 500)
+
 @app.route('/disconnect_wifi', methods=['POST'])
 def disconnect_wifi(request):
     """API per disconnettere il client WiFi."""
@@ -1,14 +1,17 @@
 """
 Modulo per la gestione della connettività WiFi.
 Gestisce la modalità client e la modalità access point.
+Le modifiche delle impostazioni WiFi vengono notificate da settings_manager e applicate
+subito dal task retry_client_connection.
 """
 import network
 import ujson
 import time
 import gc
 import uos
-from settings_manager import load_user_settings, save_user_settings
+from settings_manager import get_settings_model, subscribe_settings
 from log_manager import log_event
+import flash_io
 import uasyncio as asyncio
 
 WIFI_RETRY_INTERVAL = 30  # Secondi tra un tentativo di riconnessione e l'altro
@@ -17,6 +20,11 @@ AP_SSID_DEFAULT = "IrrigationSystem"
 AP_PASSWORD_DEFAULT = "12345678"
 WIFI_SCAN_FILE = '/data/wifi_scan.json'
 
+# Modifiche delle impostazioni in attesa di essere applicate dal task WiFi
+_settings_changed = asyncio.Event()
+_reconnect_client = False
+_restart_ap = False
+
 def reset_wifi_module():
     """
     Disattiva e riattiva il modulo WiFi per forzare un reset completo.
@@ -57,8 +65,8 @@ def save_wifi_scan_results(network_list):
         except OSError:
             uos.mkdir('/data')
             
-        with open(WIFI_SCAN_FILE, 'w') as f:
-            ujson.dump(network_list, f)
+        with flash_io.open_write(WIFI_SCAN_FILE, 'w', 'wifi_scan') as f:
+            f.write(ujson.dumps(network_list))
         log_event(f"Risultati della scansione Wi-Fi salvati correttamente in {WIFI_SCAN_FILE}", "INFO")
         print(f"Risultati della scansione Wi-Fi salvati correttamente in {WIFI_SCAN_FILE}")
     except OSError as e:
@@ -70,8 +78,8 @@ def clear_wifi_scan_file():
     Cancella il file wifi_scan.json.
     """
     try:
-        with open(WIFI_SCAN_FILE, 'w') as f:
-            ujson.dump([], f)  # Salviamo un array vuoto
+        with flash_io.open_write(WIFI_SCAN_FILE, 'w', 'wifi_scan') as f:
+            f.write(ujson.dumps([]))  # Salviamo un array vuoto
             log_event(f"File {WIFI_SCAN_FILE} azzerato correttamente", "INFO")
             print(f"File {WIFI_SCAN_FILE} azzerato correttamente.")
     except Exception as e:
@@ -140,12 +148,11 @@ def start_access_point(ssid=None, password=None):
         boolean: True se l'access point è stato avviato, False altrimenti
     """
     try:
-        settings = load_user_settings()  # Carica le impostazioni utente
+        model = get_settings_model()  # Carica le impostazioni utente
 
         # Se SSID o password non sono passati come parametri, carica dalle impostazioni
-        ap_config = settings.get('ap', {})
-        ssid = ssid or ap_config.get('ssid', AP_SSID_DEFAULT)  # Default SSID se non presente
-        password = password or ap_config.get('password', AP_PASSWORD_DEFAULT)  # Default password se non presente
+        ssid = ssid or model.ap_ssid or AP_SSID_DEFAULT  # Default SSID se non presente
+        password = password or model.ap_password or AP_PASSWORD_DEFAULT  # Default password se non presente
 
         wlan_ap = network.WLAN(network.AP_IF)
         wlan_ap.active(True)
@@ -178,18 +185,12 @@ def initialize_network():
         boolean: True se l'inizializzazione è riuscita, False altrimenti
     """
     gc.collect()  # Effettua la garbage collection per liberare memoria
-    settings = load_user_settings()
-    if not isinstance(settings, dict):
-        log_event("Errore: impostazioni utente non disponibili", "ERROR")
-        print("Errore: impostazioni utente non disponibili.")
-        return False
+    model = get_settings_model()
 
-    client_enabled = settings.get('client_enabled', False)
-
-    if client_enabled:
+    if model.client_enabled:
         # Modalità client attiva
-        ssid = settings.get('wifi', {}).get('ssid')
-        password = settings.get('wifi', {}).get('password')
+        ssid = model.wifi_ssid
+        password = model.wifi_password
 
         if ssid and password:
             success = connect_to_wifi(ssid, password)
@@ -205,29 +206,74 @@ def initialize_network():
             print("SSID o password non validi per il WiFi client.")
 
     # Se il client è disattivato o fallisce, avvia l'AP
-    ap_ssid = settings.get('ap', {}).get('ssid', AP_SSID_DEFAULT)
-    ap_password = settings.get('ap', {}).get('password', AP_PASSWORD_DEFAULT)
-    success = start_access_point(ap_ssid, ap_password)
+    success = start_access_point()
     return success
 
+def _on_settings_changed(previous, current):
+    """Segnala al task WiFi le modifiche delle impostazioni di rete"""
+    global _reconnect_client, _restart_ap
+    changed = False
+    if (previous.client_enabled != current.client_enabled or
+        previous.wifi_ssid != current.wifi_ssid or previous.wifi_password != current.wifi_password):
+        _reconnect_client = True
+        changed = True
+    if previous.ap_ssid != current.ap_ssid or previous.ap_password != current.ap_password:
+        _restart_ap = True
+        changed = True
+    if changed:
+        _settings_changed.set()
+
+def _connected_to(wlan_sta, ssid):
+    """Verifica se il client è già connesso alla rete indicata"""
+    if not wlan_sta.isconnected():
+        return False
+    try:
+        return wlan_sta.config('essid') == ssid
+    except Exception:
+        return False
+
+async def _wait_for_settings_change():
+    """Attende una modifica delle impostazioni di rete, al massimo WIFI_RETRY_INTERVAL secondi"""
+    try:
+        await asyncio.wait_for(_settings_changed.wait(), WIFI_RETRY_INTERVAL)
+    except asyncio.TimeoutError:
+        pass
+    _settings_changed.clear()
+
 async def retry_client_connection():
     """
-    Task asincrono che verifica periodicamente la connessione WiFi client e tenta di riconnettersi se necessario.
+    Task asincrono che applica le modifiche delle impostazioni di rete appena vengono salvate
+    e verifica periodicamente la connessione WiFi client, riconnettendosi se necessario.
     """
+    global _reconnect_client, _restart_ap
+    subscribe_settings(_on_settings_changed)
     while True:
         try:
-            await asyncio.sleep(WIFI_RETRY_INTERVAL)
+            await _wait_for_settings_change()
             
             wlan_sta = network.WLAN(network.STA_IF)
-            settings = load_user_settings()
-            
-            client_enabled = settings.get('client_enabled', False)
+            model = get_settings_model()
+            ssid = model.wifi_ssid
+            password = model.wifi_password
+
+            if _restart_ap:
+                _restart_ap = False
+                wlan_ap = network.WLAN(network.AP_IF)
+                if wlan_ap.active():
+                    log_event("Credenziali dell'Access Point modificate, riconfigurazione...", "INFO")
+                    start_access_point()
+
+            if model.client_enabled:
+                reconnect = _reconnect_client
+                _reconnect_client = False
+                # La route /connect_wifi salva le credenziali dopo essersi già connessa
+                if reconnect and wlan_sta.isconnected() and not _connected_to(wlan_sta, ssid):
+                    log_event("Credenziali WiFi modificate, riconnessione...", "INFO")
+                    wlan_sta.disconnect()
 
-            if client_enabled:
                 if not wlan_sta.isconnected():
-                    log_event("Connessione WiFi client persa, tentativo di riconnessione...", "WARNING")
-                    ssid = settings.get('wifi', {}).get('ssid')
-                    password = settings.get('wifi', {}).get('password')
+                    if not reconnect:
+                        log_event("Connessione WiFi client persa, tentativo di riconnessione...", "WARNING")
                     
                     if ssid and password:
                         success = connect_to_wifi(ssid, password)
@@ -250,6 +296,7 @@ async def retry_client_connection():
                         wlan_ap.active(False)
                         log_event("Access Point disattivato, modalità client attiva", "INFO")
             else:
+                _reconnect_client = False
                 # La modalità client è disabilitata
                 if wlan_sta.active():
                     log_event("Disattivazione della modalità client", "INFO")
@@ -265,4 +312,4 @@ async def retry_client_connection():
         except Exception as e:
             log_event(f"Errore durante il retry della connessione WiFi: {e}", "ERROR")
             print(f"Errore durante il retry della connessione WiFi: {e}")
-            await asyncio.sleep(5)  # Breve ritardo prima di riprovare in caso di errore
\ No newline at end of file
+            await asyncio.sleep(5)  # Breve ritardo prima di riprovare in caso di errore
@@ -6,8 +6,8 @@ import time
 import machine
 from machine import Pin
 import uasyncio as asyncio
-from program_state import program_running
-from settings_manager import load_user_settings
+from program_state import runtime_state
+from settings_manager import get_settings_model, subscribe_settings
 from log_manager import log_event
 
 # Variabili globali
@@ -15,61 +15,109 @@ active_zones = {}
 zone_pins = {}
 safety_relay = None
 
+def _init_zone_pin(zone):
+    """
+    Configura il pin di una zona come uscita con il relè spento.
+
+    Returns:
+        Pin: Pin configurato, None se la zona non ha un pin o l'inizializzazione fallisce
+    """
+    if zone.pin is None:
+        return None
+    try:
+        pin = Pin(zone.pin, Pin.OUT)
+        pin.value(1)  # Relè spento (logica attiva bassa)
+        log_event(f"Zona {zone.id} inizializzata sul pin {zone.pin}", "DEBUG")
+        return pin
+    except Exception as e:
+        log_event(f"Errore durante l'inizializzazione del pin per la zona {zone.id}: {e}", "ERROR")
+        return None
+
+def _init_safety_relay(pin_number, active=False):
+    """
+    Configura il pin del relè di sicurezza.
+
+    Args:
+        pin_number: Numero del pin (None se il relè non è presente)
+        active: True per lasciare il relè acceso (ci sono zone attive)
+
+    Returns:
+        Pin: Pin configurato, None se non presente o se l'inizializzazione fallisce
+    """
+    if pin_number is None:
+        return None
+    try:
+        relay = Pin(pin_number, Pin.OUT)
+        relay.value(0 if active else 1)  # Logica attiva bassa
+        log_event(f"Relè di sicurezza inizializzato sul pin {pin_number}", "DEBUG")
+        return relay
+    except Exception as e:
+        log_event(f"Errore durante l'inizializzazione del relè di sicurezza: {e}", "ERROR")
+        return None
+
 def initialize_pins():
     """
-    Inizializza i pin del sistema di irrigazione.
+    Inizializza i pin del sistema di irrigazione e registra il modulo per le modifiche
+    delle impostazioni, così le modifiche successive vengono applicate senza riavvio.
     
     Returns:
         boolean: True se almeno una zona è stata inizializzata, False altrimenti
     """
     global zone_pins, safety_relay
     
-    settings = load_user_settings()
-    if not settings:
-        log_event("Errore: Impossibile caricare le impostazioni utente", "ERROR")
-        print("Errore: Impossibile caricare le impostazioni utente.")
-        return False
-
-    zones = settings.get('zones', [])
+    model = get_settings_model()
     pins = {}
 
     # Inizializza i pin per le zone
-    initialized_zones = 0
-    for zone in zones:
-        pin_number = zone.get('pin')
-        if pin_number is None:
-            continue
-            
-        try:
-            pin = Pin(pin_number, Pin.OUT)
-            pin.value(1)  # Relè spento (logica attiva bassa)
-            pins[zone['id']] = pin
-            initialized_zones += 1
-            log_event(f"Zona {zone['id']} inizializzata sul pin {pin_number}", "INFO")
-            print(f"Zona {zone['id']} inizializzata sul pin {pin_number}.")
-        except Exception as e:
-            log_event(f"Errore durante l'inizializzazione del pin per la zona {zone['id']}: {e}", "ERROR")
-            print(f"Errore durante l'inizializzazione del pin per la zona {zone['id']}: {e}")
+    for zone in model.zone_list:
+        pin = _init_zone_pin(zone)
+        if pin is not None:
+            pins[zone.id] = pin
 
+    zone_pins = pins
     # Inizializza il pin per il relè di sicurezza
-    safety_relay_pin = settings.get('safety_relay', {}).get('pin')
-    safety_relay_obj = None
+    safety_relay = _init_safety_relay(model.safety_relay_pin)
+    subscribe_settings(_on_settings_changed)
     
-    if safety_relay_pin is not None:
-        try:
-            safety_relay_obj = Pin(safety_relay_pin, Pin.OUT)
-            safety_relay_obj.value(1)  # Relè spento (logica attiva bassa)
-            log_event(f"Relè di sicurezza inizializzato sul pin {safety_relay_pin}", "INFO")
-            print(f"Relè di sicurezza inizializzato sul pin {safety_relay_pin}.")
-        except Exception as e:
-            log_event(f"Errore durante l'inizializzazione del relè di sicurezza: {e}", "ERROR")
-            print(f"Errore durante l'inizializzazione del relè di sicurezza: {e}")
-            safety_relay_obj = None
+    return len(pins) > 0
 
-    zone_pins = pins
-    safety_relay = safety_relay_obj
-    
-    return initialized_zones > 0
+def _on_settings_changed(previous, current):
+    """
+    Applica le modifiche delle impostazioni alle zone: vengono reinizializzati solo i pin
+    cambiati e le zone attive con pin invariato continuano a irrigare.
+    """
+    global safety_relay
+
+    for zone_id, old_zone in previous.zones.items():
+        new_zone = current.zones.get(zone_id)
+        if new_zone is not None and new_zone.pin == old_zone.pin:
+            continue
+        # Zona rimossa o spostata su un altro pin: il vecchio relè viene spento
+        if zone_id in active_zones:
+            log_event(f"Zona {zone_id} arrestata per la modifica delle impostazioni", "WARNING")
+            stop_zone(zone_id)
+        old_pin = zone_pins.pop(zone_id, None)
+        if old_pin is not None:
+            try:
+                old_pin.value(1)
+            except Exception:
+                pass
+
+    for zone_id, new_zone in current.zones.items():
+        old_zone = previous.zones.get(zone_id)
+        if old_zone is None or old_zone.pin != new_zone.pin:
+            pin = _init_zone_pin(new_zone)
+            if pin is not None:
+                zone_pins[zone_id] = pin
+
+    if current.safety_relay_pin != previous.safety_relay_pin:
+        if safety_relay:
+            try:
+                safety_relay.value(1)
+            except Exception:
+                pass
+        # Con zone attive il nuovo relè di sicurezza deve essere acceso
+        safety_relay = _init_safety_relay(current.safety_relay_pin, bool(active_zones))
 
 def get_zones_status():
     """
@@ -81,17 +129,12 @@ def get_zones_status():
     global active_zones
     zones_status = []
     
-    settings = load_user_settings()
-    configured_zones = settings.get('zones', [])
-    
-    for zone in configured_zones:
-        zone_id = zone.get('id')
-        if zone.get('status') != 'show':
-            continue
-            
+    # L'elenco delle zone visibili è precalcolato nel modello delle impostazioni
+    for zone in get_settings_model().visible_zones:
+        zone_id = zone.id
         zone_info = {
             'id': zone_id,
-            'name': zone.get('name', f'Zona {zone_id + 1}'),
+            'name': zone.name,
             'active': zone_id in active_zones,
             'remaining_time': 0
         }
@@ -118,71 +161,63 @@ def get_active_zones_count():
     global active_zones
     return len(active_zones)
 
-def start_zone(zone_id, duration):
+def start_zone(zone_id, duration, from_program=False):
     """
     Attiva una zona di irrigazione.
     
     Args:
         zone_id: ID della zona da attivare
         duration: Durata dell'attivazione in minuti
+        from_program: True se la zona viene avviata dal programma in esecuzione
         
     Returns:
         boolean: True se l'operazione è riuscita, False altrimenti
     """
-    global active_zones, zone_pins, safety_relay, program_running
+    global active_zones, zone_pins, safety_relay
     
     # Converti in interi
     zone_id = int(zone_id)
     duration = int(duration)
     
-    # Verifica se un programma è in esecuzione automatica
-    from program_state import program_running
-    if program_running:
+    # Durante un programma le zone possono essere avviate solo dal programma stesso
+    if runtime_state.running and not from_program:
         log_event(f"Impossibile avviare la zona {zone_id}: un programma è già in esecuzione", "WARNING")
-        print(f"Impossibile avviare la zona {zone_id}: un programma è già in esecuzione.")
         return False
 
     # Controlla se la zona esiste
     if zone_id not in zone_pins:
         log_event(f"Errore: Zona {zone_id} non trovata", "ERROR")
-        print(f"Errore: Zona {zone_id} non trovata.")
         return False
     
     # Controlla che la durata sia valida
-    settings = load_user_settings()
-    max_duration = settings.get('max_zone_duration', 180)
+    model = get_settings_model()
+    max_duration = model.max_zone_duration
     if duration <= 0 or duration > max_duration:
         log_event(f"Errore: Durata non valida per la zona {zone_id}", "ERROR")
-        print(f"Errore: Durata non valida per la zona {zone_id}.")
         return False
     
     # Verifica il limite massimo di zone attive
-    max_active_zones = settings.get('max_active_zones', 1)
+    max_active_zones = model.max_active_zones
     
     if len(active_zones) >= max_active_zones and zone_id not in active_zones:
         log_event(f"Impossibile avviare la zona {zone_id}: Numero massimo di zone attive raggiunto ({max_active_zones})", "WARNING")
-        print(f"Impossibile avviare la zona {zone_id}: Numero massimo di zone attive raggiunto ({max_active_zones}).")
         return False
 
     # Accende il relè di sicurezza se non è già acceso
     if safety_relay and not active_zones:
         try:
             safety_relay.value(0)  # Attiva il relè di sicurezza (logica attiva bassa)
-            log_event("Relè di sicurezza attivato", "INFO")
-            print("Relè di sicurezza attivato.")
+            log_event("Relè di sicurezza attivato", "DEBUG")
         except Exception as e:
             log_event(f"Errore durante l'attivazione del relè di sicurezza: {e}", "ERROR")
-            print(f"Errore durante l'attivazione del relè di sicurezza: {e}")
             return False
 
     # Attiva il relè per la zona specificata
     try:
         zone_pins[zone_id].value(0)  # Attiva la zona (logica attiva bassa)
         log_event(f"Zona {zone_id} avviata per {duration} minuti", "INFO")
-        print(f"Zona {zone_id} avviata per {duration} minuti.")
     except Exception as e:
         log_event(f"Errore durante l'attivazione della zona {zone_id}: {e}", "ERROR")
-        print(f"Errore durante l'attivazione della zona {zone_id}: {e}")
         return False
 
     # Se la zona è già attiva, cancella il task precedente
@@ -217,11 +252,9 @@ async def _zone_timer(zone_id, duration):
         if zone_id in active_zones:
             stop_zone(zone_id)
     except asyncio.CancelledError:
-        log_event(f"Timer per la zona {zone_id} cancellato", "INFO")
-        print(f"Timer per la zona {zone_id} cancellato.")
+        log_event(f"Timer per la zona {zone_id} cancellato", "DEBUG")
     except Exception as e:
         log_event(f"Errore nel timer della zona {zone_id}: {e}", "ERROR")
-        print(f"Errore nel timer della zona {zone_id}: {e}")
 
 def stop_zone(zone_id):
     """
@@ -240,17 +273,14 @@ def stop_zone(zone_id):
 
     if zone_id not in zone_pins:
         log_event(f"Errore: Zona {zone_id} non trovata per l'arresto", "ERROR")
-        print(f"Errore: Zona {zone_id} non trovata per l'arresto.")
         return False
 
     # Disattiva il relè della zona
     try:
         zone_pins[zone_id].value(1)  # Disattiva la zona (logica attiva bassa)
         log_event(f"Zona {zone_id} arrestata", "INFO")
-        print(f"Zona {zone_id} arrestata.")
     except Exception as e:
         log_event(f"Errore durante l'arresto della zona {zone_id}: {e}", "ERROR")
-        print(f"Errore durante l'arresto della zona {zone_id}: {e}")
         return False
 
     # Cancella il task associato alla zona
@@ -260,18 +290,15 @@ def stop_zone(zone_id):
                 active_zones[zone_id]['task'].cancel()
         except Exception as e:
             log_event(f"Errore durante la cancellazione del task per la zona {zone_id}: {e}", "WARNING")
-            print(f"Errore durante la cancellazione del task per la zona {zone_id}: {e}")
         del active_zones[zone_id]
 
     # Spegne il relè di sicurezza se non ci sono altre zone attive
     if safety_relay and not active_zones:
         try:
             safety_relay.value(1)  # Disattiva il relè di sicurezza (logica attiva bassa)
-            log_event("Relè di sicurezza disattivato", "INFO")
-            print("Relè di sicurezza disattivato.")
+            log_event("Relè di sicurezza disattivato", "DEBUG")
         except Exception as e:
             log_event(f"Errore durante lo spegnimento del relè di sicurezza: {e}", "ERROR")
-            print(f"Errore durante lo spegnimento del relè di sicurezza: {e}")
             return False
             
     return True
@@ -294,5 +321,4 @@ def stop_all_zones():
             success = False
     
     log_event("Tutte le zone arrestate", "INFO")
-    print("Tutte le zone arrestate.")
     return success
\ No newline at end of file